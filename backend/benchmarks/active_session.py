@@ -0,0 +1,169 @@
+"""Benchmark the active-session lookup before and after migration 0003
+
+Seeds a scratch database with users and chat sessions (all but each user's
+newest session have a Summary; summarized_at is left for the migration to
+backfill), then times:
+    before - the old lookup (anti-join against summaries) without indexes
+    after  - the summarized_at IS NULL lookup once migration 0003 has run
+
+The target database is dropped and recreated - never point this at real data.
+
+Usage (from backend/):
+    python -m benchmarks.active_session --database-url postgresql://localhost/bench
+    python -m benchmarks.active_session --database-url sqlite:////tmp/bench.sqlite --sessions 200000
+"""
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import select, text
+from sqlalchemy.ext.asyncio import create_async_engine
+from database import Base, User, ChatSession, Summary, get_async_database_url
+from migrations import _0003_active_session_index
+
+NEW_INDEXES = ("ix_chat_sessions_user_updated", "ix_chat_sessions_active_user_updated", "ix_summaries_chat_session_id")
+BATCH_SIZE = 10000
+
+
+def legacy_query(user_id: int):
+    """The lookup as it was before migration 0003"""
+    return (
+        select(ChatSession.id)
+        .filter(ChatSession.user_id == user_id)
+        .outerjoin(Summary).filter(Summary.id == None)
+        .order_by(ChatSession.updated_at.desc()).limit(1)
+    )
+
+
+def indexed_query(user_id: int):
+    """The lookup served by ix_chat_sessions_active_user_updated"""
+    return (
+        select(ChatSession.id)
+        .filter(ChatSession.user_id == user_id, ChatSession.summarized_at == None)
+        .order_by(ChatSession.updated_at.desc()).limit(1)
+    )
+
+
+async def drop_new_indexes(engine):
+    """Put the schema back in its pre-0003 state"""
+    async with engine.begin() as conn:
+        await conn.execute(text("UPDATE chat_sessions SET summarized_at = NULL"))
+        for name in NEW_INDEXES:
+            await conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
+
+
+async def seed(engine, users: int, sessions: int):
+    """Create the schema and fill it"""
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+
+    start = datetime.utcnow() - timedelta(seconds=sessions)
+    async with engine.begin() as conn:
+        await conn.execute(User.__table__.insert(), [
+            {"id": i, "name": f"user{i}", "email": f"user{i}@example.com", "password_hash": "x"}
+            for i in range(1, users + 1)
+        ])
+
+    # Session i belongs to user (i % users) + 1; each user's last session stays active
+    for offset in range(0, sessions, BATCH_SIZE):
+        session_rows, summary_rows = [], []
+        for i in range(offset, min(offset + BATCH_SIZE, sessions)):
+            updated_at = start + timedelta(seconds=i)
+            active = i >= sessions - users
+            session_rows.append({
+                "id": i + 1,
+                "user_id": i % users + 1,
+                "messages": [],
+                "created_at": updated_at,
+                "updated_at": updated_at,
+            })
+            if not active:
+                summary_rows.append({
+                    "chat_session_id": i + 1,
+                    "user_id": i % users + 1,
+                    "summary_data": {"summary": "seeded"},
+                    "created_at": updated_at,
+                })
+        async with engine.begin() as conn:
+            await conn.execute(ChatSession.__table__.insert(), session_rows)
+            if summary_rows:
+                await conn.execute(Summary.__table__.insert(), summary_rows)
+        print(f"Seeded {min(offset + BATCH_SIZE, sessions)}/{sessions} sessions")
+
+    if engine.dialect.name == "postgresql":
+        async with engine.begin() as conn:
+            await conn.execute(text("ANALYZE"))
+
+
+async def explain(engine, query) -> str:
+    """Query plan for a statement"""
+    compiled = query.compile(engine, compile_kwargs={"literal_binds": True})
+    prefix = "EXPLAIN QUERY PLAN" if engine.dialect.name == "sqlite" else "EXPLAIN"
+    async with engine.connect() as conn:
+        rows = (await conn.execute(text(f"{prefix} {compiled}"))).all()
+    return "\n".join(str(row[-1]) for row in rows)
+
+
+async def time_lookups(engine, make_query, user_ids) -> dict:
+    """Latency of one lookup per user id, in milliseconds"""
+    timings = []
+    async with engine.connect() as conn:
+        for user_id in user_ids:
+            started = time.perf_counter()
+            (await conn.execute(make_query(user_id))).first()
+            timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    return {
+        "lookups": len(timings),
+        "mean_ms": round(statistics.mean(timings), 3),
+        "p50_ms": round(timings[len(timings) // 2], 3),
+        "p95_ms": round(timings[int(len(timings) * 0.95)], 3),
+        "max_ms": round(timings[-1], 3),
+        "plan": await explain(engine, make_query(user_ids[0])),
+    }
+
+
+async def main(args):
+    engine = create_async_engine(get_async_database_url(args.database_url))
+    try:
+        if not args.skip_seed:
+            await seed(engine, args.users, args.sessions)
+        await drop_new_indexes(engine)
+        user_ids = [random.randint(1, args.users) for _ in range(args.lookups)]
+
+        before = await time_lookups(engine, legacy_query, user_ids)
+
+        started = time.perf_counter()
+        async with engine.begin() as conn:
+            await _0003_active_session_index(conn)
+        migration_seconds = time.perf_counter() - started
+        if engine.dialect.name == "postgresql":
+            async with engine.begin() as conn:
+                await conn.execute(text("ANALYZE chat_sessions"))
+
+        after = await time_lookups(engine, indexed_query, user_ids)
+    finally:
+        await engine.dispose()
+
+    print(json.dumps({
+        "dialect": engine.dialect.name,
+        "users": args.users,
+        "sessions": args.sessions,
+        "migration_seconds": round(migration_seconds, 2),
+        "before": before,
+        "after": after,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", required=True, help="Scratch database (dropped and recreated)")
+    parser.add_argument("--sessions", type=int, default=1_000_000)
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--lookups", type=int, default=200)
+    parser.add_argument("--skip-seed", action="store_true", help="Reuse the data from a previous run")
+    asyncio.run(main(parser.parse_args()))
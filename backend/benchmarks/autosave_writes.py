@@ -0,0 +1,117 @@
+"""Benchmark database writes caused by /update-session autosaves, with and without write-behind
+
+Simulated users each open a session and autosave a growing transcript
+(two new messages per autosave) every --autosave-ms, through the real app
+in-process. Commits and write statements (INSERT/UPDATE/DELETE) are
+counted at the engine. Commits are the durable write operations - each one
+is a WAL flush - and are what coalescing saves; the new messages' INSERTs
+happen either way (SQLite runs them one row at a time, so they dominate
+its statement count). Each mode runs in its own process, since the
+write-behind settings are read at import time.
+
+The target database is dropped and recreated - never point this at real data.
+
+Usage (from backend/):
+    python -m benchmarks.autosave_writes --database-url sqlite:////tmp/bench.sqlite
+    python -m benchmarks.autosave_writes --database-url postgresql://localhost/bench --users 50 --duration 30
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+
+async def run_mode(args):
+    """One measurement, in this process (the environment already holds the mode's settings)"""
+    import httpx
+    from sqlalchemy import event
+    from database import Base, engine, init_db
+    from main import app
+
+    counts = {"writes": 0, "commits": 0}
+
+    @event.listens_for(engine.sync_engine, "before_cursor_execute")
+    def _count_write(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip()[:6].upper() in ("INSERT", "UPDATE", "DELETE"):
+            counts["writes"] += 1
+
+    @event.listens_for(engine.sync_engine, "commit")
+    def _count_commit(conn):
+        counts["commits"] += 1
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+    await init_db()
+
+    async def user(client, index):
+        response = await client.post("/register", json={"name": f"u{index}", "email": f"u{index}@example.com", "password": "x"})
+        user_id = response.json()["user_id"]
+        messages = [{"role": "user", "content": "hello"}, {"role": "assistant", "content": "hi there"}]
+        response = await client.post("/save-session", json={"messages": messages, "user_id": user_id, "generate_summary": False})
+        session_id = response.json()["session_id"]
+        for turn in range(int(args.duration * 1000 / args.autosave_ms)):
+            messages = messages + [
+                {"role": "user", "content": f"question {turn} " * 8},
+                {"role": "assistant", "content": f"answer {turn} " * 30},
+            ]
+            response = await client.put(f"/update-session/{session_id}", json={"messages": messages})
+            assert response.status_code == 200, response.text
+            await asyncio.sleep(args.autosave_ms / 1000)
+        # Reload - sees every autosave, whether it is buffered or not
+        response = await client.get(f"/session/{session_id}")
+        assert len(response.json()["messages"]) == len(messages)
+
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            counts["writes"] = counts["commits"] = 0  # Leave out table creation
+            await asyncio.gather(*(user(client, i) for i in range(args.users)))
+    autosaves = args.users * int(args.duration * 1000 / args.autosave_ms)
+    print(json.dumps({
+        "autosaves": autosaves,
+        "commits": counts["commits"],
+        "commits_per_user_second": round(counts["commits"] / args.users / args.duration, 2),
+        "write_statements": counts["writes"],
+    }))
+
+
+def main(args):
+    report = {"users": args.users, "duration_s": args.duration, "autosave_ms": args.autosave_ms,
+              "flush_interval_s": args.interval, "modes": {}}
+    with tempfile.TemporaryDirectory() as log_dir:
+        for name, enabled in (("direct", "false"), ("write_behind", "true")):
+            env = {
+                **os.environ,
+                "DATABASE_URL": args.database_url,
+                "OPENAI_API_KEY": os.environ.get("OPENAI_API_KEY", "unused"),
+                "WRITE_BEHIND_ENABLED": enabled,
+                "WRITE_BEHIND_INTERVAL": str(args.interval),
+                "WRITE_BEHIND_LOG_DIR": log_dir,
+                "JOB_WORKERS": "0",
+            }
+            command = [sys.executable, "-m", "benchmarks.autosave_writes", "--run-mode",
+                       "--users", str(args.users), "--duration", str(args.duration), "--autosave-ms", str(args.autosave_ms)]
+            result = subprocess.run(command, env=env, capture_output=True, text=True, check=True)
+            report["modes"][name] = json.loads(result.stdout.strip().splitlines()[-1])
+    direct, buffered = report["modes"]["direct"], report["modes"]["write_behind"]
+    report["commit_reduction"] = round(direct["commits"] / max(1, buffered["commits"]), 1)
+    report["write_statement_reduction"] = round(direct["write_statements"] / max(1, buffered["write_statements"]), 1)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", default=os.environ.get("DATABASE_URL"), help="Scratch database (dropped and recreated)")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--duration", type=float, default=10, help="Seconds each user keeps autosaving")
+    parser.add_argument("--autosave-ms", type=float, default=500, help="Pause between a user's autosaves")
+    parser.add_argument("--interval", type=float, default=5, help="WRITE_BEHIND_INTERVAL for the buffered run")
+    parser.add_argument("--run-mode", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.run_mode:
+        asyncio.run(run_mode(args))
+    else:
+        main(args)
@@ -0,0 +1,261 @@
+"""End-to-end load test of a running backend
+
+Virtual users go through the same steps as the frontend: register/login,
+load the active session, chat for a few turns with an autosave after each
+reply (/save-session the first time, /update-session after that), then log
+out, which saves the session with generate_summary=True. Each user then
+starts over with a new session until the run ends.
+
+Point the backend at the mock upstream (benchmarks/mock_llm.py) so no real
+tokens are spent. The report gives throughput and p50/p95/p99 latency per
+route as JSON; pass an earlier report to --compare to see the change.
+
+Usage (from backend/):
+    python -m benchmarks.mock_llm --port 9009 &
+    python migrations.py
+    OPENAI_BASE_URL=http://localhost:9009 OPENAI_API_KEY=test uvicorn main:app --port 8000 &
+    python -m benchmarks.loadtest --users 50 --duration 60 --output results/base.json
+    python -m benchmarks.loadtest --users 50 --duration 60 --compare results/base.json
+"""
+import argparse
+import asyncio
+import json
+import math
+import random
+import subprocess
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+import httpx
+
+USER_LINES = [
+    "How do I say I am running late for the meeting?",
+    "Can you correct this sentence: yesterday I go to office by bus",
+    "What is the difference between borrow and lend?",
+    "I am a nurse, how do I explain a prescription to a patient politely?",
+    "Teach me some phrases for a job interview",
+    "Is it correct to say 'I am having two brothers'?",
+    "How should I reply when my manager asks for an update?",
+    "Give me a short dialogue for ordering food at a restaurant",
+    "What does 'touch base' mean?",
+    "Help me write a leave application for two days",
+]
+
+
+class Recorder:
+    """Latency samples and errors per route"""
+
+    def __init__(self):
+        self.samples: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.statuses: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+
+    def add(self, route: str, elapsed: float, status: Optional[int]):
+        self.samples[route].append(elapsed * 1000)
+        self.statuses[route][str(status or "connection-error")] += 1
+        if status is None or status >= 400:
+            self.errors[route] += 1
+
+    def report(self, duration: float) -> Dict:
+        routes = {}
+        for route in sorted(self.samples):
+            ordered = sorted(self.samples[route])
+            routes[route] = {
+                "count": len(ordered),
+                "errors": self.errors[route],
+                "throughput_rps": round(len(ordered) / duration, 2),
+                "mean_ms": round(sum(ordered) / len(ordered), 1),
+                "p50_ms": percentile(ordered, 50),
+                "p95_ms": percentile(ordered, 95),
+                "p99_ms": percentile(ordered, 99),
+                "max_ms": round(ordered[-1], 1),
+                "status": dict(self.statuses[route]),
+            }
+        return routes
+
+
+def percentile(ordered: List[float], p: float) -> float:
+    """Nearest-rank percentile of sorted samples"""
+    rank = max(1, math.ceil(p / 100 * len(ordered)))
+    return round(ordered[rank - 1], 1)
+
+
+async def timed(client: httpx.AsyncClient, recorder: Recorder, route: str, method: str, url: str, **kwargs):
+    started = time.perf_counter()
+    try:
+        response = await client.request(method, url, **kwargs)
+    except httpx.HTTPError:
+        recorder.add(route, time.perf_counter() - started, None)
+        return None
+    recorder.add(route, time.perf_counter() - started, response.status_code)
+    return response
+
+
+async def timed_stream(client: httpx.AsyncClient, recorder: Recorder, body: Dict) -> Optional[str]:
+    """POST /chat/stream, recording time to first token and to the end of the reply"""
+    started = time.perf_counter()
+    first_token = None
+    reply = None
+    status = None
+    try:
+        async with client.stream("POST", "/chat/stream", json=body) as response:
+            status = response.status_code
+            event = None
+            async for line in response.aiter_lines():
+                if line.startswith("event:"):
+                    event = line[len("event:"):].strip()
+                elif line.startswith("data:"):
+                    data = json.loads(line[len("data:"):])
+                    if event == "done":
+                        reply = data.get("response")
+                    elif event == "error":
+                        status = 502
+                    elif first_token is None:
+                        first_token = time.perf_counter() - started
+                    event = None
+    except httpx.HTTPError:
+        status = None
+    if first_token is not None:
+        recorder.add("/chat/stream (first token)", first_token, status)
+    if reply is None and status is not None and status < 400:
+        status = 502  # Stream ended without a reply
+    recorder.add("/chat/stream", time.perf_counter() - started, status)
+    return reply
+
+
+async def virtual_user(client: httpx.AsyncClient, recorder: Recorder, args, index: int, run_id: str, deadline: float, counters: Dict):
+    rng = random.Random(f"{run_id}-{index}")
+    credentials = {"email": f"load-{run_id}-{index}@example.com", "password": "loadtest"}
+    await timed(client, recorder, "/register", "POST", "/register", json={"name": f"Load {index}", **credentials})
+    min_turns, max_turns = (int(n) for n in args.turns.split("-"))
+
+    while time.monotonic() < deadline:
+        response = await timed(client, recorder, "/login", "POST", "/login", json=credentials)
+        if response is None or response.status_code != 200:
+            await asyncio.sleep(1)
+            continue
+        user_id = response.json()["user_id"]
+
+        response = await timed(client, recorder, "/active-session", "GET", f"/active-session/{user_id}")
+        active = response.json() if response is not None and response.status_code == 200 else {}
+        session_id = active.get("session_id")
+        messages = active.get("messages") or []
+
+        for _ in range(rng.randint(min_turns, max_turns)):
+            if time.monotonic() >= deadline:
+                break
+            user_message = {"role": "user", "content": rng.choice(USER_LINES)}
+            if args.server_context and session_id:
+                body = {"message": user_message, "session_id": session_id, "user_id": user_id}
+            else:
+                body = {"messages": messages + [user_message], "user_id": user_id}
+
+            if args.stream:
+                reply = await timed_stream(client, recorder, body)
+            else:
+                response = await timed(client, recorder, "/chat", "POST", "/chat", json=body)
+                reply = response.json().get("response") if response is not None and response.status_code == 200 else None
+            if reply is None:
+                continue
+            messages = messages + [user_message, {"role": "assistant", "content": reply}]
+
+            if args.server_context and session_id:
+                pass  # The server stored both turns itself
+            elif session_id:
+                await timed(client, recorder, "/update-session", "PUT", f"/update-session/{session_id}", json={"messages": messages})
+            else:
+                response = await timed(client, recorder, "/save-session", "POST", "/save-session",
+                                       json={"messages": messages, "user_id": user_id, "generate_summary": False})
+                if response is not None and response.status_code == 200:
+                    session_id = response.json().get("session_id")
+            if args.think_ms:
+                await asyncio.sleep(rng.uniform(0.5, 1.5) * args.think_ms / 1000)
+
+        if messages:
+            # Logout - the session is closed and summarized
+            await timed(client, recorder, "/save-session (logout)", "POST", "/save-session",
+                        json={"messages": messages, "user_id": user_id, "generate_summary": True})
+            counters["sessions"] += 1
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(report: Dict, baseline: Dict) -> Dict:
+    """Relative change of throughput and latency percentiles per route (positive = higher)"""
+    changes = {}
+    for route, current in report["routes"].items():
+        previous = baseline.get("routes", {}).get(route)
+        if not previous:
+            continue
+        changes[route] = {
+            metric: round((current[metric] - previous[metric]) / previous[metric] * 100, 1) if previous[metric] else None
+            for metric in ("throughput_rps", "p50_ms", "p95_ms", "p99_ms")
+        }
+    return {"baseline_commit": baseline.get("commit"), "change_pct": changes}
+
+
+async def main(args):
+    run_id = uuid.uuid4().hex[:8]
+    recorder = Recorder()
+    counters = {"sessions": 0}
+    limits = httpx.Limits(max_connections=args.users * 2, max_keepalive_connections=args.users * 2)
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=args.timeout, limits=limits) as client:
+        started = time.monotonic()
+        deadline = started + args.duration
+        await asyncio.gather(*(
+            virtual_user(client, recorder, args, i, run_id, deadline, counters) for i in range(args.users)
+        ))
+        duration = time.monotonic() - started
+
+    routes = recorder.report(duration)
+    total = sum(route["count"] for route in routes.values())
+    report = {
+        "commit": git_commit(),
+        "started_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "config": {
+            "base_url": args.base_url,
+            "users": args.users,
+            "duration_s": args.duration,
+            "turns": args.turns,
+            "stream": args.stream,
+            "server_context": args.server_context,
+            "think_ms": args.think_ms,
+        },
+        "duration_s": round(duration, 1),
+        "requests": total,
+        "errors": sum(route["errors"] for route in routes.values()),
+        "throughput_rps": round(total / duration, 2),
+        "sessions_completed": counters["sessions"],
+        "routes": routes,
+    }
+    if args.compare:
+        with open(args.compare) as f:
+            report["comparison"] = compare(report, json.load(f))
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    print(output)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--users", type=int, default=20, help="Concurrent virtual users")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds to run")
+    parser.add_argument("--turns", default="3-8", help="Range of chat turns per session, e.g. 3-8")
+    parser.add_argument("--think-ms", type=float, default=0, help="Mean pause between turns")
+    parser.add_argument("--stream", action="store_true", help="Chat through /chat/stream")
+    parser.add_argument("--server-context", action="store_true", help="Send only the newest message once a session exists")
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--output", help="Also write the JSON report here")
+    parser.add_argument("--compare", help="Earlier JSON report to compare against")
+    asyncio.run(main(parser.parse_args()))
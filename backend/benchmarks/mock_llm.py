@@ -0,0 +1,184 @@
+"""OpenAI-compatible mock upstream for load tests - no real tokens spent
+
+Serves POST /chat/completions (OpenAI style) and
+POST /openai/deployments/{deployment}/chat/completions (Azure style), with
+and without stream=True. Response latency follows a log-normal
+distribution, and a share of requests can be made to fail with 500 or 429
+(with Retry-After) to exercise retries and failover.
+
+Prompts asking for a summary or extraction get a JSON answer, so the
+summary jobs and live extraction have something to parse.
+
+Usage (from backend/):
+    python -m benchmarks.mock_llm --port 9009 --latency-ms 400 --token-ms 15
+    OPENAI_BASE_URL=http://localhost:9009 OPENAI_API_KEY=test uvicorn main:app
+
+or as one of several pool endpoints:
+    UPSTREAM_ENDPOINTS='[{"name": "mock-a", "url": "http://localhost:9009", "api_key": "test"},
+                         {"name": "mock-b", "url": "http://localhost:9010", "api_key": "test"}]'
+"""
+import argparse
+import asyncio
+import json
+import math
+import random
+import time
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+app = FastAPI(title="Mock LLM")
+
+settings = argparse.Namespace(
+    latency_ms=300.0,
+    latency_sigma=0.5,
+    token_ms=10.0,
+    completion_tokens=60,
+    error_rate=0.0,
+    rate_limit_rate=0.0,
+    retry_after=1.0,
+    seed=None,
+)
+rng = random.Random()
+stats = {"requests": 0, "streamed": 0, "errors": 0, "rate_limited": 0}
+
+WORDS = (
+    "great question let us practise this phrase together you can say it like this "
+    "try again with the past tense that sounds natural well done keep going"
+).split()
+
+EXTRACTION_REPLY = json.dumps({
+    "summary": "The user practised English phrases for work.",
+    "<PersonalInfo>": "lives in Pune, likes cricket",
+    "<Profession>": "software engineer",
+})
+
+
+def sample_latency() -> float:
+    """Seconds until the first token - log-normal around latency_ms"""
+    if settings.latency_ms <= 0:
+        return 0.0
+    return rng.lognormvariate(math.log(settings.latency_ms / 1000), settings.latency_sigma)
+
+
+def completion_text(messages) -> str:
+    prompt = (messages[-1].get("content") or "")[:300].lower() if messages else ""
+    if "json" in prompt and ("extract" in prompt or "summary" in prompt):
+        return EXTRACTION_REPLY
+    if "summary" in prompt:
+        return "The user is practising everyday English and asked about work phrases."
+    return " ".join(rng.choice(WORDS) for _ in range(settings.completion_tokens))
+
+
+def usage(messages, text: str) -> dict:
+    prompt_tokens = sum(len(msg.get("content") or "") for msg in messages) // 4 + 4 * len(messages)
+    completion_tokens = max(1, len(text) // 4)
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+    }
+
+
+def injected_failure():
+    """Error response for this request, if one is due"""
+    roll = rng.random()
+    if roll < settings.rate_limit_rate:
+        stats["rate_limited"] += 1
+        return JSONResponse(
+            {"error": {"code": "429", "message": "Mock rate limit"}},
+            status_code=429,
+            headers={"Retry-After": str(settings.retry_after)},
+        )
+    if roll < settings.rate_limit_rate + settings.error_rate:
+        stats["errors"] += 1
+        return JSONResponse({"error": {"code": "500", "message": "Mock server error"}}, status_code=500)
+    return None
+
+
+def chunk(model: str, delta: dict, finish_reason=None) -> str:
+    return "data: " + json.dumps({
+        "id": "mock",
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+    }) + "\n\n"
+
+
+async def complete(body: dict):
+    stats["requests"] += 1
+    failure = injected_failure()
+    if failure is not None:
+        return failure
+
+    messages = body.get("messages") or []
+    model = body.get("model") or "mock"
+    text = completion_text(messages)
+    await asyncio.sleep(sample_latency())
+
+    if not body.get("stream"):
+        # The whole completion is generated before a non-streamed reply goes out
+        await asyncio.sleep(settings.token_ms / 1000 * len(text.split()))
+        return {
+            "id": "mock",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+            "usage": usage(messages, text),
+        }
+
+    stats["streamed"] += 1
+    include_usage = (body.get("stream_options") or {}).get("include_usage")
+
+    async def events():
+        yield chunk(model, {"role": "assistant", "content": ""})
+        words = text.split(" ")
+        for i, word in enumerate(words):
+            yield chunk(model, {"content": word if i == 0 else " " + word})
+            await asyncio.sleep(settings.token_ms / 1000)
+        yield chunk(model, {}, "stop")
+        if include_usage:
+            yield "data: " + json.dumps({"id": "mock", "choices": [], "usage": usage(messages, text)}) + "\n\n"
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+@app.post("/chat/completions")
+@app.post("/v1/chat/completions")
+async def openai_completions(request: Request):
+    return await complete(await request.json())
+
+
+@app.post("/openai/deployments/{deployment}/chat/completions")
+async def azure_completions(deployment: str, request: Request):
+    body = await request.json()
+    body.setdefault("model", deployment)
+    return await complete(body)
+
+
+@app.get("/mock/stats")
+async def mock_stats():
+    return stats
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9009)
+    parser.add_argument("--latency-ms", type=float, default=settings.latency_ms, help="Median time to first token")
+    parser.add_argument("--latency-sigma", type=float, default=settings.latency_sigma, help="Log-normal spread of the latency (0 = fixed)")
+    parser.add_argument("--token-ms", type=float, default=settings.token_ms, help="Delay between streamed tokens")
+    parser.add_argument("--completion-tokens", type=int, default=settings.completion_tokens, help="Words per chat reply")
+    parser.add_argument("--error-rate", type=float, default=settings.error_rate, help="Share of requests answered with 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=settings.rate_limit_rate, help="Share of requests answered with 429")
+    parser.add_argument("--retry-after", type=float, default=settings.retry_after, help="Retry-After seconds sent with 429")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+    for name in vars(settings):
+        setattr(settings, name, getattr(args, name))
+    rng.seed(args.seed)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
@@ -0,0 +1,112 @@
+"""Benchmark session reads: ORM objects + JSONResponse vs the raw JSON fast path
+
+For one large session per storage format (chat_messages rows, legacy JSON
+column, each compaction codec) this times building the /session/{id}
+response body both ways and traces the peak memory allocated while doing so:
+
+- orm: load_transcript -> dict -> jsonable_encoder -> JSONResponse, the
+  path the route took before
+- raw: load_transcript_json -> TranscriptResponse, the transcript JSON
+  produced by the database (or the stored blob) and embedded verbatim
+
+The target database is dropped and recreated - never point this at real data.
+
+Usage (from backend/):
+    python -m benchmarks.session_read --database-url postgresql://localhost/bench
+    python -m benchmarks.session_read --database-url sqlite:////tmp/bench.sqlite --messages 5000
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+import tracemalloc
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from database import Base, User, ChatSession, TRANSCRIPT_CODECS, get_async_database_url
+from transcripts import load_transcript, load_transcript_json, append_messages, compact_transcript
+from routes.sessions import TranscriptResponse
+from benchmarks.transcript_storage import make_transcript
+
+
+async def orm_body(db: AsyncSession, chat_session: ChatSession) -> bytes:
+    payload = {"id": chat_session.id, "messages": await load_transcript(db, chat_session)}
+    return JSONResponse(jsonable_encoder(payload)).body
+
+
+async def raw_body(db: AsyncSession, chat_session: ChatSession) -> bytes:
+    return TranscriptResponse({"id": chat_session.id}, await load_transcript_json(db, chat_session)).body
+
+
+async def measure(sessionmaker, session_id: int, build, repeat: int):
+    """Per-call timings (ms), and the peak memory allocated during one traced call"""
+    timings = []
+    for _ in range(repeat):
+        async with sessionmaker() as db:
+            chat_session = await db.get(ChatSession, session_id)
+            started = time.perf_counter()
+            body = await build(db, chat_session)
+            timings.append((time.perf_counter() - started) * 1000)
+
+    async with sessionmaker() as db:
+        chat_session = await db.get(ChatSession, session_id)
+        tracemalloc.start()
+        await build(db, chat_session)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return body, {
+        "p50_ms": round(statistics.median(timings), 3),
+        "mean_ms": round(statistics.mean(timings), 3),
+        "peak_alloc_kb": round(peak / 1024, 1),
+    }
+
+
+async def main(args):
+    engine = create_async_engine(get_async_database_url(args.database_url))
+    sessionmaker = async_sessionmaker(bind=engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+    messages = make_transcript(args.messages)
+    formats = ["rows", "legacy"] + sorted(TRANSCRIPT_CODECS)
+    report = {"dialect": engine.dialect.name, "messages": args.messages, "formats": {}}
+    try:
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.drop_all)
+            await conn.run_sync(Base.metadata.create_all)
+
+        session_ids = {}
+        async with sessionmaker() as db:
+            db.add(User(id=1, name="bench", email="bench@example.com", password_hash="x"))
+            for name in formats:
+                chat_session = ChatSession(user_id=1, messages=messages if name == "legacy" else [])
+                db.add(chat_session)
+                await db.flush()
+                if name != "legacy":
+                    await append_messages(db, chat_session, messages)
+                    await db.flush()
+                if name in TRANSCRIPT_CODECS:
+                    await compact_transcript(db, chat_session, TRANSCRIPT_CODECS[name])
+                session_ids[name] = chat_session.id
+            await db.commit()
+
+        for name in formats:
+            orm, orm_stats = await measure(sessionmaker, session_ids[name], orm_body, args.repeat)
+            raw, raw_stats = await measure(sessionmaker, session_ids[name], raw_body, args.repeat)
+            assert json.loads(orm) == json.loads(raw), f"{name}: fast path returned a different transcript"
+            report["formats"][name] = {
+                "body_bytes": len(raw),
+                "orm": orm_stats,
+                "raw": raw_stats,
+                "speedup": round(orm_stats["p50_ms"] / raw_stats["p50_ms"], 2) if raw_stats["p50_ms"] else None,
+            }
+    finally:
+        await engine.dispose()
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", required=True, help="Scratch database (dropped and recreated)")
+    parser.add_argument("--messages", type=int, default=2000, help="Messages in each benchmark session")
+    parser.add_argument("--repeat", type=int, default=30)
+    asyncio.run(main(parser.parse_args()))
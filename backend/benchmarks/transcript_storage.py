@@ -0,0 +1,108 @@
+"""Benchmark transcript storage: chat_messages rows vs compacted blobs per codec
+
+Seeds a scratch database with one large session per storage format and
+reports the stored size and load_transcript time of each.
+
+The target database is dropped and recreated - never point this at real data.
+
+Usage (from backend/):
+    python -m benchmarks.transcript_storage --database-url postgresql://localhost/bench
+    python -m benchmarks.transcript_storage --database-url sqlite:////tmp/bench.sqlite --messages 5000
+"""
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import time
+from sqlalchemy import select, func, text
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from database import Base, User, ChatSession, ChatMessage, TRANSCRIPT_CODECS, get_async_database_url
+from transcripts import load_transcript, append_messages, compact_transcript
+
+WORDS = (
+    "the a to and of I you is that it for in my me what how can do your this with be have are not "
+    "kya hai mera tum aap kaise nahi haan accha theek doctor engineer teacher kaam ghar time problem "
+    "explain please thanks project code data report meeting patient school exam salary plan help"
+).split()
+
+
+def make_transcript(count: int, seed: int = 7):
+    """A synthetic chat of `count` messages with realistic-ish lengths"""
+    rng = random.Random(seed)
+    messages = []
+    for i in range(count):
+        role = "user" if i % 2 == 0 else "assistant"
+        length = rng.randint(5, 40) if role == "user" else rng.randint(40, 200)
+        messages.append({"role": role, "content": " ".join(rng.choice(WORDS) for _ in range(length))})
+    return messages
+
+
+async def stored_size(db: AsyncSession, chat_session: ChatSession) -> int:
+    """Bytes this session's transcript occupies (column sizes as stored on Postgres, payload bytes elsewhere)"""
+    postgres = db.bind.dialect.name == "postgresql"
+    if chat_session.transcript_codec:
+        size = func.pg_column_size(ChatSession.transcript) if postgres else func.length(ChatSession.transcript)
+        result = await db.execute(select(size).filter(ChatSession.id == chat_session.id))
+    else:
+        if postgres:
+            size = func.sum(func.pg_column_size(text("chat_messages.*")))
+        else:
+            size = func.sum(func.length(ChatMessage.role) + func.length(ChatMessage.content))
+        result = await db.execute(select(size).select_from(ChatMessage).filter(ChatMessage.chat_session_id == chat_session.id))
+    return int(result.scalar_one() or 0)
+
+
+async def main(args):
+    engine = create_async_engine(get_async_database_url(args.database_url))
+    sessionmaker = async_sessionmaker(bind=engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+    messages = make_transcript(args.messages)
+    formats = ["rows"] + sorted(TRANSCRIPT_CODECS)
+    report = {"dialect": engine.dialect.name, "messages": args.messages, "formats": {}}
+    try:
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.drop_all)
+            await conn.run_sync(Base.metadata.create_all)
+
+        session_ids = {}
+        async with sessionmaker() as db:
+            db.add(User(id=1, name="bench", email="bench@example.com", password_hash="x"))
+            for name in formats:
+                chat_session = ChatSession(user_id=1, messages=[])
+                db.add(chat_session)
+                await db.flush()
+                await append_messages(db, chat_session, messages)
+                await db.flush()
+                if name != "rows":
+                    await compact_transcript(db, chat_session, TRANSCRIPT_CODECS[name])
+                session_ids[name] = chat_session.id
+            await db.commit()
+
+        for name in formats:
+            timings = []
+            for _ in range(args.repeat):
+                started = time.perf_counter()
+                async with sessionmaker() as db:
+                    chat_session = await db.get(ChatSession, session_ids[name])
+                    loaded = await load_transcript(db, chat_session)
+                timings.append((time.perf_counter() - started) * 1000)
+            assert loaded == messages, f"{name} did not round-trip"
+            async with sessionmaker() as db:
+                size = await stored_size(db, await db.get(ChatSession, session_ids[name]))
+            report["formats"][name] = {
+                "stored_bytes": size,
+                "fetch_p50_ms": round(statistics.median(timings), 3),
+                "fetch_mean_ms": round(statistics.mean(timings), 3),
+            }
+    finally:
+        await engine.dispose()
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", required=True, help="Scratch database (dropped and recreated)")
+    parser.add_argument("--messages", type=int, default=2000, help="Messages in the benchmark session")
+    parser.add_argument("--repeat", type=int, default=50)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,199 @@
+"""Opt-in cache of deterministic (temperature 0) chat completions
+
+Two tiers: an in-process LRU bounded by size in bytes, and an optional
+SQLite file under COMPLETION_CACHE_DIR that survives restarts and is
+shared by worker processes on the same host. Disk entries expire after
+COMPLETION_CACHE_DISK_TTL, and the oldest are pruned beyond
+COMPLETION_CACHE_DISK_MAX_ENTRIES (at startup and every PRUNE_EVERY stores).
+"""
+import asyncio
+import contextlib
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+from config import (
+    COMPLETION_CACHE_ENABLED,
+    COMPLETION_CACHE_MAX_BYTES,
+    COMPLETION_CACHE_DIR,
+    COMPLETION_CACHE_DISK_TTL,
+    COMPLETION_CACHE_DISK_MAX_ENTRIES,
+)
+
+PRUNE_EVERY = 500
+
+# key -> completion text, least recently used first
+_memory: "OrderedDict[str, str]" = OrderedDict()
+_memory_bytes = 0
+
+_stats = {
+    "memory_hits": 0,
+    "disk_hits": 0,
+    "misses": 0,
+    "stores": 0,
+    "evictions": 0,
+    "disk_pruned": 0,
+}
+_stores_since_prune = 0
+
+_DISK_PATH = os.path.join(COMPLETION_CACHE_DIR, "completions.sqlite3") if COMPLETION_CACHE_DIR else None
+
+
+def is_cacheable(temperature: Optional[float]) -> bool:
+    """Only deterministic completions are cached, and only when the cache is enabled"""
+    return COMPLETION_CACHE_ENABLED and temperature == 0
+
+
+def completion_cache_key(model: str, messages: List[Dict], max_tokens: int, api_url: str) -> str:
+    """Hash of everything that determines a temperature-0 completion (messages include the system prompt)"""
+    payload = json.dumps(
+        {"model": model, "messages": messages, "max_tokens": max_tokens, "api_url": api_url},
+        sort_keys=True,
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _entry_size(key: str, value: str) -> int:
+    return len(key) + len(value.encode("utf-8"))
+
+
+def _remember(key: str, value: str):
+    """Insert into the memory tier, evicting least recently used entries over the byte limit"""
+    global _memory_bytes
+    if key in _memory:
+        _memory_bytes -= _entry_size(key, _memory.pop(key))
+    if _entry_size(key, value) > COMPLETION_CACHE_MAX_BYTES:
+        # Would flush the whole tier; leave it to the disk tier
+        return
+    _memory[key] = value
+    _memory_bytes += _entry_size(key, value)
+    while _memory_bytes > COMPLETION_CACHE_MAX_BYTES and _memory:
+        old_key, old_value = _memory.popitem(last=False)
+        _memory_bytes -= _entry_size(old_key, old_value)
+        _stats["evictions"] += 1
+
+
+def _disk_connect() -> sqlite3.Connection:
+    # Short-lived - the lookups run in to_thread workers, and sqlite3 connections are tied to one thread
+    return sqlite3.connect(_DISK_PATH, timeout=5)
+
+
+def _disk_init():
+    os.makedirs(COMPLETION_CACHE_DIR, exist_ok=True)
+    with contextlib.closing(_disk_connect()) as conn, conn:
+        conn.execute("PRAGMA journal_mode=WAL")  # Readers in other workers don't block on a write
+        conn.execute("CREATE TABLE IF NOT EXISTS completions (key TEXT PRIMARY KEY, response TEXT NOT NULL, created_at REAL NOT NULL)")
+        conn.execute("CREATE INDEX IF NOT EXISTS ix_completions_created_at ON completions (created_at)")
+
+
+def _disk_prune() -> int:
+    """Delete expired entries, then the oldest ones over the entry limit. Returns how many were deleted"""
+    with contextlib.closing(_disk_connect()) as conn, conn:
+        deleted = conn.execute(
+            "DELETE FROM completions WHERE created_at < ?", (time.time() - COMPLETION_CACHE_DISK_TTL,)
+        ).rowcount
+        excess = conn.execute("SELECT COUNT(*) FROM completions").fetchone()[0] - COMPLETION_CACHE_DISK_MAX_ENTRIES
+        if excess > 0:
+            deleted += conn.execute(
+                "DELETE FROM completions WHERE key IN (SELECT key FROM completions ORDER BY created_at LIMIT ?)",
+                (excess,),
+            ).rowcount
+    return deleted
+
+
+def _disk_get(key: str) -> Optional[str]:
+    with contextlib.closing(_disk_connect()) as conn:
+        row = conn.execute(
+            "SELECT response FROM completions WHERE key = ? AND created_at >= ?",
+            (key, time.time() - COMPLETION_CACHE_DISK_TTL),
+        ).fetchone()
+    return row[0] if row else None
+
+
+def _disk_put(key: str, value: str):
+    with contextlib.closing(_disk_connect()) as conn, conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO completions (key, response, created_at) VALUES (?, ?, ?)",
+            (key, value, time.time()),
+        )
+
+
+async def _prune_disk():
+    try:
+        _stats["disk_pruned"] += await asyncio.to_thread(_disk_prune)
+    except sqlite3.Error as e:
+        print(f"Completion cache disk prune failed: {e}")
+
+
+async def init_completion_cache():
+    """Create the on-disk tier's table and prune it (called on app startup)"""
+    global _DISK_PATH
+    if not (COMPLETION_CACHE_ENABLED and _DISK_PATH):
+        return
+    try:
+        await asyncio.to_thread(_disk_init)
+    except (OSError, sqlite3.Error) as e:
+        print(f"⚠️ Completion cache disk tier disabled: {e}")
+        _DISK_PATH = None
+        return
+    await _prune_disk()
+
+
+async def get_cached_completion(key: str) -> Optional[str]:
+    """Look a completion up in memory, then on disk"""
+    value = _memory.get(key)
+    if value is not None:
+        _memory.move_to_end(key)
+        _stats["memory_hits"] += 1
+        return value
+
+    if _DISK_PATH:
+        try:
+            value = await asyncio.to_thread(_disk_get, key)
+        except sqlite3.Error as e:
+            print(f"Completion cache disk read failed: {e}")
+            value = None
+        if value is not None:
+            _remember(key, value)
+            _stats["disk_hits"] += 1
+            return value
+
+    _stats["misses"] += 1
+    return None
+
+
+async def store_completion(key: str, value: str):
+    """Store a completion in both tiers"""
+    global _stores_since_prune
+    _remember(key, value)
+    _stats["stores"] += 1
+    if _DISK_PATH:
+        try:
+            await asyncio.to_thread(_disk_put, key, value)
+        except sqlite3.Error as e:
+            print(f"Completion cache disk write failed: {e}")
+        _stores_since_prune += 1
+        if _stores_since_prune >= PRUNE_EVERY:
+            _stores_since_prune = 0
+            await _prune_disk()
+
+
+def get_completion_cache_stats() -> Dict:
+    """Hit-rate metrics for the completion cache"""
+    hits = _stats["memory_hits"] + _stats["disk_hits"]
+    lookups = hits + _stats["misses"]
+    return {
+        "enabled": COMPLETION_CACHE_ENABLED,
+        **_stats,
+        "hit_rate": round(hits / lookups, 4) if lookups else None,
+        "memory_entries": len(_memory),
+        "memory_bytes": _memory_bytes,
+        "memory_max_bytes": COMPLETION_CACHE_MAX_BYTES,
+        "disk_path": _DISK_PATH,
+        "disk_ttl_seconds": COMPLETION_CACHE_DISK_TTL,
+        "disk_max_entries": COMPLETION_CACHE_DISK_MAX_ENTRIES,
+    }
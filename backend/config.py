@@ -17,3 +17,103 @@ OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL", "https://voiceclub-openai.openai.
 
 # CORS Configuration
 CORS_ORIGINS = os.getenv("CORS_ORIGINS", "*").split(",")
+
+# Upstream HTTP client (shared connection pool for LLM calls)
+UPSTREAM_MAX_CONNECTIONS = int(os.getenv("UPSTREAM_MAX_CONNECTIONS", "100"))
+UPSTREAM_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("UPSTREAM_MAX_KEEPALIVE_CONNECTIONS", "20"))
+UPSTREAM_KEEPALIVE_EXPIRY = float(os.getenv("UPSTREAM_KEEPALIVE_EXPIRY", "60"))
+UPSTREAM_HTTP2 = os.getenv("UPSTREAM_HTTP2", "false").lower() in ("1", "true", "yes")
+UPSTREAM_CONNECT_TIMEOUT = float(os.getenv("UPSTREAM_CONNECT_TIMEOUT", "5"))
+UPSTREAM_READ_TIMEOUT = float(os.getenv("UPSTREAM_READ_TIMEOUT", "60"))
+UPSTREAM_WRITE_TIMEOUT = float(os.getenv("UPSTREAM_WRITE_TIMEOUT", "10"))
+UPSTREAM_POOL_TIMEOUT = float(os.getenv("UPSTREAM_POOL_TIMEOUT", "10"))
+
+# Background jobs (logout summarization)
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "5"))
+JOB_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", "300"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_RETRY_DELAY = int(os.getenv("JOB_RETRY_DELAY", "30"))
+
+# Live profession extraction in /chat
+LIVE_EXTRACTION_MIN_NEW_USER_MESSAGES = int(os.getenv("LIVE_EXTRACTION_MIN_NEW_USER_MESSAGES", "2"))
+LIVE_EXTRACTION_CACHE_SIZE = int(os.getenv("LIVE_EXTRACTION_CACHE_SIZE", "10000"))
+
+# Conversation context budget (tokens of chat history sent upstream per turn)
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
+CONTEXT_SUMMARY_MAX_TOKENS = int(os.getenv("CONTEXT_SUMMARY_MAX_TOKENS", "300"))
+
+# System prompt render cache (entries per (profession, personal_info))
+PROMPT_CACHE_SIZE = int(os.getenv("PROMPT_CACHE_SIZE", "1024"))
+
+# User profile (PersonalInfo) cache
+PROFILE_CACHE_SIZE = int(os.getenv("PROFILE_CACHE_SIZE", "10000"))
+PROFILE_CACHE_TTL = float(os.getenv("PROFILE_CACHE_TTL", "300"))
+
+# Completion cache for temperature-0 chat (opt-in; set COMPLETION_CACHE_DIR for the on-disk tier)
+COMPLETION_CACHE_ENABLED = os.getenv("COMPLETION_CACHE_ENABLED", "false").lower() in ("1", "true", "yes")
+COMPLETION_CACHE_MAX_BYTES = int(os.getenv("COMPLETION_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+COMPLETION_CACHE_DIR = os.getenv("COMPLETION_CACHE_DIR", "")
+COMPLETION_CACHE_DISK_TTL = float(os.getenv("COMPLETION_CACHE_DISK_TTL", str(7 * 24 * 3600)))  # Seconds an on-disk entry is kept
+COMPLETION_CACHE_DISK_MAX_ENTRIES = int(os.getenv("COMPLETION_CACHE_DISK_MAX_ENTRIES", "100000"))
+
+# /sessions listing pagination
+SESSIONS_PAGE_SIZE = int(os.getenv("SESSIONS_PAGE_SIZE", "20"))
+SESSIONS_MAX_PAGE_SIZE = int(os.getenv("SESSIONS_MAX_PAGE_SIZE", "100"))
+
+# Compaction of closed sessions' transcripts: none | json | zlib-json | zstd-msgpack
+TRANSCRIPT_CODEC = os.getenv("TRANSCRIPT_CODEC", "none")
+TRANSCRIPT_ZSTD_LEVEL = int(os.getenv("TRANSCRIPT_ZSTD_LEVEL", "3"))
+
+# Upstream rate-limit scheduler, per endpoint (0 = no client-side limit; set to the deployment's quota).
+# Enforced per process: each worker gets quota / SERVE_WORKER_COUNT (see below), so keep that
+# variable right when running several workers outside serve.py
+UPSTREAM_RPM = int(os.getenv("UPSTREAM_RPM", "0"))
+UPSTREAM_TPM = int(os.getenv("UPSTREAM_TPM", "0"))
+UPSTREAM_MAX_RETRIES = int(os.getenv("UPSTREAM_MAX_RETRIES", "3"))
+UPSTREAM_BACKOFF_BASE = float(os.getenv("UPSTREAM_BACKOFF_BASE", "0.5"))
+UPSTREAM_BACKOFF_MAX = float(os.getenv("UPSTREAM_BACKOFF_MAX", "20"))
+UPSTREAM_BACKGROUND_RESERVE = float(os.getenv("UPSTREAM_BACKGROUND_RESERVE", "0.2"))  # Share of each bucket background work leaves for chat
+
+# Upstream endpoint pool - JSON list of {"name", "url", "api_key", "weight", "type", "model", "rpm", "tpm"}
+# (see providers.py); empty = the single OPENAI_BASE_URL / OPENAI_API_KEY endpoint
+UPSTREAM_ENDPOINTS = os.getenv("UPSTREAM_ENDPOINTS", "")
+UPSTREAM_FAILURE_THRESHOLD = int(os.getenv("UPSTREAM_FAILURE_THRESHOLD", "3"))  # Consecutive failures before an endpoint cools down
+UPSTREAM_FAILURE_COOLDOWN = float(os.getenv("UPSTREAM_FAILURE_COOLDOWN", "30"))
+
+# Prometheus-style metrics at /metrics (request, upstream and DB latency, token usage)
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+# Ask for a final usage chunk on streamed completions (Azure needs api-version 2024-09-01-preview or later)
+UPSTREAM_STREAM_USAGE = os.getenv("UPSTREAM_STREAM_USAGE", "true").lower() in ("1", "true", "yes")
+
+# Write-behind buffer for /update-session autosaves (opt-in; see write_behind.py)
+WRITE_BEHIND_ENABLED = os.getenv("WRITE_BEHIND_ENABLED", "false").lower() in ("1", "true", "yes")
+WRITE_BEHIND_INTERVAL = float(os.getenv("WRITE_BEHIND_INTERVAL", "5"))  # Seconds a buffered transcript may wait
+WRITE_BEHIND_MAX_BYTES = int(os.getenv("WRITE_BEHIND_MAX_BYTES", str(256 * 1024)))  # Buffered per session before an early flush
+WRITE_BEHIND_LOG_DIR = os.getenv("WRITE_BEHIND_LOG_DIR", "")  # Append-only log for crash recovery; empty = no log
+WRITE_BEHIND_FSYNC = os.getenv("WRITE_BEHIND_FSYNC", "true").lower() in ("1", "true", "yes")
+
+# Production serving (serve.py) - PORT and WEB_CONCURRENCY are the conventional platform variables
+SERVE_HOST = os.getenv("SERVE_HOST", "0.0.0.0")
+SERVE_PORT = int(os.getenv("PORT", "8000"))
+SERVE_WORKERS = int(os.getenv("WEB_CONCURRENCY", str(os.cpu_count() or 1)))
+SERVE_GRACEFUL_TIMEOUT = int(os.getenv("SERVE_GRACEFUL_TIMEOUT", "30"))  # Seconds in-flight requests get on shutdown
+# Worker processes sharing this host's upstream quotas - set by serve.py for its workers
+SERVE_WORKER_COUNT = max(1, int(os.getenv("SERVE_WORKER_COUNT", "1")))
+SERVE_KEEPALIVE_TIMEOUT = int(os.getenv("SERVE_KEEPALIVE_TIMEOUT", "75"))  # Keep above the load balancer's idle timeout
+# Create tables and apply migrations on app startup - single-process development only;
+# deployments run `python migrations.py` (or `python serve.py --migrate`) instead
+AUTO_MIGRATE = os.getenv("AUTO_MIGRATE", "false").lower() in ("1", "true", "yes")
+READY_TIMEOUT = float(os.getenv("READY_TIMEOUT", "2"))  # Seconds /ready waits for the database
+
+# Database connection pools (per worker process; the replica gets its own pool of the same size)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))  # Seconds a checkout waits before failing
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))  # Reconnect connections older than this (-1 = never)
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+# Read replica for read-only routes (empty = everything on DATABASE_URL; see replica.py)
+DATABASE_REPLICA_URL = os.getenv("DATABASE_REPLICA_URL", "")
+REPLICA_READ_AFTER_WRITE = float(os.getenv("REPLICA_READ_AFTER_WRITE", "10"))  # Seconds a user's reads stay on the primary after a write
+REPLICA_MAX_LAG = float(os.getenv("REPLICA_MAX_LAG", "1"))  # Replay lag (seconds) above which reads go to the primary
+REPLICA_LAG_CHECK_INTERVAL = float(os.getenv("REPLICA_LAG_CHECK_INTERVAL", "1"))
@@ -0,0 +1,98 @@
+"""Token-budgeted conversation context with a rolling summary of older turns"""
+from typing import Dict, List, Optional, Set, Tuple
+from sqlalchemy import select
+from database import SessionLocal, ChatSession
+from transcripts import load_transcript
+from utils import update_conversation_summary
+from tokens import message_tokens, conversation_tokens
+from config import CONTEXT_TOKEN_BUDGET
+
+_folding: Set[int] = set()
+
+
+def _window_start(conversation: List[Dict], budget: int) -> int:
+    """Index of the oldest message that still fits the budget, counting back from the newest.
+
+    The newest message is always kept, even when it alone exceeds the budget.
+    """
+    total = 0
+    start = len(conversation)
+    while start > 0:
+        cost = message_tokens(conversation[start - 1])
+        if total + cost > budget and start < len(conversation):
+            break
+        total += cost
+        start -= 1
+    return start
+
+
+def build_context(conversation: List[Dict], chat_session: Optional[ChatSession] = None) -> Tuple[List[Dict], Optional[int]]:
+    """Select the messages to send upstream for a conversation.
+
+    Returns (context messages, fold_upto). The most recent turns are kept
+    within CONTEXT_TOKEN_BUDGET; turns before them are represented by the
+    session's rolling summary. fold_upto is set when the summary should be
+    extended to cover conversation[:fold_upto] (see fold_rolling_summary).
+    """
+    start = _window_start(conversation, CONTEXT_TOKEN_BUDGET)
+    if chat_session is None:
+        # Client-held context - nowhere to keep a summary, just drop the oldest turns
+        return conversation[start:], None
+
+    summarized_count = min(chat_session.summarized_count or 0, len(conversation))
+    summary = chat_session.rolling_summary if summarized_count else None
+
+    # Everything the summary covers is replaced by it. Turns the summary has not caught up
+    # with yet are still sent, unless that lag grows past twice the budget.
+    keep_from = summarized_count
+    if conversation_tokens(conversation[keep_from:]) > CONTEXT_TOKEN_BUDGET * 2:
+        keep_from = max(start, summarized_count)
+
+    context = []
+    if summary:
+        context.append({
+            "role": "system",
+            "content": f"Summary of the earlier part of this conversation:\n{summary}"
+        })
+    context.extend(conversation[keep_from:])
+
+    # Fold down to half the budget so summaries are not regenerated on every turn
+    fold_upto = None
+    if start > summarized_count:
+        fold_upto = _window_start(conversation, CONTEXT_TOKEN_BUDGET // 2)
+    return context, fold_upto
+
+
+async def fold_rolling_summary(session_id: int, fold_upto: int, api_key: str, api_url: str):
+    """Extend a session's rolling summary to cover its first fold_upto messages (background task)"""
+    if session_id in _folding:
+        return
+    _folding.add(session_id)
+    try:
+        async with SessionLocal() as db:
+            chat_session = await db.get(ChatSession, session_id)
+            if chat_session is None:
+                return
+            summarized_count = chat_session.summarized_count or 0
+            if summarized_count >= fold_upto:
+                return
+            previous_summary = chat_session.rolling_summary
+            new_messages = await load_transcript(db, chat_session, summarized_count, fold_upto)
+
+        summary = await update_conversation_summary(previous_summary, new_messages, api_key, api_url)
+        if not summary:
+            return
+
+        async with SessionLocal() as db:
+            result = await db.execute(select(ChatSession).filter(ChatSession.id == session_id).with_for_update())
+            chat_session = result.scalars().first()
+            # Skip if the transcript was rewritten or another fold won meanwhile
+            if chat_session is None or (chat_session.summarized_count or 0) != summarized_count:
+                return
+            chat_session.rolling_summary = summary
+            chat_session.summarized_count = fold_upto
+            await db.commit()
+    except Exception as e:
+        print(f"Error updating rolling summary for session {session_id}: {e}")
+    finally:
+        _folding.discard(session_id)
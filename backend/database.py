@@ -1,14 +1,181 @@
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, ForeignKey, JSON
+import json
+import time
+import zlib
+from functools import lru_cache
+from typing import Dict, List
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, JSON, LargeBinary, UniqueConstraint, Index, text
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, Session, relationship
+from sqlalchemy.orm import relationship, deferred
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from datetime import datetime
-from config import DATABASE_URL
+from config import (
+    DATABASE_URL,
+    DATABASE_REPLICA_URL,
+    DB_POOL_SIZE,
+    DB_MAX_OVERFLOW,
+    DB_POOL_TIMEOUT,
+    DB_POOL_RECYCLE,
+    DB_POOL_PRE_PING,
+    TRANSCRIPT_CODEC,
+    TRANSCRIPT_ZSTD_LEVEL,
+)
+from metrics import instrument_engine, record_pool_checkout
 
-# Database engine and session
-engine = create_engine(DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+def get_async_database_url(url: str) -> str:
+    """Map a plain DATABASE_URL onto its async driver (asyncpg / aiosqlite)"""
+    if url.startswith("postgres://"):
+        url = "postgresql://" + url[len("postgres://"):]
+    if url.startswith("postgresql://"):
+        return "postgresql+asyncpg://" + url[len("postgresql://"):]
+    if url.startswith("sqlite://"):
+        return "sqlite+aiosqlite://" + url[len("sqlite://"):]
+    return url
+
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    """Queue pool that records how long each checkout waits (see db_pool_checkout_seconds)"""
+    label = "primary"
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except PoolTimeoutError:
+            record_pool_checkout(self.label, time.perf_counter() - started, timed_out=True)
+            raise
+        record_pool_checkout(self.label, time.perf_counter() - started)
+        return connection
+
+
+def create_pooled_engine(url: str, label: str):
+    """Async engine with the DB_POOL_* settings; label names its pool in the metrics"""
+    url = get_async_database_url(url)
+    if url.startswith("sqlite") and (url.endswith("://") or ":memory:" in url):
+        engine = create_async_engine(url)  # In-memory SQLite needs its single shared connection
+    else:
+        engine = create_async_engine(
+            url,
+            # A subclass per label, since the pool is re-created from its class on dispose()
+            poolclass=type(f"TimedQueuePool_{label}", (TimedQueuePool,), {"label": label}),
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+            pool_recycle=DB_POOL_RECYCLE,
+            pool_pre_ping=DB_POOL_PRE_PING,
+        )
+    instrument_engine(engine, label)
+    return engine
+
+
+# Database engine and session (async - route handlers must not block the event loop)
+engine = create_pooled_engine(DATABASE_URL, "primary")
+SessionLocal = async_sessionmaker(bind=engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+# Optional read replica for read-only routes - see replica.py for when they may use it
+read_engine = create_pooled_engine(DATABASE_REPLICA_URL, "replica") if DATABASE_REPLICA_URL else engine
+ReadSessionLocal = async_sessionmaker(bind=read_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
 Base = declarative_base()
 
+# Binary JSONB on Postgres (parsed once on write, indexable); plain JSON elsewhere
+JSONType = JSON().with_variant(JSONB(), "postgresql")
+
+
+# Transcript codecs - closed sessions can be compacted into one encoded blob
+# (ChatSession.transcript), tagged with the codec's name in transcript_codec.
+class JsonCodec:
+    """Plain JSON - no dependencies, no compression"""
+    name = "json"
+
+    def encode(self, messages: List[Dict]) -> bytes:
+        return json.dumps(messages, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+    def decode(self, data: bytes) -> List[Dict]:
+        return json.loads(data)
+
+    def to_json(self, data: bytes) -> bytes:
+        """The transcript as UTF-8 JSON, without building Python objects where the format allows"""
+        return bytes(data)
+
+
+class ZlibJsonCodec(JsonCodec):
+    """zlib-compressed JSON - standard library only"""
+    name = "zlib-json"
+
+    def encode(self, messages: List[Dict]) -> bytes:
+        return zlib.compress(super().encode(messages))
+
+    def decode(self, data: bytes) -> List[Dict]:
+        return super().decode(zlib.decompress(data))
+
+    def to_json(self, data: bytes) -> bytes:
+        return zlib.decompress(data)
+
+
+class ZstdMsgpackCodec:
+    """zstd-framed msgpack - smallest and fastest, needs the optional zstandard and msgpack packages"""
+    name = "zstd-msgpack"
+
+    def __init__(self):
+        import msgpack
+        import zstandard
+        self._msgpack = msgpack
+        self._zstd = zstandard
+
+    def encode(self, messages: List[Dict]) -> bytes:
+        return self._zstd.ZstdCompressor(level=TRANSCRIPT_ZSTD_LEVEL).compress(self._msgpack.packb(messages))
+
+    def decode(self, data: bytes) -> List[Dict]:
+        return self._msgpack.unpackb(self._zstd.ZstdDecompressor().decompress(data))
+
+    def to_json(self, data: bytes) -> bytes:
+        return json.dumps(self.decode(data), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+# Packages an optional codec needs, named when a stored transcript can't be decoded without them
+CODEC_PACKAGES = {ZstdMsgpackCodec.name: "zstandard msgpack"}
+
+
+class TranscriptCodecUnavailable(RuntimeError):
+    """A compacted transcript uses a codec this process can't load"""
+
+
+def _load_codecs() -> Dict[str, object]:
+    codecs = {codec.name: codec for codec in (JsonCodec(), ZlibJsonCodec())}
+    try:
+        codecs[ZstdMsgpackCodec.name] = ZstdMsgpackCodec()
+    except ImportError:
+        pass
+    return codecs
+
+
+TRANSCRIPT_CODECS = _load_codecs()
+
+
+def codec_for(name: str):
+    """The codec a stored transcript was compacted with (raises TranscriptCodecUnavailable if it isn't installed)"""
+    codec = TRANSCRIPT_CODECS.get(name)
+    if codec is None:
+        packages = CODEC_PACKAGES.get(name)
+        hint = f" - pip install {packages} on every worker" if packages else ""
+        raise TranscriptCodecUnavailable(f"Transcript is stored with codec '{name}', which is not available here{hint}")
+    return codec
+
+
+@lru_cache(maxsize=None)
+def get_transcript_codec():
+    """Codec new compactions use, or None when compaction is off (TRANSCRIPT_CODEC=none)"""
+    if TRANSCRIPT_CODEC == "none":
+        return None
+    if TRANSCRIPT_CODEC not in TRANSCRIPT_CODECS:
+        packages = CODEC_PACKAGES.get(TRANSCRIPT_CODEC)
+        hint = f" (pip install {packages})" if packages else ""
+        print(f"⚠️ TRANSCRIPT_CODEC '{TRANSCRIPT_CODEC}' is not available{hint}; using zlib-json")
+        return TRANSCRIPT_CODECS["zlib-json"]
+    return TRANSCRIPT_CODECS[TRANSCRIPT_CODEC]
+
 
 # Database Models
 class User(Base):
@@ -26,10 +193,26 @@ class User(Base):
 
 class ChatSession(Base):
     __tablename__ = "chat_sessions"
+    __table_args__ = (
+        Index("ix_chat_sessions_user_updated", "user_id", "updated_at"),
+        Index("ix_chat_sessions_user_created", "user_id", "created_at", "id"),  # /sessions keyset pagination
+        # Active (not yet summarized) sessions only - the /active-session and /save-session lookup
+        Index(
+            "ix_chat_sessions_active_user_updated", "user_id", "updated_at",
+            postgresql_where=text("summarized_at IS NULL"),
+            sqlite_where=text("summarized_at IS NULL"),
+        ),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
-    messages = Column(JSON, nullable=False)  # Store as JSON array
+    messages = Column(JSONType, nullable=False)  # Legacy JSON array - new transcripts live in chat_messages
+    message_count = Column(Integer, nullable=False, default=0, server_default="0")  # Messages in the transcript (rows in chat_messages unless compacted)
+    rolling_summary = Column(Text, nullable=True)  # Summary of the oldest turns, which no longer fit the context budget
+    summarized_count = Column(Integer, nullable=False, default=0, server_default="0")  # Leading messages covered by rolling_summary
+    summarized_at = Column(DateTime, nullable=True)  # Set when the session is closed and its Summary queued; NULL = active
+    transcript = deferred(Column(LargeBinary, nullable=True))  # Compacted transcript of a closed session (replaces its chat_messages rows)
+    transcript_codec = Column(String, nullable=True)  # Codec of transcript; NULL = not compacted
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
@@ -37,13 +220,27 @@ class ChatSession(Base):
     summary = relationship("Summary", back_populates="chat_session", uselist=False)
 
 
+class ChatMessage(Base):
+    __tablename__ = "chat_messages"
+    __table_args__ = (
+        UniqueConstraint("chat_session_id", "seq", name="uq_chat_messages_session_seq"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    chat_session_id = Column(Integer, ForeignKey("chat_sessions.id"), nullable=False)
+    seq = Column(Integer, nullable=False)  # 0-based position in the session transcript
+    role = Column(String, nullable=False)
+    content = Column(Text, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
 class Summary(Base):
     __tablename__ = "summaries"
     
     id = Column(Integer, primary_key=True, index=True)
-    chat_session_id = Column(Integer, ForeignKey("chat_sessions.id"), nullable=False)
+    chat_session_id = Column(Integer, ForeignKey("chat_sessions.id"), nullable=False, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
-    summary_data = Column(JSON, nullable=False)  # {"summary": "..."}
+    summary_data = Column(JSONType, nullable=False)  # {"summary": "..."}
     created_at = Column(DateTime, default=datetime.utcnow)
     
     chat_session = relationship("ChatSession", back_populates="summary")
@@ -54,24 +251,88 @@ class PersonalInfo(Base):
     
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), unique=True, nullable=False)
-    personal_info_data = Column(JSON, nullable=False)  # {"<PersonalInfo>": "...", "<Profession>": "..."}
+    personal_info_data = Column(JSONType, nullable=False)  # {"<PersonalInfo>": "...", "<Profession>": "..."}
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     user = relationship("User", back_populates="personal_info")
 
 
-# Create tables
-def init_db():
-    """Initialize database tables"""
-    Base.metadata.create_all(bind=engine)
+class Job(Base):
+    __tablename__ = "jobs"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String, nullable=False)  # e.g. "summarize_session"
+    status = Column(String, nullable=False, default="pending", index=True)  # pending | running | done | failed
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    chat_session_id = Column(Integer, ForeignKey("chat_sessions.id"), nullable=True)
+    result = Column(JSONType, nullable=True)
+    error = Column(String, nullable=True)
+    attempts = Column(Integer, nullable=False, default=0)
+    locked_until = Column(DateTime, nullable=True)  # Lease - expired leases are re-claimed after a crash
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+# Create tables - run by `python migrations.py`, never by the app's workers (unless AUTO_MIGRATE)
+async def init_db():
+    """Initialize database tables and apply schema migrations"""
+    from migrations import run_migrations, lock_migrations
+    
+    async with engine.begin() as conn:
+        await lock_migrations(conn)
+        await conn.run_sync(Base.metadata.create_all)
+        await run_migrations(conn)
+
+
+async def pending_schema_migrations() -> List[str]:
+    """Migrations the database still lacks (raises if it is unreachable) - for the readiness probe"""
+    from migrations import pending_migrations
+
+    async with engine.connect() as conn:
+        return await pending_migrations(conn)
+
+
+def _pool_status(engine) -> Dict:
+    pool = engine.sync_engine.pool
+    if not isinstance(pool, AsyncAdaptedQueuePool):
+        return {"pool": type(pool).__name__}
+    return {
+        "pool": type(pool).__name__,
+        "size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "idle": pool.checkedin(),
+        "overflow": max(0, pool.overflow()),
+        "max_overflow": DB_MAX_OVERFLOW,
+    }
+
+
+def get_db_pool_stats() -> Dict:
+    """Connections in use and idle per pool (checkout waits are in /metrics)"""
+    stats = {"primary": _pool_status(engine)}
+    if read_engine is not engine:
+        stats["replica"] = _pool_status(read_engine)
+    return stats
+
+
+async def close_db():
+    """Dispose of the engines' connection pools"""
+    await engine.dispose()
+    if read_engine is not engine:
+        await read_engine.dispose()
 
 
 # Dependency to get DB session
-def get_db():
+async def get_db():
     """Dependency to get database session"""
-    db = SessionLocal()
-    try:
+    async with SessionLocal() as db:
+        yield db
+
+
+async def get_read_db():
+    """Dependency for a session on the read replica (the primary when none is configured).
+
+    Only for reads that tolerate replication lag - see replica.read_db_for.
+    """
+    async with ReadSessionLocal() as db:
         yield db
-    finally:
-        db.close()
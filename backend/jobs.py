@@ -0,0 +1,298 @@
+"""Background job queue backed by the jobs table"""
+import asyncio
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Set, Tuple
+from sqlalchemy import select, or_, and_, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import SessionLocal, Job, ChatSession, Summary, PersonalInfo, get_transcript_codec
+from utils import extract_session_insights
+from transcripts import load_transcript, compact_transcript
+from profile_cache import set_profile
+from singleflight import flights, flight_key
+from config import (
+    JOB_WORKERS,
+    JOB_POLL_INTERVAL,
+    JOB_LEASE_SECONDS,
+    JOB_MAX_ATTEMPTS,
+    JOB_RETRY_DELAY,
+)
+
+SUMMARIZE_SESSION = "summarize_session"
+
+_workers: List[asyncio.Task] = []
+_wakeup = asyncio.Event()
+_running_job_ids: Set[int] = set()
+
+
+async def enqueue_job(db: AsyncSession, kind: str, user_id: int, chat_session_id: Optional[int] = None) -> Job:
+    """Add a pending job to the queue. The caller commits, then calls notify_workers()"""
+    job = Job(kind=kind, status="pending", user_id=user_id, chat_session_id=chat_session_id)
+    db.add(job)
+    await db.flush()
+    return job
+
+
+def notify_workers():
+    """Wake idle workers so a freshly committed job starts without waiting for the next poll"""
+    _wakeup.set()
+
+
+async def queue_session_summary(db: AsyncSession, chat_session: ChatSession, user_id: int) -> Job:
+    """Close the session and queue summary + profile extraction as a background job.
+
+    summarized_at marks the session as no longer active right away; the job
+    fills in the placeholder summary's summary_data when it runs. The caller
+    commits, then calls notify_workers().
+    """
+    chat_session.summarized_at = datetime.utcnow()
+    db.add(Summary(
+        chat_session_id=chat_session.id,
+        user_id=user_id,
+        summary_data={"summary": None, "status": "pending"}
+    ))
+    return await enqueue_job(db, SUMMARIZE_SESSION, user_id, chat_session.id)
+
+
+async def _extract_session_profile(user_id: int, messages: List[Dict]) -> Tuple[Dict, Dict]:
+    """Extract summary and profile from a transcript and merge the profile into PersonalInfo"""
+    # One upstream call for the summary, profession and personal info
+    insights = await extract_session_insights(messages)
+    summary_data = {"summary": insights["summary"]}
+    # Only what the model actually found - an empty field must not erase what earlier sessions learned
+    extracted_data = {
+        key: insights[key] for key in ("<PersonalInfo>", "<Profession>") if insights[key]
+    }
+
+    async with SessionLocal() as db:
+        # Update or create personal info
+        result = await db.execute(select(PersonalInfo).filter(PersonalInfo.user_id == user_id))
+        personal_info = result.scalars().first()
+        if personal_info:
+            # Merge with existing data - ensure we preserve existing keys
+            existing_data = personal_info.personal_info_data.copy() if personal_info.personal_info_data else {}
+            # Update with the non-empty extracted <Profession>/<PersonalInfo> values
+            existing_data.update(extracted_data)
+            personal_info.personal_info_data = existing_data
+            print(f"✅ Updated profession '{extracted_data.get('<Profession>', '')}' for user {user_id} on logout")
+        else:
+            personal_info = PersonalInfo(
+                user_id=user_id,
+                personal_info_data=extracted_data
+            )
+            db.add(personal_info)
+            print(f"✅ Created profession '{extracted_data.get('<Profession>', '')}' for user {user_id} on logout")
+
+        await db.commit()
+        set_profile(user_id, personal_info.personal_info_data)
+
+    return summary_data, extracted_data
+
+
+async def _summarize_session(job: Job) -> Dict:
+    """Generate the session summary and update the user's profession/personal info"""
+    # Read the transcript, then release the connection before the LLM calls
+    async with SessionLocal() as db:
+        chat_session = await db.get(ChatSession, job.chat_session_id)
+        if chat_session is None:
+            raise ValueError(f"Session {job.chat_session_id} not found")
+        messages_dict = await load_transcript(db, chat_session)
+
+    # Duplicate jobs for the same transcript (e.g. a double-clicked logout) share one
+    # upstream call and one PersonalInfo update
+    summary_data, extracted_data = await flights.do(
+        flight_key("session_insights", job.user_id, messages_dict),
+        _extract_session_profile, job.user_id, messages_dict
+    )
+
+    async with SessionLocal() as db:
+        result = await db.execute(select(Summary).filter(Summary.chat_session_id == job.chat_session_id))
+        summary = result.scalars().first()
+        if summary:
+            summary.summary_data = summary_data
+        else:
+            db.add(Summary(
+                chat_session_id=job.chat_session_id,
+                user_id=job.user_id,
+                summary_data=summary_data
+            ))
+        await db.commit()
+
+    await _compact_closed_session(job.chat_session_id)
+    return {"summary": summary_data, "personal_info": extracted_data}
+
+
+async def _compact_closed_session(session_id: int):
+    """Compact a closed session's transcript (best effort - compact-transcripts catches up later)"""
+    if get_transcript_codec() is None:
+        return
+    try:
+        async with SessionLocal() as db:
+            result = await db.execute(select(ChatSession).filter(ChatSession.id == session_id).with_for_update())
+            chat_session = result.scalars().first()
+            if chat_session is not None and chat_session.summarized_at is not None:
+                await compact_transcript(db, chat_session)
+                await db.commit()
+    except Exception as e:
+        print(f"Error compacting transcript of session {session_id}: {e}")
+
+
+# Job kind -> handler
+JOB_HANDLERS = {
+    SUMMARIZE_SESSION: _summarize_session,
+}
+
+
+async def _claim_job() -> Optional[Job]:
+    """Claim the oldest pending job (or one whose lease expired) for this worker"""
+    while True:
+        job, retry = await _try_claim_job()
+        if not retry:
+            return job
+
+
+async def _try_claim_job() -> Tuple[Optional[Job], bool]:
+    """One claim attempt. Returns (job, retry) - retry when an exhausted job was failed instead"""
+    now = datetime.utcnow()
+    async with SessionLocal() as db:
+        result = await db.execute(
+            select(Job)
+            .filter(or_(
+                and_(Job.status == "pending", or_(Job.locked_until == None, Job.locked_until < now)),
+                and_(Job.status == "running", Job.locked_until < now)
+            ))
+            .order_by(Job.id)
+            .limit(1)
+            .with_for_update(skip_locked=True)
+        )
+        job = result.scalars().first()
+        if job is None:
+            return None, False
+        
+        if job.status == "running" and job.attempts >= JOB_MAX_ATTEMPTS:
+            # Its lease ran out on the last attempt - the process running it died, and a job
+            # that keeps taking its worker down must not be retried forever
+            await db.execute(
+                update(Job)
+                .where(Job.id == job.id, Job.status == "running", Job.attempts == job.attempts)
+                .values(status="failed", locked_until=None,
+                        error=f"Lease expired on attempt {job.attempts} of {JOB_MAX_ATTEMPTS}")
+                .execution_options(synchronize_session=False)
+            )
+            await db.commit()
+            print(f"⚠️ Job {job.id} ({job.kind}) failed: lease expired on its last attempt")
+            return None, True
+        
+        # Conditional update so two workers can never both claim it, even where SKIP LOCKED is unsupported
+        claimed = await db.execute(
+            update(Job)
+            .where(Job.id == job.id, Job.status == job.status, Job.attempts == job.attempts)
+            .values(
+                status="running",
+                attempts=job.attempts + 1,
+                locked_until=now + timedelta(seconds=JOB_LEASE_SECONDS)
+            )
+            .execution_options(synchronize_session=False)
+        )
+        await db.commit()
+        if claimed.rowcount != 1:
+            return None, False
+        await db.refresh(job)
+        return job, False
+
+
+async def _finish_job(
+    job_id: int,
+    status: str,
+    result: Optional[Dict] = None,
+    error: Optional[str] = None,
+    retry_after: Optional[datetime] = None
+):
+    """Record the outcome of a job. A pending job with retry_after is not claimed before that time"""
+    async with SessionLocal() as db:
+        job = await db.get(Job, job_id)
+        job.status = status
+        job.result = result
+        job.error = error
+        job.locked_until = retry_after
+        await db.commit()
+
+
+async def _run_job(job: Job):
+    """Run one claimed job, retrying on failure up to JOB_MAX_ATTEMPTS"""
+    handler = JOB_HANDLERS.get(job.kind)
+    if handler is None:
+        await _finish_job(job.id, "failed", error=f"Unknown job kind: {job.kind}")
+        return
+
+    # Tracked until finished so shutdown can re-queue it if the worker is cancelled mid-run
+    _running_job_ids.add(job.id)
+    cancelled = False
+    try:
+        try:
+            result = await handler(job)
+        except Exception as e:
+            print(f"Error running job {job.id} ({job.kind}), attempt {job.attempts}: {e}")
+            if job.attempts >= JOB_MAX_ATTEMPTS:
+                await _finish_job(job.id, "failed", error=str(e))
+            else:
+                retry_after = datetime.utcnow() + timedelta(seconds=JOB_RETRY_DELAY * job.attempts)
+                await _finish_job(job.id, "pending", error=str(e), retry_after=retry_after)
+        else:
+            await _finish_job(job.id, "done", result=result)
+    except asyncio.CancelledError:
+        cancelled = True  # Left in _running_job_ids for stop_job_workers to re-queue
+        raise
+    finally:
+        if not cancelled:
+            # Also when recording the outcome failed - the lease then expires and the job is re-claimed
+            _running_job_ids.discard(job.id)
+
+
+async def _worker(worker_id: int):
+    """Claim and run jobs until cancelled"""
+    while True:
+        # Cleared before claiming so a notify during the claim is not lost
+        _wakeup.clear()
+        try:
+            job = await _claim_job()
+        except Exception as e:
+            print(f"Job worker {worker_id} failed to claim a job: {e}")
+            job = None
+
+        if job is not None:
+            try:
+                await _run_job(job)
+            except Exception as e:
+                # Keep the worker alive - the job's lease expires and it is claimed again
+                print(f"Job worker {worker_id} failed to finish job {job.id}: {e}")
+            continue
+
+        # Queue empty - sleep until notified or the next poll
+        try:
+            await asyncio.wait_for(_wakeup.wait(), timeout=JOB_POLL_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+
+
+def start_job_workers():
+    """Start the bounded worker pool (called on app startup)"""
+    for worker_id in range(JOB_WORKERS):
+        _workers.append(asyncio.create_task(_worker(worker_id)))
+
+
+async def stop_job_workers():
+    """Stop the workers and hand interrupted jobs back to the queue (called on app shutdown)"""
+    for task in _workers:
+        task.cancel()
+    await asyncio.gather(*_workers, return_exceptions=True)
+    _workers.clear()
+
+    if _running_job_ids:
+        async with SessionLocal() as db:
+            await db.execute(
+                update(Job)
+                .where(Job.id.in_(_running_job_ids), Job.status == "running")
+                .values(status="pending", locked_until=None)
+            )
+            await db.commit()
+        _running_job_ids.clear()
@@ -0,0 +1,92 @@
+"""Live profession extraction during chat, kept off the reply's critical path"""
+from collections import OrderedDict
+from typing import Dict, List, Set
+from sqlalchemy import select
+from database import SessionLocal, PersonalInfo
+from utils import extract_profession_and_info
+from profile_cache import set_profile
+from singleflight import flights, flight_key, transcript_hash
+from config import LIVE_EXTRACTION_MIN_NEW_USER_MESSAGES, LIVE_EXTRACTION_CACHE_SIZE
+
+# user_id -> number of user messages in the history at the last attempt
+_last_attempt: "OrderedDict[int, int]" = OrderedDict()
+# user_id -> hash of a history that yielded no profession (negative-result cache)
+_no_profession: "OrderedDict[int, str]" = OrderedDict()
+_in_flight: Set[int] = set()
+
+
+def _remember(cache: OrderedDict, key: int, value):
+    """Insert into a bounded LRU dict"""
+    cache[key] = value
+    cache.move_to_end(key)
+    while len(cache) > LIVE_EXTRACTION_CACHE_SIZE:
+        cache.popitem(last=False)
+
+
+def should_extract(user_id: int, messages: List[Dict]) -> bool:
+    """Decide whether live extraction is worth another upstream call for this history"""
+    # Need at least 2-3 messages before a profession can have come up
+    if len(messages) < 2 or user_id in _in_flight:
+        return False
+
+    # Debounce: wait for enough new user messages since the last attempt
+    user_count = sum(1 for msg in messages if msg["role"] == "user")
+    last_count = _last_attempt.get(user_id)
+    if last_count is not None and 0 <= user_count - last_count < LIVE_EXTRACTION_MIN_NEW_USER_MESSAGES:
+        return False
+
+    # Skip an unchanged history we already know has no profession in it
+    return _no_profession.get(user_id) != transcript_hash(messages)
+
+
+async def run_live_extraction(user_id: int, messages: List[Dict], api_key: str, api_url: str):
+    """Extract profession from the conversation and save it (runs as a background task)
+
+    Turns that passed should_extract concurrently (e.g. two tabs) join an
+    extraction of the same history, and skip one of a different history.
+    """
+    key = flight_key("live_extraction", user_id, messages)
+    if user_id in _in_flight and not flights.in_flight(key):
+        return
+    _in_flight.add(user_id)
+    await flights.do(key, _extract_and_save, user_id, messages, api_key, api_url)
+
+
+async def _extract_and_save(user_id: int, messages: List[Dict], api_key: str, api_url: str):
+    """Run one extraction and store the result (clears the user's in-flight mark when done)"""
+    try:
+        _remember(_last_attempt, user_id, sum(1 for msg in messages if msg["role"] == "user"))
+        extracted_data = await extract_profession_and_info(messages, api_key, api_url)
+
+        extracted_profession = extracted_data.get("<Profession>", "").strip()
+        extracted_personal_info = extracted_data.get("<PersonalInfo>", "").strip()
+
+        if not extracted_profession:
+            _remember(_no_profession, user_id, transcript_hash(messages))
+            return
+        _no_profession.pop(user_id, None)
+
+        async with SessionLocal() as db:
+            result = await db.execute(select(PersonalInfo).filter(PersonalInfo.user_id == user_id))
+            personal_info_record = result.scalars().first()
+            if personal_info_record:
+                # Update existing - ensure we use the correct keys
+                existing_data = personal_info_record.personal_info_data.copy() if personal_info_record.personal_info_data else {}
+                existing_data["<Profession>"] = extracted_profession
+                if extracted_personal_info:
+                    existing_data["<PersonalInfo>"] = extracted_personal_info
+                personal_info_record.personal_info_data = existing_data
+            else:
+                # Create new - use extracted_data directly (already has correct keys)
+                personal_info_record = PersonalInfo(
+                    user_id=user_id,
+                    personal_info_data=extracted_data
+                )
+                db.add(personal_info_record)
+            await db.commit()
+            set_profile(user_id, personal_info_record.personal_info_data)
+        print(f"✅ Saved profession '{extracted_profession}' for user {user_id}")
+    except Exception as e:
+        print(f"Error in live profession extraction for user {user_id}: {e}")
+    finally:
+        _in_flight.discard(user_id)
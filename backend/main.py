@@ -1,12 +1,42 @@
-"""Main FastAPI application"""
-from fastapi import FastAPI
+"""Main FastAPI application
+
+Importing this module opens no connections; everything shared is set up in
+the lifespan, once per worker process. Schema changes are applied
+separately (python migrations.py). Production runs go through serve.py.
+"""
+import asyncio
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from config import CORS_ORIGINS
-from database import init_db
-from routes import auth_router, chat_router, sessions_router
+from fastapi.responses import JSONResponse
+from config import CORS_ORIGINS, AUTO_MIGRATE, READY_TIMEOUT
+from database import init_db, close_db, pending_schema_migrations, TranscriptCodecUnavailable
+from routes import auth_router, chat_router, sessions_router, stats_router, jobs_router
+from upstream import init_upstream_client, close_upstream_client
+from jobs import start_job_workers, stop_job_workers
+from metrics import MetricsMiddleware
+from write_behind import start_write_behind, stop_write_behind
+from completion_cache import init_completion_cache
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Open shared resources on startup and release them on shutdown"""
+    if AUTO_MIGRATE:
+        await init_db()
+    await init_upstream_client()
+    await init_completion_cache()
+    await start_write_behind()
+    start_job_workers()
+    yield
+    await stop_job_workers()
+    await stop_write_behind()
+    await close_upstream_client()
+    await close_db()
+
 
 # Initialize FastAPI app
-app = FastAPI(title="Chatbot API")
+app = FastAPI(title="Chatbot API", lifespan=lifespan)
 
 # CORS - Allow frontend to connect
 app.add_middleware(
@@ -16,14 +46,22 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(MetricsMiddleware)
+
+
+@app.exception_handler(TranscriptCodecUnavailable)
+async def transcript_codec_unavailable(request: Request, exc: TranscriptCodecUnavailable):
+    """A worker missing an optional codec package - say which, instead of a bare 500"""
+    print(f"⚠️ {exc}")
+    return JSONResponse(status_code=500, content={"detail": str(exc)})
 
-# Initialize database
-init_db()
 
 # Include routers
 app.include_router(auth_router)
 app.include_router(chat_router)
 app.include_router(sessions_router)
+app.include_router(stats_router)
+app.include_router(jobs_router)
 
 
 @app.get("/")
@@ -35,10 +73,25 @@ async def root():
             "/register": "POST - Register new user",
             "/login": "POST - Login user",
             "/chat": "POST - Send chat messages",
+            "/chat/stream": "POST - Send chat messages, stream reply as SSE",
+            "/ws/chat": "WebSocket - Chat on one connection that keeps the session between turns",
             "/save-session": "POST - Save chat session",
+            "/jobs/{id}": "GET - Background job status",
             "/sessions": "GET - Get all sessions",
             "/session/{id}": "GET - Get specific session",
-            "/health": "GET - Health check",
+            "/session/{id}/messages": "POST - Append new messages to a session",
+            "/health": "GET - Liveness check (the process is up)",
+            "/ready": "GET - Readiness check (database reachable, schema up to date)",
+            "/stats/upstream": "GET - Upstream connection pool stats",
+            "/stats/prompt": "GET - System prompt size and cache stats",
+            "/stats/profile-cache": "GET - User profile cache stats",
+            "/stats/completion-cache": "GET - Completion cache hit-rate stats",
+            "/stats/scheduler": "GET - Upstream scheduler queue and retry stats",
+            "/stats/singleflight": "GET - Coalesced upstream call stats",
+            "/stats/endpoints": "GET - Upstream endpoint routing stats",
+            "/stats/write-behind": "GET - Buffered autosave stats",
+            "/stats/db": "GET - Database pool usage and replica read routing stats",
+            "/metrics": "GET - Prometheus metrics (latency, upstream calls, DB queries, tokens)",
             "/docs": "GET - API documentation"
         }
     }
@@ -46,10 +99,23 @@ async def root():
 
 @app.get("/health")
 async def health_check():
-    """Health check endpoint"""
+    """Liveness - answers as long as the worker's event loop does, without touching the database"""
     return {"status": "healthy"}
 
 
+@app.get("/ready")
+async def readiness_check():
+    """Readiness - 503 while the database is unreachable or migrations are pending"""
+    try:
+        pending = await asyncio.wait_for(pending_schema_migrations(), READY_TIMEOUT)
+    except Exception as e:
+        return JSONResponse(status_code=503, content={"status": "database unavailable", "detail": str(e) or type(e).__name__})
+    if pending:
+        return JSONResponse(status_code=503, content={"status": "schema out of date", "pending_migrations": pending})
+    return {"status": "ready"}
+
+
 if __name__ == "__main__":
+    # Single process for development - see serve.py for production
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,205 @@
+"""Request, upstream, database and token metrics in the Prometheus text format
+
+Scraped from GET /metrics. Kept dependency-free: counters and histograms
+are plain dicts keyed by label values, rendered on demand.
+
+Metrics are per process, and every series carries a worker="<pid>" label.
+With several workers, a scrape through the shared port reaches just one of
+them, so each worker's series are sampled only intermittently - aggregate
+with sum without (worker) (...), and rate() stays correct per series.
+
+- http_request_duration_seconds{method, route, status} - route is the path
+  template (/session/{session_id}), measured until the response has been
+  fully sent, so streamed replies count their whole duration
+- upstream_request_duration_seconds{call_type, endpoint, status} - each
+  attempt, up to the response headers
+- db_query_duration_seconds{pool, operation} - pool is primary or replica
+- db_pool_checkout_seconds{pool} - wait for a pooled connection (including
+  opening a new one); db_pool_timeouts_total{pool} counts checkouts that
+  gave up after DB_POOL_TIMEOUT
+- llm_tokens_total{call_type, model, kind} - prompt/completion tokens from
+  the upstream usage objects
+"""
+import os
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+from config import METRICS_ENABLED
+
+POOL_WAIT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_registry: List = []
+INF_BOUND = 'le="+Inf"'
+
+
+def _format_labels(names: Sequence[str], values: Tuple, extra: str = "") -> str:
+    pairs = [f'worker="{os.getpid()}"'] + [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple, float] = {}
+        _registry.append(self)
+
+    def inc(self, *labels, amount: float = 1.0):
+        self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {value:g}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._values: Dict[Tuple, List] = {}  # labels -> [per-bucket counts, sum, count]
+        _registry.append(self)
+
+    def observe(self, value: float, *labels):
+        entry = self._values.get(labels)
+        if entry is None:
+            entry = self._values[labels] = [[0] * len(self.buckets), 0.0, 0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                entry[0][i] += 1
+                break
+        entry[1] += value
+        entry[2] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for labels, (counts, total, count) in sorted(self._values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = _format_labels(self.labelnames, labels, f'le="{bound:g}"')
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, INF_BOUND)} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {total:.6f}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {count}")
+        return lines
+
+
+http_request_duration = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route", ("method", "route", "status")
+)
+upstream_request_duration = Histogram(
+    "upstream_request_duration_seconds", "Upstream LLM request latency (to response headers) by call type",
+    ("call_type", "endpoint", "status")
+)
+db_query_duration = Histogram(
+    "db_query_duration_seconds", "Database statement execution time", ("pool", "operation")
+)
+db_pool_checkout = Histogram(
+    "db_pool_checkout_seconds", "Time to get a connection from the database pool", ("pool",), POOL_WAIT_BUCKETS
+)
+db_pool_timeouts = Counter(
+    "db_pool_timeouts_total", "Connection checkouts that timed out waiting for the pool", ("pool",)
+)
+llm_tokens = Counter(
+    "llm_tokens_total", "Tokens reported by the upstream usage objects", ("call_type", "model", "kind")
+)
+
+
+def render_metrics() -> str:
+    """All metrics in the Prometheus text exposition format"""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+def record_upstream(call_type: str, endpoint: str, status, elapsed: float):
+    if METRICS_ENABLED:
+        upstream_request_duration.observe(elapsed, call_type, endpoint, str(status))
+
+
+def record_usage(call_type: str, model: Optional[str], usage: Optional[Dict]):
+    """Count the prompt/completion tokens of one upstream usage object"""
+    if not METRICS_ENABLED or not usage:
+        return
+    for kind in ("prompt", "completion"):
+        tokens = usage.get(f"{kind}_tokens")
+        if tokens:
+            llm_tokens.inc(call_type, model or "", kind, amount=tokens)
+
+
+def record_pool_checkout(pool: str, elapsed: float, timed_out: bool = False):
+    if METRICS_ENABLED:
+        db_pool_checkout.observe(elapsed, pool)
+        if timed_out:
+            db_pool_timeouts.inc(pool)
+
+
+class MetricsMiddleware:
+    """ASGI middleware timing every HTTP request by its route template"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not METRICS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            # Unmatched paths share one label so scans can't blow up the series count
+            path = getattr(route, "path", None) or "unmatched"
+            http_request_duration.observe(time.perf_counter() - started, scope["method"], path, str(status))
+
+
+def _statement_operation(statement: str) -> str:
+    words = statement.lstrip().split(None, 1)
+    return words[0].upper() if words else "OTHER"
+
+
+def instrument_engine(engine, pool: str = "primary"):
+    """Time every statement run through a SQLAlchemy (async) engine"""
+    if not METRICS_ENABLED:
+        return
+    from sqlalchemy import event
+
+    sync_engine = getattr(engine, "sync_engine", engine)
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["query_started"].pop()
+        db_query_duration.observe(time.perf_counter() - started, pool, _statement_operation(statement))
+
+    @event.listens_for(sync_engine, "handle_error")
+    def _failed(context):
+        # Failed statements never reach after_cursor_execute
+        if context.connection is not None and context.connection.info.get("query_started"):
+            started = context.connection.info["query_started"].pop()
+            db_query_duration.observe(time.perf_counter() - started, pool, _statement_operation(context.statement or ""))
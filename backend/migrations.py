@@ -0,0 +1,214 @@
+"""Schema migrations and data backfills
+
+Base.metadata.create_all only creates missing tables, so changes to existing
+tables are applied here, in order, and recorded in schema_migrations.
+
+The app never runs these itself (see AUTO_MIGRATE) - apply them once per
+deploy, before the new version starts; /ready reports 503 until they are.
+
+Usage:
+    python migrations.py                    # create tables + apply pending migrations
+    python migrations.py backfill-messages  # move legacy JSON transcripts into chat_messages
+    python migrations.py compact-transcripts  # encode closed sessions' transcripts with TRANSCRIPT_CODEC
+"""
+import asyncio
+import sys
+from datetime import datetime
+from typing import List
+from sqlalchemy import Table, Column, String, DateTime, MetaData, inspect, select, text, or_
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+# Kept out of Base.metadata - it tracks the schema rather than being part of it
+_migrations_table = Table(
+    "schema_migrations",
+    MetaData(),
+    Column("name", String, primary_key=True),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+
+def _has_column(sync_conn, table: str, column: str) -> bool:
+    """Check whether a table already has a column"""
+    return column in {col["name"] for col in inspect(sync_conn).get_columns(table)}
+
+
+async def _add_column(conn: AsyncConnection, table: str, column: str, ddl: str):
+    """ALTER TABLE ... ADD COLUMN, skipped when the column exists (fresh databases get it from create_all)"""
+    if not await conn.run_sync(_has_column, table, column):
+        await conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+
+
+async def _0001_chat_message_count(conn: AsyncConnection):
+    """Per-session row count for the append-only chat_messages table"""
+    await _add_column(conn, "chat_sessions", "message_count", "INTEGER NOT NULL DEFAULT 0")
+
+
+async def _0002_rolling_summary(conn: AsyncConnection):
+    """Rolling summary of turns that fell out of the context budget"""
+    await _add_column(conn, "chat_sessions", "rolling_summary", "TEXT")
+    await _add_column(conn, "chat_sessions", "summarized_count", "INTEGER NOT NULL DEFAULT 0")
+
+
+async def _0003_active_session_index(conn: AsyncConnection):
+    """Explicit summarized_at flag plus indexes for the active-session lookup"""
+    await _add_column(conn, "chat_sessions", "summarized_at", "TIMESTAMP")
+    # Index the join column first - the backfill below probes it once per session
+    await conn.execute(text("CREATE INDEX IF NOT EXISTS ix_summaries_chat_session_id ON summaries (chat_session_id)"))
+    # Sessions that already have a Summary are closed
+    await conn.execute(text(
+        "UPDATE chat_sessions SET summarized_at = "
+        "(SELECT MIN(summaries.created_at) FROM summaries WHERE summaries.chat_session_id = chat_sessions.id) "
+        "WHERE summarized_at IS NULL AND EXISTS "
+        "(SELECT 1 FROM summaries WHERE summaries.chat_session_id = chat_sessions.id)"
+    ))
+    await conn.execute(text("CREATE INDEX IF NOT EXISTS ix_chat_sessions_user_updated ON chat_sessions (user_id, updated_at)"))
+    await conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_chat_sessions_active_user_updated ON chat_sessions (user_id, updated_at) "
+        "WHERE summarized_at IS NULL"
+    ))
+
+
+async def _0004_sessions_listing_index(conn: AsyncConnection):
+    """Index for keyset pagination of /sessions (newest first)"""
+    await conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_chat_sessions_user_created ON chat_sessions (user_id, created_at, id)"
+    ))
+
+
+async def _0005_transcript_codec(conn: AsyncConnection):
+    """Compacted transcript blob; JSON columns become JSONB on Postgres"""
+    blob = "BYTEA" if conn.dialect.name == "postgresql" else "BLOB"
+    await _add_column(conn, "chat_sessions", "transcript", blob)
+    await _add_column(conn, "chat_sessions", "transcript_codec", "VARCHAR")
+    if conn.dialect.name == "postgresql":
+        # Rewrites each table - run during a maintenance window on large databases
+        for table, column in (
+            ("chat_sessions", "messages"),
+            ("summaries", "summary_data"),
+            ("personal_info", "personal_info_data"),
+            ("jobs", "result"),
+        ):
+            await conn.execute(text(f"ALTER TABLE {table} ALTER COLUMN {column} TYPE JSONB USING {column}::jsonb"))
+
+
+# (name, migration) - append only, never reorder
+MIGRATIONS = [
+    ("0001_chat_message_count", _0001_chat_message_count),
+    ("0002_rolling_summary", _0002_rolling_summary),
+    ("0003_active_session_index", _0003_active_session_index),
+    ("0004_sessions_listing_index", _0004_sessions_listing_index),
+    ("0005_transcript_codec", _0005_transcript_codec),
+]
+
+
+# Arbitrary, fixed key for the Postgres advisory lock held while migrating
+MIGRATION_LOCK_KEY = 804211
+
+
+async def lock_migrations(conn: AsyncConnection):
+    """Serialize concurrent upgrades (e.g. several deploy jobs starting at once) until the transaction ends"""
+    if conn.dialect.name == "postgresql":
+        await conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": MIGRATION_LOCK_KEY})
+
+
+async def pending_migrations(conn: AsyncConnection) -> List[str]:
+    """Names of migrations not applied yet (all of them on an empty database)"""
+    if not await conn.run_sync(lambda sync_conn: inspect(sync_conn).has_table(_migrations_table.name)):
+        return [name for name, _ in MIGRATIONS]
+    applied = set((await conn.execute(select(_migrations_table.c.name))).scalars())
+    return [name for name, _ in MIGRATIONS if name not in applied]
+
+
+async def run_migrations(conn: AsyncConnection):
+    """Apply pending migrations inside the caller's transaction"""
+    await conn.run_sync(_migrations_table.create, checkfirst=True)
+    applied = set((await conn.execute(select(_migrations_table.c.name))).scalars())
+    for name, migrate in MIGRATIONS:
+        if name in applied:
+            continue
+        await migrate(conn)
+        await conn.execute(_migrations_table.insert().values(name=name, applied_at=datetime.utcnow()))
+        print(f"✅ Applied migration {name}")
+
+
+async def backfill_messages(batch_size: int = 500) -> int:
+    """Copy legacy ChatSession.messages JSON arrays into chat_messages, in batches"""
+    from database import SessionLocal, ChatSession
+    from transcripts import migrate_legacy_transcript
+
+    last_id = 0
+    migrated = 0
+    while True:
+        async with SessionLocal() as db:
+            result = await db.execute(
+                select(ChatSession)
+                .filter(ChatSession.id > last_id, ChatSession.message_count == 0)
+                .order_by(ChatSession.id)
+                .limit(batch_size)
+            )
+            sessions = result.scalars().all()
+            if not sessions:
+                break
+            for chat_session in sessions:
+                if await migrate_legacy_transcript(db, chat_session):
+                    migrated += 1
+            await db.commit()
+            last_id = sessions[-1].id
+        print(f"Backfilled {migrated} sessions (up to id {last_id})")
+    return migrated
+
+
+async def compact_transcripts(batch_size: int = 200) -> int:
+    """Encode closed sessions' transcripts with TRANSCRIPT_CODEC, in batches (re-encodes other codecs)"""
+    from database import SessionLocal, ChatSession, get_transcript_codec
+    from transcripts import compact_transcript
+
+    codec = get_transcript_codec()
+    if codec is None:
+        raise SystemExit("TRANSCRIPT_CODEC is 'none' - set it to the codec to compact with")
+
+    last_id = 0
+    compacted = 0
+    while True:
+        async with SessionLocal() as db:
+            result = await db.execute(
+                select(ChatSession)
+                .filter(
+                    ChatSession.id > last_id,
+                    ChatSession.summarized_at != None,
+                    or_(ChatSession.transcript_codec == None, ChatSession.transcript_codec != codec.name)
+                )
+                .order_by(ChatSession.id)
+                .limit(batch_size)
+                .with_for_update(skip_locked=True)
+            )
+            sessions = result.scalars().all()
+            if not sessions:
+                break
+            for chat_session in sessions:
+                if await compact_transcript(db, chat_session, codec):
+                    compacted += 1
+            await db.commit()
+            last_id = sessions[-1].id
+        print(f"Compacted {compacted} sessions with {codec.name} (up to id {last_id})")
+    return compacted
+
+
+async def run_command(command: str):
+    from database import init_db, close_db
+
+    try:
+        if command == "upgrade":
+            await init_db()
+        elif command == "backfill-messages":
+            await backfill_messages()
+        elif command == "compact-transcripts":
+            await compact_transcripts()
+        else:
+            raise SystemExit(f"Unknown command: {command}")
+    finally:
+        await close_db()
+
+
+if __name__ == "__main__":
+    asyncio.run(run_command(sys.argv[1] if len(sys.argv) > 1 else "upgrade"))
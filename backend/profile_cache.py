@@ -0,0 +1,71 @@
+"""In-process TTL/LRU cache of users' PersonalInfo data for the chat hot path
+
+Writers (the summary job and live extraction) call set_profile after
+committing, so this process never serves stale data - a miss whose DB read
+overlapped such a write is returned but not cached. Other worker processes
+see a change once their entry expires (PROFILE_CACHE_TTL).
+"""
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import PersonalInfo
+from config import PROFILE_CACHE_SIZE, PROFILE_CACHE_TTL
+
+# user_id -> (expires_at, personal_info_data or None when the user has no record)
+_cache: OrderedDict[int, Tuple[float, Optional[Dict]]] = OrderedDict()
+# Bumped by every set_profile - a miss only caches its DB read if no write landed meanwhile
+_generation = 0
+
+_stats = {
+    "hits": 0,
+    "misses": 0,
+    "stale_reads": 0,
+}
+
+
+def set_profile(user_id: int, personal_info_data: Optional[Dict]):
+    """Store a user's profile data (write-through after a DB update)"""
+    global _generation
+    _generation += 1
+    _store(user_id, personal_info_data)
+
+
+def _store(user_id: int, personal_info_data: Optional[Dict]):
+    _cache[user_id] = (time.monotonic() + PROFILE_CACHE_TTL, personal_info_data)
+    _cache.move_to_end(user_id)
+    while len(_cache) > PROFILE_CACHE_SIZE:
+        _cache.popitem(last=False)
+
+
+async def get_profile(db: AsyncSession, user_id: int) -> Optional[Dict]:
+    """Get a user's personal_info_data, from cache when fresh"""
+    entry = _cache.get(user_id)
+    if entry is not None and entry[0] > time.monotonic():
+        _stats["hits"] += 1
+        _cache.move_to_end(user_id)
+        return entry[1]
+
+    _stats["misses"] += 1
+    generation = _generation
+    result = await db.execute(select(PersonalInfo.personal_info_data).filter(PersonalInfo.user_id == user_id))
+    personal_info_data = result.scalars().first()
+    if generation != _generation:
+        # A writer stored a profile during the read, which may predate it - don't cache it
+        _stats["stale_reads"] += 1
+    else:
+        _store(user_id, personal_info_data)
+    return personal_info_data
+
+
+def get_profile_cache_stats() -> Dict:
+    """Hit/miss counters for the profile cache"""
+    lookups = _stats["hits"] + _stats["misses"]
+    return {
+        **_stats,
+        "hit_rate": round(_stats["hits"] / lookups, 4) if lookups else None,
+        "size": len(_cache),
+        "maxsize": PROFILE_CACHE_SIZE,
+        "ttl_seconds": PROFILE_CACHE_TTL,
+    }
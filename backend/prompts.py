@@ -1,14 +1,19 @@
-"""System prompt generation"""
-from typing import Optional
+"""System prompt generation
 
+The static instructions are a fixed, byte-identical prefix shared by every
+request, so upstream prompt-prefix caching can reuse them. All per-user
+context is appended after it.
+"""
+from functools import lru_cache
+from typing import Dict, Optional
+from config import PROMPT_CACHE_SIZE
+from tokens import estimate_tokens
 
-def get_system_prompt(profession: Optional[str] = None, personal_info: Optional[str] = None) -> str:
-    """Generate system prompt with user context"""
-    base_prompt = """
+# Never format or splice per-user text into this string - append after it instead
+STATIC_PROMPT = """
 Zia – Personal English Coach (Hinglish + Confidence Builder)
 ⸻
-<PersonalInfo>
-<Profession>
+The user's <PersonalInfo> and <Profession> are given in USER CONTEXT at the end of this prompt.
 ⸻
 🎯 FIRST-TIME USER CHECK (CRITICAL):
 
@@ -350,16 +355,48 @@ MOTIVATION BANK (rotate):
 "Practice karo - 1 mahine mein farak dikhega!"
 "Tumse ho jayega - **confidence** ki baat hai"
 """
-    
-    # Replace PersonalInfo placeholder
-    if personal_info:
-        base_prompt = base_prompt.replace("<PersonalInfo>", personal_info)
-    else:
-        base_prompt = base_prompt.replace("<PersonalInfo>", "Not provided yet")
+
+
+def _user_context(profession: Optional[str], personal_info: Optional[str]) -> str:
+    """Per-user block appended after the static prompt"""
+    user_context = (
+        "\n⸻\nUSER CONTEXT\n"
+        f"<PersonalInfo>: {personal_info or 'Not provided yet'}\n"
+        f"<Profession>: {profession or 'Not provided yet'}\n"
+        "⸻\n"
+    )
     
     # Add profession-specific context if available
     if profession:
-        profession_context = f"\n\n⸻\n**USER'S PROFESSION: {profession}**\n⸻\nTailor all responses to be relevant to this profession. Use profession-specific examples and scenarios.\n⸻\n"
-        base_prompt = base_prompt + profession_context
+        user_context += f"**USER'S PROFESSION: {profession}**\n⸻\nTailor all responses to be relevant to this profession. Use profession-specific examples and scenarios.\n⸻\n"
     
-    return base_prompt
+    return user_context
+
+
+@lru_cache(maxsize=PROMPT_CACHE_SIZE)
+def _render_prompt(profession: Optional[str], personal_info: Optional[str]) -> str:
+    """Render (and memoize) the full prompt for one user context"""
+    return STATIC_PROMPT + _user_context(profession, personal_info)
+
+
+def get_system_prompt(profession: Optional[str] = None, personal_info: Optional[str] = None) -> str:
+    """Generate system prompt with user context"""
+    # Empty strings and None render the same - share one cache entry
+    return _render_prompt(profession or None, personal_info or None)
+
+
+def get_prompt_stats() -> Dict:
+    """Prompt size and render cache statistics"""
+    cache = _render_prompt.cache_info()
+    lookups = cache.hits + cache.misses
+    return {
+        "static_prefix_chars": len(STATIC_PROMPT),
+        "static_prefix_tokens": estimate_tokens(STATIC_PROMPT),
+        "cache": {
+            "hits": cache.hits,
+            "misses": cache.misses,
+            "hit_rate": round(cache.hits / lookups, 4) if lookups else None,
+            "size": cache.currsize,
+            "maxsize": cache.maxsize,
+        },
+    }
@@ -0,0 +1,302 @@
+"""Pool of upstream LLM endpoints with latency-aware routing and failover
+
+Endpoints come from UPSTREAM_ENDPOINTS, a JSON list such as
+
+    [{"name": "eastus", "url": "https://eastus.openai.azure.com/openai/deployments/gpt-4o-mini/chat/completions?api-version=2025-01-01-preview",
+      "api_key": "...", "weight": 2, "rpm": 600, "tpm": 100000},
+     {"name": "local", "url": "http://localhost:9009", "api_key": "test", "type": "openai", "model": "gpt-4o-mini"}]
+
+Azure deployment URLs are used as-is with an api-key header; other URLs
+are OpenAI-compatible base URLs (POST {url}/chat/completions, bearer
+token, model in the body). Without UPSTREAM_ENDPOINTS the pool holds the
+single OPENAI_BASE_URL / OPENAI_API_KEY endpoint.
+
+Each request goes to the endpoint with the lowest score - EWMA latency plus
+its current queueing delay, scaled up by outstanding requests and recent
+error rate and down by weight. Endpoints that keep failing are skipped for
+a cool-down period, and failed attempts move on to the next endpoint.
+"""
+import asyncio
+import json
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Set, Tuple
+import httpx
+from config import (
+    OPENAI_API_KEY,
+    OPENAI_BASE_URL,
+    UPSTREAM_ENDPOINTS,
+    UPSTREAM_RPM,
+    UPSTREAM_TPM,
+    UPSTREAM_MAX_RETRIES,
+    UPSTREAM_BACKOFF_MAX,
+    UPSTREAM_FAILURE_THRESHOLD,
+    UPSTREAM_FAILURE_COOLDOWN,
+    SERVE_WORKER_COUNT,
+)
+from upstream import get_upstream_client, request_extensions
+from metrics import record_upstream
+from scheduler import (
+    UpstreamScheduler,
+    UpstreamRateLimitError,
+    INTERACTIVE,
+    estimate_request_tokens,
+    retry_after_seconds,
+    backoff_delay,
+)
+
+# Smoothing factors for the latency and error-rate moving averages
+LATENCY_ALPHA = 0.2
+ERROR_ALPHA = 0.2
+# How strongly recent errors push traffic away from an endpoint
+ERROR_PENALTY = 4.0
+# One-off pools kept for callers bringing their own key/URL, least recently used dropped first
+MAX_OVERRIDE_POOLS = 256
+
+
+def _worker_share(quota: int) -> int:
+    """This process's part of a per-endpoint quota - every worker enforces its own buckets"""
+    return max(1, quota // SERVE_WORKER_COUNT) if quota > 0 else 0
+
+
+class Endpoint:
+    """One Azure deployment or OpenAI-compatible base URL, with its own quota and health"""
+
+    def __init__(self, name: str, url: str, api_key: str, weight: float = 1.0, kind: Optional[str] = None,
+                 model: Optional[str] = None, rpm: int = UPSTREAM_RPM, tpm: int = UPSTREAM_TPM):
+        self.name = name
+        self.url = url
+        self.api_key = api_key
+        self.weight = max(weight, 0.01)
+        self.is_azure = (kind == "azure") if kind else "azure" in url.lower()
+        self.model = model
+        self.scheduler = UpstreamScheduler(_worker_share(rpm), _worker_share(tpm))
+        self.ewma_latency: Optional[float] = None
+        self.error_rate = 0.0
+        self.consecutive_failures = 0
+        self.cooldown_until = 0.0
+        self.in_flight = 0
+        self.requests = 0
+        self.failures = 0
+
+    def prepare(self, body: Dict, model: str) -> Tuple[str, Dict, Dict]:
+        """URL, headers and JSON body of a chat completion request to this endpoint"""
+        headers = {"Content-Type": "application/json"}
+        if self.is_azure:
+            # The deployment in the URL picks the model
+            headers["api-key"] = self.api_key
+            return self.url, headers, body
+        headers["Authorization"] = f"Bearer {self.api_key}"
+        return f"{self.url.rstrip('/')}/chat/completions", headers, {**body, "model": self.model or model}
+
+    def available(self) -> bool:
+        return time.monotonic() >= self.cooldown_until
+
+    def score(self, tokens: int, priority: int, default_latency: float) -> float:
+        """Expected cost of sending a request here - lower is better"""
+        latency = self.ewma_latency if self.ewma_latency is not None else default_latency
+        wait = max(0.0, self.scheduler.delay(tokens, priority))
+        load = 1 + self.in_flight + self.scheduler.queue_depth()
+        return (latency + wait) * load * (1 + ERROR_PENALTY * self.error_rate) / self.weight
+
+    def record_success(self, latency: float):
+        self.ewma_latency = latency if self.ewma_latency is None else (
+            LATENCY_ALPHA * latency + (1 - LATENCY_ALPHA) * self.ewma_latency
+        )
+        self.error_rate *= 1 - ERROR_ALPHA
+        self.consecutive_failures = 0
+
+    def record_failure(self):
+        self.failures += 1
+        self.error_rate = ERROR_ALPHA + (1 - ERROR_ALPHA) * self.error_rate
+        self.consecutive_failures += 1
+        if self.consecutive_failures >= UPSTREAM_FAILURE_THRESHOLD:
+            # Circuit open - other endpoints take the traffic until the cool-down ends
+            self.cooldown_until = time.monotonic() + UPSTREAM_FAILURE_COOLDOWN
+            self.consecutive_failures = 0
+
+    def get_stats(self) -> Dict:
+        return {
+            "name": self.name,
+            "azure": self.is_azure,
+            "weight": self.weight,
+            "ewma_latency_ms": round(self.ewma_latency * 1000, 1) if self.ewma_latency is not None else None,
+            "error_rate": round(self.error_rate, 3),
+            "in_flight": self.in_flight,
+            "requests": self.requests,
+            "failures": self.failures,
+            "cooling_down_seconds": round(max(0.0, self.cooldown_until - time.monotonic()), 1),
+        }
+
+
+class UpstreamPool:
+    """Routes requests across endpoints"""
+
+    def __init__(self, endpoints: List[Endpoint]):
+        if not endpoints:
+            raise ValueError("The upstream pool needs at least one endpoint")
+        self.endpoints = endpoints
+
+    def choose(self, tokens: int, priority: int, exclude: Set[str]) -> Endpoint:
+        """Best endpoint for a request, preferring ones not yet tried and not cooling down"""
+        candidates = [ep for ep in self.endpoints if ep.name not in exclude and ep.available()]
+        if not candidates:
+            candidates = [ep for ep in self.endpoints if ep.name not in exclude] or self.endpoints
+        measured = [ep.ewma_latency for ep in self.endpoints if ep.ewma_latency is not None]
+        # Unmeasured endpoints look as fast as the fastest one, so they get tried
+        default_latency = min(measured) if measured else 0.0
+        return min(candidates, key=lambda ep: ep.score(tokens, priority, default_latency))
+
+
+def _load_endpoints() -> List[Endpoint]:
+    if not UPSTREAM_ENDPOINTS:
+        return [Endpoint("default", OPENAI_BASE_URL, OPENAI_API_KEY)]
+    endpoints = []
+    for i, spec in enumerate(json.loads(UPSTREAM_ENDPOINTS)):
+        endpoints.append(Endpoint(
+            name=spec.get("name") or f"endpoint-{i}",
+            url=spec["url"],
+            api_key=spec.get("api_key") or OPENAI_API_KEY,
+            weight=float(spec.get("weight", 1)),
+            kind=spec.get("type"),
+            model=spec.get("model"),
+            rpm=int(spec.get("rpm", UPSTREAM_RPM)),
+            tpm=int(spec.get("tpm", UPSTREAM_TPM)),
+        ))
+    return endpoints
+
+
+_pool = UpstreamPool(_load_endpoints())
+_override_pools: "OrderedDict[Tuple[str, str], UpstreamPool]" = OrderedDict()
+
+
+def get_pool() -> UpstreamPool:
+    return _pool
+
+
+def has_credentials() -> bool:
+    """Whether every pooled endpoint has an API key"""
+    return all(ep.api_key for ep in _pool.endpoints)
+
+
+def _pool_for(api_key: Optional[str], api_url: Optional[str]) -> UpstreamPool:
+    """The shared pool, or a single-endpoint pool when a caller brings its own key/URL.
+
+    Override pools are kept per (url, key) so their latency and cool-down
+    state carry over between requests. One aimed at a pooled endpoint's URL
+    shares that endpoint's scheduler - same deployment, same quota and 429 pause.
+    """
+    if not api_key and not api_url:
+        return _pool
+    key = (api_url or OPENAI_BASE_URL, api_key or OPENAI_API_KEY)
+    pool = _override_pools.pop(key, None)
+    if pool is None:
+        endpoint = Endpoint("override", *key)
+        for pooled in _pool.endpoints:
+            if pooled.url == endpoint.url:
+                endpoint.scheduler = pooled.scheduler
+                break
+        pool = UpstreamPool([endpoint])
+    _override_pools[key] = pool
+    while len(_override_pools) > MAX_OVERRIDE_POOLS:
+        _override_pools.popitem(last=False)
+    return pool
+
+
+async def send_upstream(
+    body: Dict,
+    model: str = "gpt-3.5-turbo",
+    priority: int = INTERACTIVE,
+    stream: bool = False,
+    api_key: Optional[str] = None,
+    api_url: Optional[str] = None,
+    call_type: str = "chat"
+) -> httpx.Response:
+    """POST a chat completion request to the best endpoint, failing over and retrying 429/5xx.
+
+    body holds everything but the model (messages, temperature, max_tokens,
+    ...). Returns the final response, which may still be an error once
+    retries are exhausted. With stream=True the body is left unread and the
+    caller must aclose() the response. call_type labels the latency metrics.
+    """
+    pool = _pool_for(api_key, api_url)
+    estimated = estimate_request_tokens(body.get("messages", []), body.get("max_tokens", 0))
+    client = get_upstream_client()
+    tried: Set[str] = set()
+    attempt = 0
+    while True:
+        if len(tried) >= len(pool.endpoints):
+            tried.clear()  # Every endpoint has had a go - start over
+        endpoint = pool.choose(estimated, priority, tried)
+        tried.add(endpoint.name)
+        # No other endpoint left to fail over to in this round - back off before retrying
+        exhausted = len(tried) >= len(pool.endpoints)
+
+        paused_for = endpoint.scheduler.paused_for()
+        if priority == INTERACTIVE and paused_for > UPSTREAM_BACKOFF_MAX:
+            # Don't hold a user's request through a long quota pause - background work waits it out
+            if attempt >= UPSTREAM_MAX_RETRIES or exhausted:
+                raise UpstreamRateLimitError("OpenAI API rate limit exceeded, retry later", paused_for)
+            attempt += 1
+            continue
+        await endpoint.scheduler.acquire(estimated, priority)
+
+        url, headers, payload = endpoint.prepare(body, model)
+        request = client.build_request("POST", url, headers=headers, json=payload, extensions=request_extensions())
+        endpoint.in_flight += 1
+        endpoint.requests += 1
+        started = time.monotonic()
+        try:
+            response = await client.send(request, stream=stream)
+        except (httpx.ConnectError, httpx.ConnectTimeout):
+            # Never reached the upstream - safe to retry elsewhere
+            record_upstream(call_type, endpoint.name, "connect_error", time.monotonic() - started)
+            endpoint.record_failure()
+            endpoint.scheduler.count("connect_errors")
+            if attempt >= UPSTREAM_MAX_RETRIES:
+                raise
+            if exhausted:
+                await asyncio.sleep(backoff_delay(attempt))
+            attempt += 1
+            continue
+        except httpx.HTTPError:
+            # e.g. a read timeout - the request may have been processed, so it isn't retried
+            record_upstream(call_type, endpoint.name, "error", time.monotonic() - started)
+            raise
+        finally:
+            endpoint.in_flight -= 1
+
+        record_upstream(call_type, endpoint.name, response.status_code, time.monotonic() - started)
+        rate_limited = response.status_code == 429
+        if not rate_limited and response.status_code < 500:
+            endpoint.record_success(time.monotonic() - started)
+            return response
+
+        endpoint.record_failure()
+        endpoint.scheduler.count("rate_limited" if rate_limited else "server_errors")
+        retry_after = retry_after_seconds(response)
+        delay = retry_after if retry_after is not None else backoff_delay(attempt)
+        if rate_limited:
+            endpoint.scheduler.pause(delay)
+        if attempt >= UPSTREAM_MAX_RETRIES or (exhausted and delay > UPSTREAM_BACKOFF_MAX):
+            # Out of retries, or asked to wait longer than any caller should hang on
+            return response
+
+        if stream:
+            await response.aclose()
+        endpoint.scheduler.count("retries")
+        if exhausted and not rate_limited:
+            await asyncio.sleep(delay)
+        # Otherwise the next attempt fails over right away; after a 429 the pause
+        # holds back the endpoint's next acquire, which keeps priority order
+        attempt += 1
+
+
+def get_endpoint_stats() -> List[Dict]:
+    """Routing state of each pooled endpoint"""
+    return [ep.get_stats() for ep in _pool.endpoints]
+
+
+def get_scheduler_stats() -> Dict:
+    """Queue depth, wait times and retry counters of each endpoint's scheduler"""
+    return {ep.name: ep.scheduler.get_stats() for ep in _pool.endpoints}
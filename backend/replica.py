@@ -0,0 +1,141 @@
+"""Routing of read-only queries to the read replica (DATABASE_REPLICA_URL)
+
+Read routes (/sessions, /session/{id}, /active-session) take a session on
+the replica and ask read_db_for which one to actually use. They stay on the
+primary:
+
+- for REPLICA_READ_AFTER_WRITE seconds after the user wrote anything
+  through this process, so a client that saves and then reloads sees its
+  own write (a stale /active-session would otherwise be autosaved back
+  over the newer transcript), and
+- while the replica's replay lag is above REPLICA_MAX_LAG, it cannot be
+  measured (replica down), or the standby's WAL receiver is not streaming
+  (detached from the primary - it looks caught up but is arbitrarily
+  stale), re-checked every REPLICA_LAG_CHECK_INTERVAL. Reading the
+  receiver's status needs the pg_read_all_stats (or pg_monitor) role for
+  the replica's user; without it the replica counts as detached.
+
+Write tracking is per process: with several workers, a write handled by
+another worker is only covered by the lag limit.
+"""
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import engine, read_engine
+from config import REPLICA_READ_AFTER_WRITE, REPLICA_MAX_LAG, REPLICA_LAG_CHECK_INTERVAL
+
+# (standby?, WAL receiver streaming?, seconds since the last replayed transaction - 0 when the
+# replica has replayed all it received, which only means caught up while it is streaming)
+LAG_QUERY = text(
+    "SELECT pg_is_in_recovery(), "
+    "EXISTS (SELECT 1 FROM pg_stat_wal_receiver WHERE status = 'streaming'), "
+    "CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END"
+)
+MAX_TRACKED_WRITERS = 100000
+
+
+def replica_lag(standby: bool, streaming: bool, lag: Optional[float]) -> Optional[float]:
+    """Usable lag from LAG_QUERY's row, or None when the replica must not be read"""
+    if not standby:
+        return 0.0  # Not a standby (a local stand-in) - nothing to lag behind
+    if not streaming:
+        return None
+    return float(lag or 0)
+
+
+class ReplicaRouter:
+    def __init__(self, read_after_write: float, max_lag: float, check_interval: float):
+        self.read_after_write = read_after_write
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self._writes: "OrderedDict[int, float]" = OrderedDict()  # user_id -> time of last write, oldest first
+        self._lag: Optional[float] = None
+        self._checked_at = 0.0
+        self._problem: Optional[str] = None  # Last reason the replica was skipped, logged once
+        self._check_lock = asyncio.Lock()
+        self._stats = {"replica_reads": 0, "primary_after_write": 0, "primary_lagging": 0}
+
+    def note_write(self, user_id: int):
+        self._writes.pop(user_id, None)
+        self._writes[user_id] = time.monotonic()
+        cutoff = time.monotonic() - self.read_after_write
+        while self._writes:
+            oldest_user, written_at = next(iter(self._writes.items()))
+            if written_at > cutoff and len(self._writes) <= MAX_TRACKED_WRITERS:
+                break
+            del self._writes[oldest_user]
+
+    def wrote_recently(self, user_id: int) -> bool:
+        written_at = self._writes.get(user_id)
+        return written_at is not None and time.monotonic() - written_at < self.read_after_write
+
+    def _report(self, problem: Optional[str]):
+        if problem != self._problem:
+            print(f"⚠️ {problem}, reading from the primary" if problem else "✅ Read replica is usable again")
+            self._problem = problem
+
+    async def _measure_lag(self) -> Optional[float]:
+        if read_engine.dialect.name != "postgresql":
+            return 0.0
+        try:
+            async with read_engine.connect() as conn:
+                lag = replica_lag(*(await conn.execute(LAG_QUERY)).one())
+        except Exception as e:
+            self._report(f"Read replica unavailable ({e})")
+            return None
+        self._report("Read replica is not streaming from the primary" if lag is None else None)
+        return lag
+
+    async def replica_caught_up(self) -> bool:
+        if time.monotonic() - self._checked_at >= self.check_interval:
+            async with self._check_lock:
+                if time.monotonic() - self._checked_at >= self.check_interval:
+                    self._lag = await self._measure_lag()
+                    self._checked_at = time.monotonic()
+        return self._lag is not None and self._lag <= self.max_lag
+
+    async def use_replica(self, user_id: Optional[int]) -> bool:
+        if read_engine is engine:
+            return False
+        if user_id is not None and self.wrote_recently(user_id):
+            self._stats["primary_after_write"] += 1
+            return False
+        if not await self.replica_caught_up():
+            self._stats["primary_lagging"] += 1
+            return False
+        self._stats["replica_reads"] += 1
+        return True
+
+    def get_stats(self) -> Dict:
+        return {
+            "enabled": read_engine is not engine,
+            **self._stats,
+            "replica_lag_seconds": round(self._lag, 3) if self._lag is not None else None,
+            "recent_writers": len(self._writes),
+        }
+
+
+_router = ReplicaRouter(REPLICA_READ_AFTER_WRITE, REPLICA_MAX_LAG, REPLICA_LAG_CHECK_INTERVAL)
+
+
+def note_user_write(user_id: int):
+    """Record that a user's sessions changed - their reads stay on the primary for a while"""
+    _router.note_write(user_id)
+
+
+def user_wrote_recently(user_id: int) -> bool:
+    """Whether the user's reads still have to go to the primary"""
+    return _router.wrote_recently(user_id)
+
+
+async def read_db_for(user_id: Optional[int], db: AsyncSession, replica_db: AsyncSession) -> AsyncSession:
+    """The session a read of user_id's data should use: replica_db when that is safe, else db"""
+    return replica_db if await _router.use_replica(user_id) else db
+
+
+def get_replica_stats() -> Dict:
+    return _router.get_stats()
@@ -2,5 +2,7 @@
 from routes.auth import router as auth_router
 from routes.chat import router as chat_router
 from routes.sessions import router as sessions_router
+from routes.stats import router as stats_router
+from routes.jobs import router as jobs_router
 
-__all__ = ["auth_router", "chat_router", "sessions_router"]
+__all__ = ["auth_router", "chat_router", "sessions_router", "stats_router", "jobs_router"]
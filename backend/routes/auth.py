@@ -1,6 +1,7 @@
 """Authentication routes"""
 from fastapi import APIRouter, HTTPException, Depends
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from database import get_db, User
 from schemas import UserRegister, UserLogin, LoginResponse
 from auth import verify_password
@@ -9,10 +10,11 @@ router = APIRouter(tags=["auth"])
 
 
 @router.post("/register", response_model=LoginResponse)
-async def register(user_data: UserRegister, db: Session = Depends(get_db)):
+async def register(user_data: UserRegister, db: AsyncSession = Depends(get_db)):
     """Register a new user"""
     # Check if user already exists
-    existing_user = db.query(User).filter(User.email == user_data.email).first()
+    result = await db.execute(select(User).filter(User.email == user_data.email))
+    existing_user = result.scalars().first()
     if existing_user:
         raise HTTPException(status_code=400, detail="Email already registered")
     
@@ -23,17 +25,18 @@ async def register(user_data: UserRegister, db: Session = Depends(get_db)):
         password_hash=user_data.password  # Store plain password
     )
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
+    await db.refresh(db_user)
     
     return LoginResponse(user_id=db_user.id, message="Registration successful")
 
 
 @router.post("/login", response_model=LoginResponse)
-async def login(user_data: UserLogin, db: Session = Depends(get_db)):
+async def login(user_data: UserLogin, db: AsyncSession = Depends(get_db)):
     """Login user"""
     # Find user
-    user = db.query(User).filter(User.email == user_data.email).first()
+    result = await db.execute(select(User).filter(User.email == user_data.email))
+    user = result.scalars().first()
     if not user:
         raise HTTPException(status_code=401, detail="Incorrect email or password")
     
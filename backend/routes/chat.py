@@ -1,85 +1,176 @@
 """Chat routes"""
-from fastapi import APIRouter, HTTPException, Depends
-from sqlalchemy.orm import Session
-from database import get_db, PersonalInfo
-from schemas import ChatRequest, ChatResponse
+import asyncio
+import json
+from typing import Dict, List, Optional, Set, Tuple
+from fastapi import APIRouter, HTTPException, Depends, BackgroundTasks, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import get_db, SessionLocal, ChatSession, User
+from schemas import ChatRequest, ChatResponse, ChatSocketStart
 from prompts import get_system_prompt
-from utils import call_openai_api, extract_profession_and_info
+from utils import call_openai_api, stream_openai_api
+from live_extraction import should_extract, run_live_extraction
+from transcripts import load_transcript, append_messages
+from context import build_context, fold_rolling_summary
+from profile_cache import get_profile
+from scheduler import UpstreamRateLimitError, retry_after_header
+from providers import has_credentials
+from jobs import queue_session_summary, notify_workers
+from routes.sessions import active_session_query, check_session_open
+from write_behind import flush_session, flush_user_sessions
+from replica import note_user_write
+from config import OPENAI_BASE_URL
 import httpx
 
 router = APIRouter(tags=["chat"])
 
+# Post-turn work (live extraction, rolling summary) started by WebSocket turns
+_background: Set[asyncio.Task] = set()
 
-@router.post("/chat", response_model=ChatResponse)
-async def chat(
-    request: ChatRequest,
-    db: Session = Depends(get_db)
-):
-    """Send chat messages"""
-    from config import OPENAI_API_KEY, OPENAI_BASE_URL
-    
-    api_key = request.api_key or OPENAI_API_KEY
-    if not api_key:
+
+def _resolve_api_credentials(request):
+    """Get (API key, URL) for a chat request or socket - (None, None) routes through the endpoint pool"""
+    if request.api_key:
+        # Caller's own key, against the default endpoint
+        return request.api_key, OPENAI_BASE_URL
+    if not has_credentials():
         raise HTTPException(
             status_code=400, 
             detail="API key is required."
         )
+    return None, None
+
+
+async def _load_conversation(
+    request: ChatRequest,
+    db: AsyncSession
+) -> Tuple[List[Dict], List[Dict], Optional[ChatSession]]:
+    """Get (conversation, new turns to persist, stored session) for a chat request.
+
+    With client-held context the request carries the whole conversation and
+    nothing is persisted here. With server-held context the stored transcript
+    is loaded and the request's single new message appended to it.
+    """
+    if request.message is None:
+        return [{"role": msg.role, "content": msg.content} for msg in request.messages], [], None
     
-    api_url = OPENAI_BASE_URL
+    chat_session = None
+    history = []
+    if request.session_id is not None:
+        await flush_session(request.session_id)
+        chat_session = await db.get(ChatSession, request.session_id)
+        if not chat_session or chat_session.user_id != request.user_id:
+            raise HTTPException(status_code=404, detail="Session not found")
+        check_session_open(chat_session)
+        history = await load_transcript(db, chat_session)
     
-    # Get user's personal info and profession
-    personal_info_record = db.query(PersonalInfo).filter(PersonalInfo.user_id == request.user_id).first()
+    new_message = {"role": request.message.role, "content": request.message.content}
+    return history + [new_message], [new_message], chat_session
+
+
+async def _store_turn(db: AsyncSession, user_id: int, session_id: Optional[int], messages: List[Dict]) -> ChatSession:
+    """Append a completed turn to a session (a new one when session_id is None) and commit.
+
+    Raises 404/409 when the session is gone or was closed while the reply was generated.
+    """
+    if session_id is None:
+        chat_session = ChatSession(user_id=user_id, messages=[])
+        db.add(chat_session)
+        await db.flush()
+    else:
+        # An autosave may have arrived while the reply was generated
+        await flush_session(session_id)
+        result = await db.execute(select(ChatSession).filter(ChatSession.id == session_id).with_for_update())
+        chat_session = result.scalars().first()
+        if chat_session is None:
+            raise HTTPException(status_code=404, detail="Session not found")
+        check_session_open(chat_session)
+    
+    await append_messages(db, chat_session, messages)
+    await db.commit()
+    note_user_write(user_id)
+    return chat_session
+
+
+async def _persist_turn(db: AsyncSession, request: ChatRequest, new_messages: List[Dict], reply: str) -> Optional[int]:
+    """Store the user turn and the assistant reply (server-held context only). Returns the session id"""
+    if request.message is None:
+        return None
+    chat_session = await _store_turn(
+        db, request.user_id, request.session_id, new_messages + [{"role": "assistant", "content": reply}]
+    )
+    return chat_session.id
+
+
+async def _build_chat_messages(
+    request: ChatRequest,
+    conversation: List[Dict],
+    chat_session: Optional[ChatSession],
+    db: AsyncSession,
+    background_tasks: BackgroundTasks,
+    api_key: str,
+    api_url: str
+) -> List[Dict]:
+    """Build the upstream message list (system prompt with user context + conversation)"""
+    # Get user's personal info and profession (cached - changes rarely)
+    personal_info_data = await get_profile(db, request.user_id)
+    return _compose_messages(
+        request.user_id, personal_info_data, conversation, chat_session, background_tasks, api_key, api_url
+    )
+
+
+def _compose_messages(
+    user_id: int,
+    personal_info_data: Optional[Dict],
+    conversation: List[Dict],
+    chat_session: Optional[ChatSession],
+    background_tasks: BackgroundTasks,
+    api_key: str,
+    api_url: str
+) -> List[Dict]:
+    """Upstream message list for a user whose profile is already loaded"""
     profession = None
     personal_info_text = None
     
-    if personal_info_record:
-        personal_info_data = personal_info_record.personal_info_data
+    if personal_info_data:
         profession = personal_info_data.get("<Profession>", "") or personal_info_data.get("Profession", "")
         personal_info_text = personal_info_data.get("<PersonalInfo>", "") or personal_info_data.get("PersonalInfo", "")
     
-    # LIVE PROFESSION EXTRACTION: If profession not saved yet, try to extract from current messages
-    if not profession or profession == "":
-        # Check if we have enough messages to extract profession (at least 2-3 messages)
-        if len(request.messages) >= 2:
-            # Extract profession from current conversation
-            messages_dict = [{"role": msg.role, "content": msg.content} for msg in request.messages]
-            extracted_data = await extract_profession_and_info(messages_dict, api_key, api_url)
-            
-            extracted_profession = extracted_data.get("<Profession>", "").strip()
-            extracted_personal_info = extracted_data.get("<PersonalInfo>", "").strip()
-            
-            # If profession was extracted, save it immediately
-            if extracted_profession:
-                profession = extracted_profession
-                if personal_info_record:
-                    # Update existing - ensure we use the correct keys
-                    existing_data = personal_info_record.personal_info_data.copy() if personal_info_record.personal_info_data else {}
-                    existing_data["<Profession>"] = extracted_profession
-                    if extracted_personal_info:
-                        existing_data["<PersonalInfo>"] = extracted_personal_info
-                    personal_info_record.personal_info_data = existing_data
-                else:
-                    # Create new - use extracted_data directly (already has correct keys)
-                    personal_info_record = PersonalInfo(
-                        user_id=request.user_id,
-                        personal_info_data=extracted_data
-                    )
-                    db.add(personal_info_record)
-                db.commit()
-                db.refresh(personal_info_record)
-                personal_info_text = extracted_personal_info if extracted_personal_info else personal_info_text
-                print(f"✅ Saved profession '{extracted_profession}' for user {request.user_id}")
+    # LIVE PROFESSION EXTRACTION: If profession not saved yet, extract it after the reply is sent
+    # (debounced per user, so it does not re-run on every turn)
+    if not profession:
+        if should_extract(user_id, conversation):
+            background_tasks.add_task(run_live_extraction, user_id, conversation, api_key, api_url)
     
     # Get system prompt with user context
     system_prompt = get_system_prompt(profession, personal_info_text)
     
+    # Prepare messages with system prompt
+    messages = [{"role": "system", "content": system_prompt}]
+    
+    # Recent turns within the token budget; older ones via the session's rolling summary
+    context_messages, fold_upto = build_context(conversation, chat_session)
+    messages.extend(context_messages)
+    if fold_upto is not None:
+        background_tasks.add_task(fold_rolling_summary, chat_session.id, fold_upto, api_key, api_url)
+    return messages
+
+
+@router.post("/chat", response_model=ChatResponse)
+async def chat(
+    request: ChatRequest,
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(get_db)
+):
+    """Send chat messages"""
+    api_key, api_url = _resolve_api_credentials(request)
+    conversation, new_messages, chat_session = await _load_conversation(request, db)
+    messages = await _build_chat_messages(request, conversation, chat_session, db, background_tasks, api_key, api_url)
+    
     try:
-        # Prepare messages with system prompt
-        messages = [{"role": "system", "content": system_prompt}]
-        messages.extend([{"role": msg.role, "content": msg.content} for msg in request.messages])
-        
         # Call OpenAI API
-        assistant_message = await call_openai_api(
+        assistant_message, usage = await call_openai_api(
             messages=messages,
             api_key=api_key,
             api_url=api_url,
@@ -87,15 +178,303 @@ async def chat(
             temperature=request.temperature,
             max_tokens=request.max_tokens
         )
-        
-        return ChatResponse(
-            response=assistant_message,
-            usage=None
-        )
-        
+    except UpstreamRateLimitError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers=retry_after_header(e.retry_after))
     except httpx.TimeoutException:
         raise HTTPException(status_code=504, detail="Request to OpenAI timed out")
     except httpx.RequestError as e:
         raise HTTPException(status_code=500, detail=f"Network error: {str(e)}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    
+    session_id = await _persist_turn(db, request, new_messages, assistant_message)
+    
+    return ChatResponse(
+        response=assistant_message,
+        usage=usage,
+        session_id=session_id
+    )
+
+
+def _sse_event(data: Dict, event: str = None) -> str:
+    """Format a server-sent event"""
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
+
+
+def _upstream_error(e: Exception) -> Dict:
+    """Error payload for a failed upstream call on a streaming transport"""
+    if isinstance(e, UpstreamRateLimitError):
+        return {"detail": str(e), "retry_after": e.retry_after}
+    if isinstance(e, httpx.TimeoutException):
+        return {"detail": "Request to OpenAI timed out"}
+    if isinstance(e, httpx.RequestError):
+        return {"detail": f"Network error: {str(e)}"}
+    return {"detail": str(e)}
+
+
+@router.post("/chat/stream")
+async def chat_stream(
+    request: ChatRequest,
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(get_db)
+):
+    """Send chat messages and stream the reply as server-sent events.
+
+    Emits one `data: {"delta": "..."}` event per token, then
+    `event: done` with the full response, or `event: error` on failure.
+    """
+    api_key, api_url = _resolve_api_credentials(request)
+    conversation, new_messages, chat_session = await _load_conversation(request, db)
+    messages = await _build_chat_messages(request, conversation, chat_session, db, background_tasks, api_key, api_url)
+    
+    async def event_stream():
+        parts = []
+        usage = {}
+        try:
+            async for delta in stream_openai_api(
+                messages=messages,
+                api_key=api_key,
+                api_url=api_url,
+                model=request.model,
+                temperature=request.temperature,
+                max_tokens=request.max_tokens,
+                usage=usage
+            ):
+                parts.append(delta)
+                yield _sse_event({"delta": delta})
+        except Exception as e:
+            yield _sse_event(_upstream_error(e), event="error")
+            return
+        
+        reply = "".join(parts)
+        try:
+            # The request's DB session may already be closed while streaming - use a fresh one
+            async with SessionLocal() as stream_db:
+                session_id = await _persist_turn(stream_db, request, new_messages, reply)
+        except HTTPException as e:
+            yield _sse_event({"detail": e.detail, "status": e.status_code}, event="error")
+            return
+        except Exception as e:
+            yield _sse_event({"detail": f"Error saving session: {str(e)}"}, event="error")
+            return
+        
+        yield _sse_event({"response": reply, "usage": usage or None, "session_id": session_id}, event="done")
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+class ChatConnection:
+    """What a /ws/chat connection keeps between turns"""
+
+    def __init__(self, start: ChatSocketStart, api_key: Optional[str], api_url: Optional[str]):
+        self.user_id = start.user_id
+        self.model = start.model
+        self.temperature = start.temperature
+        self.max_tokens = start.max_tokens
+        self.api_key = api_key
+        self.api_url = api_url
+        self.profile: Optional[Dict] = None
+        self.chat_session: Optional[ChatSession] = None  # Created by the first stored turn if None
+        self.conversation: List[Dict] = []
+
+    def has_profession(self) -> bool:
+        return bool(self.profile and (self.profile.get("<Profession>") or self.profile.get("Profession")))
+
+
+async def _reject(websocket: WebSocket, detail: str):
+    await websocket.send_json({"type": "error", "detail": detail})
+    await websocket.close(code=1008)
+
+
+async def _open_chat_connection(websocket: WebSocket) -> Optional[ChatConnection]:
+    """Handle the start frame: check the user, load the profile and resume the session once"""
+    try:
+        start = ChatSocketStart.model_validate(json.loads(await websocket.receive_text()))
+        api_key, api_url = _resolve_api_credentials(start)
+    except ValueError as e:
+        await _reject(websocket, f"Invalid start message: {e}")
+        return None
+    except HTTPException as e:
+        await _reject(websocket, e.detail)
+        return None
+
+    connection = ChatConnection(start, api_key, api_url)
+    await flush_user_sessions(start.user_id)
+    async with SessionLocal() as db:
+        if await db.get(User, start.user_id) is None:
+            await _reject(websocket, "User not found")
+            return None
+        if start.session_id is not None:
+            chat_session = await db.get(ChatSession, start.session_id)
+            if not chat_session or chat_session.user_id != start.user_id:
+                await _reject(websocket, "Session not found")
+                return None
+            if chat_session.summarized_at is not None:
+                await _reject(websocket, "Session is closed - start a new one")
+                return None
+        else:
+            result = await db.execute(active_session_query(start.user_id))
+            chat_session = result.scalars().first()
+        if chat_session is not None:
+            connection.chat_session = chat_session
+            connection.conversation = await load_transcript(db, chat_session)
+        connection.profile = await get_profile(db, start.user_id)
+    return connection
+
+
+async def _refresh_conversation(connection: ChatConnection):
+    """Catch up with writes to the session from other tabs or transports since the last turn.
+
+    Raises HTTPException when the session was deleted or closed (logged out) meanwhile.
+    """
+    if connection.chat_session is None:
+        return
+    session_id = connection.chat_session.id
+    await flush_session(session_id)
+    async with SessionLocal() as db:
+        chat_session = await db.get(ChatSession, session_id)
+        if chat_session is None:
+            raise HTTPException(status_code=404, detail="Session not found")
+        check_session_open(chat_session)
+        if chat_session.message_count != len(connection.conversation):
+            connection.conversation = await load_transcript(db, chat_session)
+        connection.chat_session = chat_session
+
+
+async def _socket_turn(websocket: WebSocket, connection: ChatConnection, content):
+    """Stream one reply and store the turn"""
+    if not isinstance(content, str) or not content.strip():
+        await websocket.send_json({"type": "error", "detail": "'content' must be a non-empty string"})
+        return
+    try:
+        await _refresh_conversation(connection)
+    except HTTPException as e:
+        await websocket.send_json({"type": "error", "detail": e.detail, "status": e.status_code})
+        return
+    user_message = {"role": "user", "content": content}
+    conversation = connection.conversation + [user_message]
+
+    if not connection.has_profession():
+        # Live extraction may have found it since the last turn (usually a cache hit)
+        async with SessionLocal() as db:
+            connection.profile = await get_profile(db, connection.user_id)
+    background_tasks = BackgroundTasks()
+    messages = _compose_messages(
+        connection.user_id, connection.profile, conversation, connection.chat_session,
+        background_tasks, connection.api_key, connection.api_url
+    )
+
+    parts = []
+    usage = {}
+    try:
+        async for delta in stream_openai_api(
+            messages=messages,
+            api_key=connection.api_key,
+            api_url=connection.api_url,
+            model=connection.model,
+            temperature=connection.temperature,
+            max_tokens=connection.max_tokens,
+            usage=usage
+        ):
+            parts.append(delta)
+            await websocket.send_json({"type": "delta", "delta": delta})
+    except WebSocketDisconnect:
+        raise
+    except Exception as e:
+        await websocket.send_json({"type": "error", **_upstream_error(e)})
+        return
+
+    reply = {"role": "assistant", "content": "".join(parts)}
+    session_id = connection.chat_session.id if connection.chat_session else None
+    try:
+        async with SessionLocal() as db:
+            connection.chat_session = await _store_turn(db, connection.user_id, session_id, [user_message, reply])
+    except HTTPException as e:
+        await websocket.send_json({"type": "error", "detail": e.detail, "status": e.status_code})
+        return
+    except Exception as e:
+        await websocket.send_json({"type": "error", "detail": f"Error saving session: {str(e)}"})
+        return
+    connection.conversation = conversation + [reply]
+    await websocket.send_json({
+        "type": "done",
+        "response": reply["content"],
+        "usage": usage or None,
+        "session_id": connection.chat_session.id
+    })
+
+    task = asyncio.create_task(background_tasks())
+    _background.add(task)
+    task.add_done_callback(_background.discard)
+
+
+async def _socket_logout(websocket: WebSocket, connection: ChatConnection):
+    """Close the session and queue its summary, like /save-session with generate_summary"""
+    job = None
+    if connection.chat_session is not None:
+        async with SessionLocal() as db:
+            result = await db.execute(
+                select(ChatSession).filter(ChatSession.id == connection.chat_session.id).with_for_update()
+            )
+            chat_session = result.scalars().first()
+            if chat_session is not None and chat_session.summarized_at is None:
+                job = await queue_session_summary(db, chat_session, connection.user_id)
+                await db.commit()
+                notify_workers()
+    await websocket.send_json({
+        "type": "logged_out",
+        "session_id": connection.chat_session.id if connection.chat_session else None,
+        "job_id": job.id if job else None
+    })
+    await websocket.close()
+
+
+@router.websocket("/ws/chat")
+async def chat_socket(websocket: WebSocket):
+    """Chat over one long-lived connection that keeps the user, profile and session between turns.
+
+    Client frames (JSON):
+        {"type": "start", "user_id": 1, "session_id": null, ...}   first; see ChatSocketStart
+        {"type": "message", "content": "..."}
+        {"type": "logout"}
+    Server frames:
+        {"type": "ready", "session_id", "messages"}   the resumed transcript
+        {"type": "delta", "delta"}                    one per token
+        {"type": "done", "response", "usage", "session_id"}   the turn has been stored
+        {"type": "error", "detail", ...}
+        {"type": "logged_out", "session_id", "job_id"}   then the server closes
+
+    Turns run one at a time; messages sent during a reply wait for it to finish.
+    """
+    await websocket.accept()
+    try:
+        connection = await _open_chat_connection(websocket)
+        if connection is None:
+            return
+        await websocket.send_json({
+            "type": "ready",
+            "session_id": connection.chat_session.id if connection.chat_session else None,
+            "messages": connection.conversation
+        })
+
+        while True:
+            try:
+                frame = json.loads(await websocket.receive_text())
+            except ValueError:
+                await websocket.send_json({"type": "error", "detail": "Frames must be JSON"})
+                continue
+            kind = frame.get("type") if isinstance(frame, dict) else None
+            if kind == "message":
+                await _socket_turn(websocket, connection, frame.get("content"))
+            elif kind == "logout":
+                await _socket_logout(websocket, connection)
+                return
+            else:
+                await websocket.send_json({"type": "error", "detail": f"Unknown message type: {kind}"})
+    except WebSocketDisconnect:
+        pass
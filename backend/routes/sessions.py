@@ -1,73 +1,82 @@
 """Session management routes"""
-from fastapi import APIRouter, HTTPException, Depends
-from sqlalchemy.orm import Session
-from database import get_db, ChatSession, Summary, PersonalInfo
-from schemas import SaveSessionRequest, UpdateSessionRequest
-from utils import extract_summary, extract_profession_and_info
-from config import OPENAI_API_KEY, OPENAI_BASE_URL
+import json
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+from fastapi import APIRouter, HTTPException, Depends, Query
+from fastapi.responses import Response
+from sqlalchemy import select, and_, or_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload, joinedload, load_only
+from database import get_db, get_read_db, ChatSession, Summary
+from schemas import SaveSessionRequest, UpdateSessionRequest, AppendMessagesRequest
+from transcripts import load_transcript_json, append_messages, replace_transcript
+from jobs import queue_session_summary, notify_workers
+from write_behind import buffer_transcript, buffered_session_owner, flush_session, flush_user_sessions
+from replica import note_user_write, read_db_for, user_wrote_recently
+from config import SESSIONS_PAGE_SIZE, SESSIONS_MAX_PAGE_SIZE, WRITE_BEHIND_ENABLED
 
 router = APIRouter(tags=["sessions"])
 
+# Columns load_transcript_json needs - the transcript itself is never loaded through the ORM
+TRANSCRIPT_LOCATOR = (ChatSession.id, ChatSession.user_id, ChatSession.message_count, ChatSession.transcript_codec)
+
+
+class TranscriptResponse(Response):
+    """JSON object whose "messages" is an already-encoded transcript, embedded as-is"""
+    media_type = "application/json"
+
+    def __init__(self, fields: Dict, messages_json: bytes, **kwargs):
+        head = json.dumps(fields, ensure_ascii=False, separators=(",", ":"))[:-1]
+        if fields:
+            head += ","
+        # One join - a transcript can be megabytes, so don't copy it more than once
+        super().__init__(content=b"".join((head.encode("utf-8"), b'"messages":', messages_json, b"}")), **kwargs)
+
+
+def check_session_open(session: ChatSession):
+    """Closed (logged out) sessions have been summarized already - messages added now would never be"""
+    if session.summarized_at is not None:
+        raise HTTPException(status_code=409, detail="Session is closed - start a new one")
+
 
 @router.post("/save-session")
 async def save_session(
     session_data: SaveSessionRequest,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
-    """Save chat session. Generate summary only if generate_summary=True (logout)"""
+    """Save chat session. Queue summary generation only if generate_summary=True (logout)"""
     try:
+        # Buffered autosaves go in first, so the active session is found and updated on top of them
+        await flush_user_sessions(session_data.user_id)
+        note_user_write(session_data.user_id)
         # Convert messages to dict format
         messages_dict = [{"role": msg.role, "content": msg.content} for msg in session_data.messages]
         
         # Check if there's an active session (without summary) to update
-        active_session = db.query(ChatSession).filter(
-            ChatSession.user_id == session_data.user_id
-        ).outerjoin(Summary).filter(Summary.id == None).order_by(ChatSession.updated_at.desc()).first()
+        result = await db.execute(select(ChatSession).filter(
+            ChatSession.user_id == session_data.user_id,
+            ChatSession.summarized_at == None
+        ).order_by(ChatSession.updated_at.desc()).limit(1).with_for_update())
+        active_session = result.scalars().first()
         
         if active_session:
-            # Update existing active session
-            active_session.messages = messages_dict
-            db.commit()
-            db.refresh(active_session)
+            # Update existing active session (only the new tail is written)
+            await replace_transcript(db, active_session, messages_dict)
+            await db.commit()
+            await db.refresh(active_session)
             chat_session = active_session
             
-            # If generating summary (logout), generate it for this updated session
+            # If generating summary (logout), queue it for this updated session
             if session_data.generate_summary:
-                # Extract summary
-                summary_data = await extract_summary(messages_dict, OPENAI_API_KEY, OPENAI_BASE_URL)
-                summary = Summary(
-                    chat_session_id=chat_session.id,
-                    user_id=session_data.user_id,
-                    summary_data=summary_data
-                )
-                db.add(summary)
-                
-                # Extract profession and personal info
-                extracted_data = await extract_profession_and_info(messages_dict, OPENAI_API_KEY, OPENAI_BASE_URL)
-                
-                # Update or create personal info
-                personal_info = db.query(PersonalInfo).filter(PersonalInfo.user_id == session_data.user_id).first()
-                if personal_info:
-                    # Merge with existing data - ensure we preserve existing keys
-                    existing_data = personal_info.personal_info_data.copy() if personal_info.personal_info_data else {}
-                    # Update with extracted data (which has <Profession> and <PersonalInfo> keys)
-                    existing_data.update(extracted_data)
-                    personal_info.personal_info_data = existing_data
-                    print(f"✅ Updated profession '{extracted_data.get('<Profession>', '')}' for user {session_data.user_id} on logout")
-                else:
-                    personal_info = PersonalInfo(
-                        user_id=session_data.user_id,
-                        personal_info_data=extracted_data
-                    )
-                    db.add(personal_info)
-                    print(f"✅ Created profession '{extracted_data.get('<Profession>', '')}' for user {session_data.user_id} on logout")
-                
-                db.commit()
+                job = await queue_session_summary(db, chat_session, session_data.user_id)
+                await db.commit()
+                notify_workers()
                 return {
-                    "message": "Session updated and summary generated",
+                    "message": "Session updated and summary queued",
                     "session_id": chat_session.id,
-                    "summary": summary_data,
-                    "personal_info": extracted_data
+                    "job_id": job.id,
+                    "summary": None,
+                    "personal_info": None
                 }
             else:
                 # Just update, no summary (refresh case)
@@ -79,75 +88,78 @@ async def save_session(
         # No active session - create new one
         chat_session = ChatSession(
             user_id=session_data.user_id,
-            messages=messages_dict
+            messages=[]
         )
         db.add(chat_session)
-        db.commit()
-        db.refresh(chat_session)
+        await db.flush()
+        await append_messages(db, chat_session, messages_dict)
+        await db.commit()
+        await db.refresh(chat_session)
         
         # Only generate summary on logout (generate_summary=True)
-        summary_data = None
-        extracted_data = None
+        job = None
         if session_data.generate_summary:
-            # Extract summary
-            summary_data = await extract_summary(messages_dict, OPENAI_API_KEY, OPENAI_BASE_URL)
-            summary = Summary(
-                chat_session_id=chat_session.id,
-                user_id=session_data.user_id,
-                summary_data=summary_data
-            )
-            db.add(summary)
-            
-            # Extract profession and personal info
-            extracted_data = await extract_profession_and_info(messages_dict, OPENAI_API_KEY, OPENAI_BASE_URL)
-            
-            # Update or create personal info
-            personal_info = db.query(PersonalInfo).filter(PersonalInfo.user_id == session_data.user_id).first()
-            if personal_info:
-                # Merge with existing data - ensure we preserve existing keys
-                existing_data = personal_info.personal_info_data.copy() if personal_info.personal_info_data else {}
-                # Update with extracted data (which has <Profession> and <PersonalInfo> keys)
-                existing_data.update(extracted_data)
-                personal_info.personal_info_data = existing_data
-                print(f"✅ Updated profession '{extracted_data.get('<Profession>', '')}' for user {session_data.user_id} on logout")
-            else:
-                personal_info = PersonalInfo(
-                    user_id=session_data.user_id,
-                    personal_info_data=extracted_data
-                )
-                db.add(personal_info)
-                print(f"✅ Created profession '{extracted_data.get('<Profession>', '')}' for user {session_data.user_id} on logout")
-        
-        db.commit()
+            job = await queue_session_summary(db, chat_session, session_data.user_id)
+            await db.commit()
+            notify_workers()
         
         return {
             "message": "Session saved successfully",
             "session_id": chat_session.id,
-            "summary": summary_data,
-            "personal_info": extracted_data
+            "job_id": job.id if job else None,
+            "summary": None,
+            "personal_info": None
         }
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=f"Error saving session: {str(e)}")
 
 
+async def _buffer_session_update(session_id: int, session_data: UpdateSessionRequest, db: AsyncSession):
+    """Write-behind variant of update_session - buffer the transcript instead of committing it"""
+    user_id = buffered_session_owner(session_id)
+    base_count = None  # Already buffered - the entry keeps the count it was first buffered on
+    if user_id is None:
+        result = await db.execute(
+            select(ChatSession.user_id, ChatSession.message_count).filter(ChatSession.id == session_id)
+        )
+        row = result.first()
+        if row is None:
+            raise HTTPException(status_code=404, detail="Session not found")
+        user_id, base_count = row
+    
+    messages_dict = [{"role": msg.role, "content": msg.content} for msg in session_data.messages]
+    try:
+        await buffer_transcript(session_id, user_id, messages_dict, base_count)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error updating session: {str(e)}")
+    return {
+        "message": "Session updated successfully",
+        "session_id": session_id
+    }
+
+
 @router.put("/update-session/{session_id}")
 async def update_session(
     session_id: int,
     session_data: UpdateSessionRequest,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Update an existing session with new messages"""
+    if WRITE_BEHIND_ENABLED:
+        return await _buffer_session_update(session_id, session_data, db)
     try:
-        session = db.query(ChatSession).filter(ChatSession.id == session_id).first()
+        result = await db.execute(select(ChatSession).filter(ChatSession.id == session_id).with_for_update())
+        session = result.scalars().first()
         if not session:
             raise HTTPException(status_code=404, detail="Session not found")
         
         # Convert messages to dict format
         messages_dict = [{"role": msg.role, "content": msg.content} for msg in session_data.messages]
-        session.messages = messages_dict
-        db.commit()
-        db.refresh(session)
+        await replace_transcript(db, session, messages_dict)
+        await db.commit()
+        await db.refresh(session)
+        note_user_write(session.user_id)
         
         return {
             "message": "Session updated successfully",
@@ -156,14 +168,64 @@ async def update_session(
     except HTTPException:
         raise
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=f"Error updating session: {str(e)}")
 
 
+@router.post("/session/{session_id}/messages")
+async def append_session_messages(
+    session_id: int,
+    session_data: AppendMessagesRequest,
+    db: AsyncSession = Depends(get_db)
+):
+    """Append only the new messages to a session's transcript"""
+    try:
+        await flush_session(session_id)
+        result = await db.execute(select(ChatSession).filter(ChatSession.id == session_id).with_for_update())
+        session = result.scalars().first()
+        if not session:
+            raise HTTPException(status_code=404, detail="Session not found")
+        check_session_open(session)
+        
+        stored_count = session.message_count or len(session.messages or [])
+        if session_data.expected_count is not None and session_data.expected_count != stored_count:
+            raise HTTPException(
+                status_code=409,
+                detail=f"Session has {stored_count} messages, expected {session_data.expected_count}"
+            )
+        
+        messages_dict = [{"role": msg.role, "content": msg.content} for msg in session_data.messages]
+        message_count = await append_messages(db, session, messages_dict)
+        await db.commit()
+        note_user_write(session.user_id)
+        
+        return {
+            "message": "Messages appended successfully",
+            "session_id": session.id,
+            "message_count": message_count
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        await db.rollback()
+        raise HTTPException(status_code=500, detail=f"Error appending messages: {str(e)}")
+
+
+def active_session_query(user_id: int):
+    """The user's newest session that is neither summarized nor older than 24 hours"""
+    cutoff_time = datetime.utcnow() - timedelta(hours=24)
+    return select(ChatSession).filter(
+        ChatSession.user_id == user_id,
+        ChatSession.summarized_at == None,
+        ChatSession.updated_at >= cutoff_time
+    ).order_by(ChatSession.updated_at.desc()).limit(1)
+
+
 @router.get("/active-session/{user_id}")
 async def get_active_session(
     user_id: int,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db),
+    replica_db: AsyncSession = Depends(get_read_db)
 ):
     """Get the active session (without summary) for a user"""
     # IMPORTANT: Only return sessions that:
@@ -171,13 +233,10 @@ async def get_active_session(
     # 2. Don't have a summary (not logged out yet)
     # 3. Were created/updated recently (within last 24 hours) - prevents loading very old sessions
     
-    from datetime import datetime, timedelta
-    cutoff_time = datetime.utcnow() - timedelta(hours=24)
-    
-    active_session = db.query(ChatSession).filter(
-        ChatSession.user_id == user_id,
-        ChatSession.updated_at >= cutoff_time
-    ).outerjoin(Summary).filter(Summary.id == None).order_by(ChatSession.updated_at.desc()).first()
+    await flush_user_sessions(user_id)
+    db = await read_db_for(user_id, db, replica_db)
+    result = await db.execute(active_session_query(user_id).options(load_only(*TRANSCRIPT_LOCATOR)))
+    active_session = result.scalars().first()
     
     if not active_session:
         return {"session_id": None, "messages": []}
@@ -186,19 +245,59 @@ async def get_active_session(
     if active_session.user_id != user_id:
         return {"session_id": None, "messages": []}
     
-    return {
-        "session_id": active_session.id,
-        "messages": active_session.messages
-    }
+    return TranscriptResponse({"session_id": active_session.id}, await load_transcript_json(db, active_session))
+
+
+def _encode_cursor(chat_session: ChatSession) -> str:
+    """Keyset cursor for the page after this session"""
+    return f"{chat_session.created_at.isoformat()},{chat_session.id}"
+
+
+def _decode_cursor(cursor: str):
+    """Parse a cursor from _encode_cursor into (created_at, id)"""
+    try:
+        created_at, session_id = cursor.rsplit(",", 1)
+        return datetime.fromisoformat(created_at), int(session_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
 
 
 @router.get("/sessions/{user_id}")
 async def get_sessions(
     user_id: int,
-    db: Session = Depends(get_db)
+    limit: int = Query(SESSIONS_PAGE_SIZE, ge=1, le=SESSIONS_MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_db),
+    replica_db: AsyncSession = Depends(get_read_db)
 ):
-    """Get all chat sessions for a user"""
-    sessions = db.query(ChatSession).filter(ChatSession.user_id == user_id).order_by(ChatSession.created_at.desc()).all()
+    """Get a user's chat sessions, newest first, one page at a time.
+
+    Pass the returned next_cursor back as cursor to get the following page.
+    Transcripts are not loaded - use /session/{session_id} for those.
+    """
+    await flush_user_sessions(user_id)
+    db = await read_db_for(user_id, db, replica_db)
+    query = (
+        select(ChatSession)
+        .filter(ChatSession.user_id == user_id)
+        .options(
+            load_only(ChatSession.id, ChatSession.created_at, ChatSession.updated_at),
+            joinedload(ChatSession.summary).load_only(Summary.summary_data),
+        )
+        .order_by(ChatSession.created_at.desc(), ChatSession.id.desc())
+        .limit(limit + 1)
+    )
+    if cursor:
+        created_at, session_id = _decode_cursor(cursor)
+        query = query.filter(or_(
+            ChatSession.created_at < created_at,
+            and_(ChatSession.created_at == created_at, ChatSession.id < session_id)
+        ))
+
+    result = await db.execute(query)
+    sessions = result.scalars().all()
+    has_more = len(sessions) > limit
+    sessions = sessions[:limit]
     return {
         "sessions": [
             {
@@ -208,25 +307,45 @@ async def get_sessions(
                 "summary": session.summary.summary_data if session.summary else None
             }
             for session in sessions
-        ]
+        ],
+        "next_cursor": _encode_cursor(sessions[-1]) if has_more else None
     }
 
 
+async def _find_session(db: AsyncSession, session_id: int) -> Optional[ChatSession]:
+    result = await db.execute(
+        select(ChatSession)
+        .filter(ChatSession.id == session_id)
+        .options(
+            load_only(*TRANSCRIPT_LOCATOR, ChatSession.created_at, ChatSession.updated_at),
+            selectinload(ChatSession.summary)
+        )
+    )
+    return result.scalars().first()
+
+
 @router.get("/session/{session_id}")
 async def get_session(
     session_id: int,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db),
+    replica_db: AsyncSession = Depends(get_read_db)
 ):
     """Get a specific chat session"""
-    session = db.query(ChatSession).filter(ChatSession.id == session_id).first()
+    await flush_session(session_id)
+    # The owner is only known once the session is found - check for their recent writes afterwards
+    reader = await read_db_for(None, db, replica_db)
+    session = await _find_session(reader, session_id)
+    if reader is not db and (session is None or user_wrote_recently(session.user_id)):
+        # Possibly created or changed after the replica's copy
+        reader = db
+        session = await _find_session(db, session_id)
     
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
     
-    return {
+    return TranscriptResponse({
         "id": session.id,
-        "messages": session.messages,
         "created_at": session.created_at.isoformat(),
         "updated_at": session.updated_at.isoformat(),
         "summary": session.summary.summary_data if session.summary else None
-    }
+    }, await load_transcript_json(reader, session))
@@ -0,0 +1,75 @@
+"""Runtime statistics routes"""
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from upstream import get_pool_stats
+from prompts import get_prompt_stats
+from profile_cache import get_profile_cache_stats
+from completion_cache import get_completion_cache_stats
+from providers import get_scheduler_stats, get_endpoint_stats
+from singleflight import get_singleflight_stats
+from metrics import render_metrics
+from write_behind import get_write_behind_stats
+from database import get_db_pool_stats
+from replica import get_replica_stats
+
+router = APIRouter(tags=["stats"])
+
+
+@router.get("/stats/upstream")
+async def upstream_stats():
+    """Connection pool statistics for upstream LLM calls"""
+    return get_pool_stats()
+
+
+@router.get("/stats/prompt")
+async def prompt_stats():
+    """System prompt size and render cache statistics"""
+    return get_prompt_stats()
+
+
+@router.get("/stats/profile-cache")
+async def profile_cache_stats():
+    """Hit/miss counters for the user profile cache"""
+    return get_profile_cache_stats()
+
+
+@router.get("/stats/completion-cache")
+async def completion_cache_stats():
+    """Hit-rate metrics for the temperature-0 completion cache"""
+    return get_completion_cache_stats()
+
+
+@router.get("/stats/scheduler")
+async def scheduler_stats():
+    """Queue depth, wait times and retries of each endpoint's rate-limit scheduler"""
+    return get_scheduler_stats()
+
+
+@router.get("/stats/singleflight")
+async def singleflight_stats():
+    """Calls run vs shared by single-flight coalescing"""
+    return get_singleflight_stats()
+
+
+@router.get("/stats/endpoints")
+async def endpoint_stats():
+    """Latency, error rate and load of each upstream endpoint"""
+    return get_endpoint_stats()
+
+
+@router.get("/stats/write-behind")
+async def write_behind_stats():
+    """Buffered autosaves, flushes and how many writes were coalesced"""
+    return get_write_behind_stats()
+
+
+@router.get("/stats/db")
+async def db_stats():
+    """Database pool usage and how reads were routed between primary and replica"""
+    return {"pools": get_db_pool_stats(), "read_routing": get_replica_stats()}
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus scrape endpoint"""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,200 @@
+"""Rate-limit-aware scheduling of upstream LLM requests
+
+Each upstream endpoint (see providers.py) has its own scheduler. Requests wait for capacity in two token buckets - requests per minute and
+estimated tokens per minute (prompt + max_tokens, the same estimate Azure
+OpenAI's rate limiter uses) - and are admitted in priority order, so
+interactive chat goes ahead of background summarization and extraction.
+
+Responses with 429 or 5xx are retried (providers.send_upstream) with
+jittered exponential backoff, honouring Retry-After. A 429 also pauses the
+endpoint's admissions for every request, since the quota is shared by the
+whole deployment.
+"""
+import asyncio
+import heapq
+import itertools
+import math
+import random
+import time
+from collections import deque
+from typing import Dict, List, Optional
+import httpx
+from tokens import conversation_tokens
+from config import UPSTREAM_BACKOFF_BASE, UPSTREAM_BACKOFF_MAX, UPSTREAM_BACKGROUND_RESERVE
+
+# Priority classes - lower is admitted first
+INTERACTIVE = 0
+BACKGROUND = 1
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BACKGROUND: "background"}
+
+# Quotas are enforced over short windows, so allow at most this many seconds' worth of burst
+BURST_SECONDS = 10
+
+
+class UpstreamRateLimitError(Exception):
+    """Upstream still answered 429 after all retries (or asked to wait longer than we retry for)"""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """Continuously refilling token bucket holding at most BURST_SECONDS of quota"""
+
+    def __init__(self, per_minute: int):
+        self.rate = per_minute / 60
+        self.capacity = max(1.0, self.rate * BURST_SECONDS)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, amount: float, reserve: float = 0.0) -> float:
+        """Seconds until `amount` tokens are available while leaving `reserve` (a fraction of capacity) untouched"""
+        self._refill()
+        needed = min(amount + reserve * self.capacity, self.capacity)
+        return 0.0 if self.tokens >= needed else (needed - self.tokens) / self.rate
+
+    def take(self, amount: float):
+        self._refill()
+        self.tokens -= min(amount, self.capacity)
+
+
+class UpstreamScheduler:
+    """Admits upstream requests in priority order as the RPM/TPM buckets allow"""
+
+    def __init__(self, rpm: int, tpm: int):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.requests = TokenBucket(rpm) if rpm > 0 else None
+        self.tokens = TokenBucket(tpm) if tpm > 0 else None
+        self._waiting: List = []  # heap of (priority, seq)
+        self._seq = itertools.count()
+        self._cond = asyncio.Condition()
+        self._paused_until = 0.0
+        self._waits = {priority: deque(maxlen=1000) for priority in PRIORITY_NAMES}
+        self._stats = {
+            "admitted": 0,
+            "retries": 0,
+            "rate_limited": 0,
+            "server_errors": 0,
+            "connect_errors": 0,
+        }
+
+    def delay(self, tokens: int, priority: int) -> float:
+        """Seconds until a request of this size and priority may be admitted"""
+        # Background work leaves part of each bucket free for bursts of chat
+        reserve = UPSTREAM_BACKGROUND_RESERVE if priority != INTERACTIVE else 0.0
+        delay = self._paused_until - time.monotonic()
+        if self.requests:
+            delay = max(delay, self.requests.delay(1, reserve))
+        if self.tokens:
+            delay = max(delay, self.tokens.delay(tokens, reserve))
+        return delay
+
+    async def acquire(self, tokens: int, priority: int = INTERACTIVE):
+        """Wait until a request may be sent, then take its share of the buckets"""
+        started = time.monotonic()
+        entry = (priority, next(self._seq))
+        async with self._cond:
+            heapq.heappush(self._waiting, entry)
+            try:
+                while True:
+                    timeout = None
+                    if self._waiting[0] == entry:
+                        timeout = self.delay(tokens, priority)
+                        if timeout <= 0:
+                            break
+                    try:
+                        await asyncio.wait_for(self._cond.wait(), timeout)
+                    except asyncio.TimeoutError:
+                        pass
+            finally:
+                # Admitted or cancelled - either way, let the next in line re-check
+                self._waiting.remove(entry)
+                heapq.heapify(self._waiting)
+                self._cond.notify_all()
+
+            if self.requests:
+                self.requests.take(1)
+            if self.tokens:
+                self.tokens.take(tokens)
+        self._stats["admitted"] += 1
+        self._waits[priority].append(time.monotonic() - started)
+
+    def count(self, name: str):
+        self._stats[name] += 1
+
+    def pause(self, seconds: float):
+        """Hold back all admissions for a while (after a 429)"""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def paused_for(self) -> float:
+        """Seconds left of the current pause"""
+        return max(0.0, self._paused_until - time.monotonic())
+
+    def queue_depth(self) -> int:
+        return len(self._waiting)
+
+    def get_stats(self) -> Dict:
+        queued = {name: 0 for name in PRIORITY_NAMES.values()}
+        for priority, _ in self._waiting:
+            queued[PRIORITY_NAMES[priority]] += 1
+        waits = {}
+        for priority, samples in self._waits.items():
+            ordered = sorted(samples)
+            waits[PRIORITY_NAMES[priority]] = {
+                "samples": len(ordered),
+                "p50_ms": round(ordered[len(ordered) // 2] * 1000, 1) if ordered else None,
+                "p95_ms": round(ordered[int(len(ordered) * 0.95)] * 1000, 1) if ordered else None,
+                "max_ms": round(ordered[-1] * 1000, 1) if ordered else None,
+            }
+        return {
+            **self._stats,
+            "queue_depth": queued,
+            "wait": waits,
+            "paused_for_seconds": round(self.paused_for(), 2),
+            "rpm_limit": self.rpm or None,
+            "tpm_limit": self.tpm or None,
+            "rpm_available": int(self.requests.tokens) if self.requests else None,
+            "tpm_available": int(self.tokens.tokens) if self.tokens else None,
+        }
+
+
+def estimate_request_tokens(messages: List[Dict], max_tokens: int) -> int:
+    """Estimated prompt tokens plus the completion allowance"""
+    return conversation_tokens(messages) + (max_tokens or 0)
+
+
+def retry_after_seconds(response: httpx.Response) -> Optional[float]:
+    """Delay requested by the upstream (Retry-After / retry-after-ms), if any"""
+    for header, scale in (("retry-after-ms", 0.001), ("retry-after", 1.0)):
+        value = response.headers.get(header)
+        if value:
+            try:
+                return max(0.0, float(value) * scale)
+            except ValueError:
+                pass  # HTTP-date form - fall back to our own backoff
+    return None
+
+
+def backoff_delay(attempt: int) -> float:
+    """Full-jitter exponential backoff"""
+    return random.uniform(0, min(UPSTREAM_BACKOFF_MAX, UPSTREAM_BACKOFF_BASE * 2 ** attempt))
+
+
+def raise_for_upstream_status(response: httpx.Response, error_text: str):
+    """Raise the error for a failed upstream response (UpstreamRateLimitError for 429)"""
+    if response.status_code == 429:
+        retry_after = retry_after_seconds(response)
+        raise UpstreamRateLimitError(f"OpenAI API rate limit exceeded: {error_text}", retry_after)
+    raise Exception(f"OpenAI API error: {error_text}")
+
+
+def retry_after_header(retry_after: Optional[float]) -> Dict:
+    """Retry-After header for an HTTP error response"""
+    return {"Retry-After": str(math.ceil(retry_after))} if retry_after else {}
@@ -1,5 +1,5 @@
 """Pydantic models for request/response validation"""
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, EmailStr, model_validator
 from typing import List, Optional
 
 
@@ -9,19 +9,42 @@ class Message(BaseModel):
 
 
 class ChatRequest(BaseModel):
-    messages: List[Message]
+    messages: Optional[List[Message]] = None  # Full conversation (client-held context)
     user_id: int
+    # Server-held context: send only the newest message; the server loads the
+    # rest from the session (a new session is created when session_id is omitted)
+    message: Optional[Message] = None
+    session_id: Optional[int] = None
     api_key: Optional[str] = None
     api_url: Optional[str] = None
     system_prompt: Optional[str] = None
     model: Optional[str] = "gpt-4o-mini"
     temperature: Optional[float] = 0
     max_tokens: Optional[int] = 300
+    
+    @model_validator(mode="after")
+    def check_context_mode(self):
+        if self.message is None and self.messages is None:
+            raise ValueError("Either 'messages' or 'message' is required")
+        if self.message is not None and self.messages is not None:
+            raise ValueError("Send either 'messages' (full conversation) or 'message' (newest turn), not both")
+        return self
+
+
+class ChatSocketStart(BaseModel):
+    """First frame on /ws/chat - who is chatting and with which settings"""
+    user_id: int
+    session_id: Optional[int] = None  # Omit to resume the active session (or start a new one)
+    api_key: Optional[str] = None
+    model: Optional[str] = "gpt-4o-mini"
+    temperature: Optional[float] = 0
+    max_tokens: Optional[int] = 300
 
 
 class ChatResponse(BaseModel):
     response: str
     usage: Optional[dict] = None
+    session_id: Optional[int] = None  # Set in server-held context mode
 
 
 class UserRegister(BaseModel):
@@ -47,4 +70,9 @@ class SaveSessionRequest(BaseModel):
 
 
 class UpdateSessionRequest(BaseModel):
-    messages: List[Message]
\ No newline at end of file
+    messages: List[Message]
+
+
+class AppendMessagesRequest(BaseModel):
+    messages: List[Message]
+    expected_count: Optional[int] = None  # Messages the client believes are stored; 409 if it differs
@@ -0,0 +1,54 @@
+"""Production entry point: several uvicorn worker processes on one port
+
+Each worker imports main:app on its own and opens its database pool,
+upstream client, job workers and write-behind buffer in the lifespan -
+nothing connects at import and the workers never run DDL. Apply
+migrations once per deploy, before starting the new version.
+
+Point liveness probes at /health and readiness probes at /ready.
+
+Usage (from backend/):
+    python migrations.py                # once per deploy
+    python serve.py                     # WEB_CONCURRENCY workers on SERVE_HOST:PORT
+    python serve.py --migrate           # apply pending migrations first (single-instance deploys)
+    python serve.py --workers 4 --port 8080
+"""
+import argparse
+import asyncio
+import os
+import uvicorn
+from config import SERVE_HOST, SERVE_PORT, SERVE_WORKERS, SERVE_GRACEFUL_TIMEOUT, SERVE_KEEPALIVE_TIMEOUT, WRITE_BEHIND_ENABLED
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default=SERVE_HOST)
+    parser.add_argument("--port", type=int, default=SERVE_PORT)
+    parser.add_argument("--workers", type=int, default=SERVE_WORKERS, help="Worker processes (default: WEB_CONCURRENCY or the CPU count)")
+    parser.add_argument("--migrate", action="store_true", help="Apply pending migrations before starting the workers")
+    args = parser.parse_args()
+
+    if args.migrate:
+        from migrations import run_command
+        # Runs in this supervisor process only; workers are spawned fresh and don't inherit its pool
+        asyncio.run(run_command("upgrade"))
+
+    if WRITE_BEHIND_ENABLED and args.workers > 1:
+        print("⚠️ WRITE_BEHIND_ENABLED with several workers: an autosave buffered by one worker is not seen "
+              "by the others until it is flushed (and is dropped if the session changed elsewhere meanwhile)")
+    # Inherited by the spawned workers, which split the upstream RPM/TPM quotas between them
+    os.environ["SERVE_WORKER_COUNT"] = str(args.workers)
+    print(f"✅ Serving on {args.host}:{args.port} with {args.workers} worker(s)")
+    uvicorn.run(
+        "main:app",
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        timeout_graceful_shutdown=SERVE_GRACEFUL_TIMEOUT,
+        timeout_keep_alive=SERVE_KEEPALIVE_TIMEOUT,
+        proxy_headers=True,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""Single-flight coalescing of identical concurrent work
+
+While a call for a key is running, further calls with the same key wait for
+it and share its result (or exception) instead of starting their own.
+Keys are built from the kind of work, the user and a hash of the transcript,
+so e.g. a double-clicked logout makes one extraction call, not two.
+"""
+import asyncio
+import hashlib
+import json
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Tuple
+
+
+def transcript_hash(messages: List[Dict]) -> str:
+    """Stable hash of a conversation history"""
+    payload = json.dumps([[msg["role"], msg["content"]] for msg in messages], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def flight_key(kind: str, user_id: int, messages: List[Dict]) -> Tuple[str, int, str]:
+    """Key for per-user work on a transcript"""
+    return kind, user_id, transcript_hash(messages)
+
+
+class SingleFlight:
+    """Runs at most one call per key at a time; concurrent callers share it"""
+
+    def __init__(self):
+        self._calls: Dict[Hashable, asyncio.Task] = {}
+        self._stats: Dict[str, Dict[str, int]] = {}
+
+    def in_flight(self, key: Hashable) -> bool:
+        return key in self._calls
+
+    async def do(self, key: Hashable, fn: Callable[..., Awaitable[Any]], *args, **kwargs) -> Any:
+        """Run fn(*args, **kwargs), or join the call already running for key"""
+        kind = key[0] if isinstance(key, tuple) else str(key)
+        stats = self._stats.setdefault(kind, {"calls": 0, "shared": 0})
+        task = self._calls.get(key)
+        if task is None:
+            stats["calls"] += 1
+            task = asyncio.ensure_future(fn(*args, **kwargs))
+            self._calls[key] = task
+            task.add_done_callback(lambda _: self._calls.pop(key, None))
+        else:
+            stats["shared"] += 1
+        # Shielded so one caller giving up (e.g. a cancelled request) doesn't cancel it for the others
+        return await asyncio.shield(task)
+
+    def get_stats(self) -> Dict:
+        return {"in_flight": len(self._calls), "by_kind": self._stats}
+
+
+# Shared by the background job workers and live extraction
+flights = SingleFlight()
+
+
+def get_singleflight_stats() -> Dict:
+    """How many calls ran and how many were shared, per kind of work"""
+    return flights.get_stats()
@@ -0,0 +1,33 @@
+"""Test setup: a scratch SQLite database, configured before any app module is imported"""
+import asyncio
+import os
+import sys
+import tempfile
+
+_tmp = tempfile.mkdtemp(prefix="chatbot-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{_tmp}/test.sqlite"
+os.environ["JOB_WORKERS"] = "0"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest  # noqa: E402
+
+
+def run(coro_fn):
+    """Run an async test body on a fresh event loop, with fresh tables, disposing the pool afterwards"""
+    from database import Base, engine
+
+    async def wrapper():
+        try:
+            async with engine.begin() as conn:
+                await conn.run_sync(Base.metadata.drop_all)
+                await conn.run_sync(Base.metadata.create_all)
+            return await coro_fn()
+        finally:
+            await engine.dispose()
+
+    return asyncio.run(wrapper())
+
+
+@pytest.fixture
+def log_dir(tmp_path):
+    return str(tmp_path / "write-behind")
@@ -0,0 +1,64 @@
+from sqlalchemy import select
+
+import jobs
+from conftest import run
+from database import SessionLocal, User, ChatSession, Job, PersonalInfo
+from transcripts import append_messages
+
+PROFILE = {"<Profession>": "nurse", "<PersonalInfo>": "from Delhi"}
+
+
+async def queue_logout_summary():
+    async with SessionLocal() as db:
+        db.add(User(id=1, name="t", email="t@example.com", password_hash="x"))
+        db.add(PersonalInfo(user_id=1, personal_info_data=dict(PROFILE)))
+        chat_session = ChatSession(user_id=1, messages=[])
+        db.add(chat_session)
+        await db.flush()
+        await append_messages(db, chat_session, [{"role": "user", "content": "hi"}])
+        job = await jobs.queue_session_summary(db, chat_session, 1)
+        await db.commit()
+        return job.id
+
+
+async def run_next_job():
+    job = await jobs._claim_job()
+    assert job is not None
+    await jobs._run_job(job)
+    async with SessionLocal() as db:
+        job = await db.get(Job, job.id)
+        profile = (await db.execute(select(PersonalInfo).filter(PersonalInfo.user_id == 1))).scalars().one()
+        return job, profile.personal_info_data
+
+
+def test_upstream_failure_leaves_job_pending_and_profile_intact(monkeypatch):
+    async def failing(messages):
+        raise Exception("OpenAI API error: upstream down")
+
+    monkeypatch.setattr(jobs, "extract_session_insights", failing)
+
+    async def body():
+        await queue_logout_summary()
+        job, profile = await run_next_job()
+        assert job.status == "pending"
+        assert job.attempts == 1
+        assert job.locked_until is not None  # Held back for JOB_RETRY_DELAY
+        assert "upstream down" in job.error
+        assert profile == PROFILE
+
+    run(body)
+
+
+def test_empty_extraction_keeps_stored_profile(monkeypatch):
+    async def nothing_found(messages):
+        return {"summary": "Said hi", "<PersonalInfo>": "", "<Profession>": "paramedic"}
+
+    monkeypatch.setattr(jobs, "extract_session_insights", nothing_found)
+
+    async def body():
+        await queue_logout_summary()
+        job, profile = await run_next_job()
+        assert job.status == "done"
+        assert profile == {"<Profession>": "paramedic", "<PersonalInfo>": "from Delhi"}
+
+    run(body)
@@ -0,0 +1,37 @@
+import asyncio
+
+import profile_cache
+from conftest import run
+from database import SessionLocal, User, PersonalInfo
+
+
+class SlowRead:
+    """An AsyncSession stand-in whose read returns an old row after a writer has updated the cache"""
+
+    def __init__(self, db, during_read):
+        self.db = db
+        self.during_read = during_read
+
+    async def execute(self, statement):
+        result = await self.db.execute(statement)
+        self.during_read()
+        await asyncio.sleep(0)
+        return result
+
+
+def test_miss_does_not_cache_a_read_that_raced_a_write():
+    async def body():
+        async with SessionLocal() as db:
+            db.add(User(id=1, name="t", email="t@example.com", password_hash="x"))
+            db.add(PersonalInfo(user_id=1, personal_info_data={"<Profession>": "nurse"}))
+            await db.commit()
+
+        profile_cache._cache.clear()
+        fresh = {"<Profession>": "surgeon"}
+        async with SessionLocal() as db:
+            read = await profile_cache.get_profile(SlowRead(db, lambda: profile_cache.set_profile(1, fresh)), 1)
+            assert read == {"<Profession>": "nurse"}
+            # The writer's value stays cached, not the older row read meanwhile
+            assert await profile_cache.get_profile(db, 1) == fresh
+
+    run(body)
@@ -0,0 +1,14 @@
+import providers
+
+
+def test_override_pool_is_reused_and_shares_the_pooled_scheduler():
+    pool = providers._pool_for("user-key", providers.OPENAI_BASE_URL)
+    assert providers._pool_for("user-key", providers.OPENAI_BASE_URL) is pool
+    # Same deployment as the configured endpoint - same RPM/TPM buckets and 429 pause
+    assert pool.endpoints[0].scheduler is providers.get_pool().endpoints[0].scheduler
+
+
+def test_override_pool_for_another_url_has_its_own_scheduler():
+    pool = providers._pool_for("user-key", "http://other-upstream.example")
+    assert pool.endpoints[0].scheduler is not providers.get_pool().endpoints[0].scheduler
+    assert providers._pool_for("other-key", "http://other-upstream.example") is not pool
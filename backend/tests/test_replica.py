@@ -0,0 +1,15 @@
+from replica import replica_lag
+
+
+def test_detached_standby_is_not_caught_up():
+    # Receive LSN == replay LSN makes the query report 0, but nothing is arriving
+    assert replica_lag(standby=True, streaming=False, lag=0) is None
+
+
+def test_streaming_standby_reports_its_lag():
+    assert replica_lag(standby=True, streaming=True, lag=0) == 0.0
+    assert replica_lag(standby=True, streaming=True, lag=2.5) == 2.5
+
+
+def test_stand_in_that_is_not_a_standby_counts_as_caught_up():
+    assert replica_lag(standby=False, streaming=False, lag=None) == 0.0
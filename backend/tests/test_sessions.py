@@ -0,0 +1,34 @@
+from datetime import datetime
+
+import pytest
+from fastapi import HTTPException
+
+from conftest import run
+from database import SessionLocal, User, ChatSession
+from routes.sessions import append_session_messages
+from schemas import AppendMessagesRequest
+from transcripts import append_messages, load_transcript
+
+
+def test_append_to_closed_session_is_refused():
+    async def body():
+        async with SessionLocal() as db:
+            db.add(User(id=1, name="t", email="t@example.com", password_hash="x"))
+            chat_session = ChatSession(user_id=1, messages=[])
+            db.add(chat_session)
+            await db.flush()
+            await append_messages(db, chat_session, [{"role": "user", "content": "hi"}])
+            chat_session.summarized_at = datetime.utcnow()
+            await db.commit()
+            session_id = chat_session.id
+
+        request = AppendMessagesRequest(messages=[{"role": "assistant", "content": "late"}], expected_count=1)
+        async with SessionLocal() as db:
+            with pytest.raises(HTTPException) as refused:
+                await append_session_messages(session_id, request, db)
+        assert refused.value.status_code == 409
+
+        async with SessionLocal() as db:
+            assert await load_transcript(db, await db.get(ChatSession, session_id)) == [{"role": "user", "content": "hi"}]
+
+    run(body)
@@ -0,0 +1,171 @@
+import json
+import os
+
+import pytest
+
+from conftest import run
+from database import SessionLocal, User, ChatSession
+from transcripts import append_messages, load_transcript
+from write_behind import WriteBehindBuffer
+
+
+def msgs(n, tag="m"):
+    return [{"role": "user" if i % 2 == 0 else "assistant", "content": f"{tag}{i}"} for i in range(n)]
+
+
+async def make_session(messages):
+    async with SessionLocal() as db:
+        if await db.get(User, 1) is None:
+            db.add(User(id=1, name="t", email="t@example.com", password_hash="x"))
+        chat_session = ChatSession(user_id=1, messages=[])
+        db.add(chat_session)
+        await db.flush()
+        await append_messages(db, chat_session, messages)
+        await db.commit()
+        return chat_session.id
+
+
+async def stored(session_id):
+    async with SessionLocal() as db:
+        return await load_transcript(db, await db.get(ChatSession, session_id))
+
+
+def write_orphan_log(log_dir, lines, pid=999999):
+    os.makedirs(log_dir, exist_ok=True)
+    path = os.path.join(log_dir, f"write-behind-{pid}.log")
+    with open(path, "wb") as log:
+        log.writelines(lines)
+    return path
+
+
+def log_line(session_id, messages, base_count):
+    record = {"session_id": session_id, "user_id": 1, "base_count": base_count, "messages": messages}
+    return json.dumps(record).encode() + b"\n"
+
+
+def buffer(log_dir=""):
+    return WriteBehindBuffer(interval=60, max_bytes=1 << 20, log_dir=log_dir, fsync=False)
+
+
+def test_replay_skips_torn_line(log_dir):
+    async def body():
+        session_id = await make_session(msgs(2))
+        path = write_orphan_log(log_dir, [log_line(session_id, msgs(4), 2), b'{"session_id": 1, "mess'])
+        wb = buffer(log_dir)
+        await wb.start()
+        await wb.stop()
+        assert await stored(session_id) == msgs(4)
+        assert not os.path.exists(path)
+        assert wb.get_stats()["replayed"] == 1
+
+    run(body)
+
+
+def test_replay_never_rewinds(log_dir):
+    async def body():
+        # Logged at 4 messages, then flushed and grown to 6 elsewhere before the crash
+        session_id = await make_session(msgs(6))
+        write_orphan_log(log_dir, [log_line(session_id, msgs(4), 2)])
+        wb = buffer(log_dir)
+        await wb.start()
+        await wb.stop()
+        assert await stored(session_id) == msgs(6)
+
+    run(body)
+
+
+def test_orphan_claim_leaves_live_processes_alone(log_dir):
+    async def body():
+        live = write_orphan_log(log_dir, [b""], pid=os.getppid())
+        dead = write_orphan_log(log_dir, [b""], pid=999999)
+        wb = buffer(log_dir)
+        await wb.start()
+        await wb.stop()
+        assert os.path.exists(live)
+        assert not os.path.exists(dead)
+
+    run(body)
+
+
+def test_failed_flush_is_kept(log_dir):
+    async def body():
+        session_id = await make_session(msgs(2))
+        wb = buffer(log_dir)
+        await wb.start()
+        await wb.put(session_id, 1, msgs(4), 2)
+
+        real_write = wb._write
+
+        async def failing_write(entry):
+            raise RuntimeError("database down")
+
+        wb._write = failing_write
+        with pytest.raises(RuntimeError):
+            await wb.flush_session(session_id)
+        assert wb.pending_user(session_id) == 1
+        assert wb.get_stats()["flush_errors"] == 1
+        assert await stored(session_id) == msgs(2)
+
+        # Still logged after compaction, and written once the database is back
+        await wb.flush_due()
+        with open(wb._log_path, "rb") as log:
+            assert [json.loads(line)["session_id"] for line in log] == [session_id]
+        wb._write = real_write
+        await wb.stop()
+        assert await stored(session_id) == msgs(4)
+
+    run(body)
+
+
+def test_coalesced_flush_and_compaction(log_dir):
+    async def body():
+        session_id = await make_session(msgs(2))
+        wb = buffer(log_dir)
+        await wb.start()
+        for n in range(3, 9):
+            await wb.put(session_id, 1, msgs(n), 2)
+        assert await stored(session_id) == msgs(2)
+        assert await wb.flush_due(everything=True) == 1
+        assert await stored(session_id) == msgs(8)
+        assert wb.get_stats()["coalesced"] == 5
+        assert os.path.getsize(wb._log_path) == 0
+        await wb.stop()
+        assert not os.path.exists(wb._log_path)
+
+    run(body)
+
+
+def test_flush_drops_autosave_made_stale_by_another_writer():
+    async def body():
+        session_id = await make_session(msgs(2))
+        wb = buffer()
+        await wb.start()
+        await wb.put(session_id, 1, msgs(4, tag="mine"), 2)
+        # Meanwhile another worker appends turns to the stored session
+        async with SessionLocal() as db:
+            await append_messages(db, await db.get(ChatSession, session_id), msgs(2, tag="other"))
+            await db.commit()
+        await wb.flush_session(session_id)
+        assert await stored(session_id) == msgs(2) + msgs(2, tag="other")
+        assert wb.get_stats()["conflicts"] == 1
+        await wb.stop()
+
+    run(body)
+
+
+def test_flush_merges_autosave_that_includes_the_other_write():
+    async def body():
+        session_id = await make_session(msgs(2))
+        wb = buffer()
+        await wb.start()
+        async with SessionLocal() as db:
+            await append_messages(db, await db.get(ChatSession, session_id), msgs(2, tag="other"))
+            await db.commit()
+        # The client saw the other write before autosaving on top of it
+        await wb.put(session_id, 1, msgs(2) + msgs(2, tag="other") + msgs(2, tag="new"), 2)
+        await wb.flush_session(session_id)
+        assert await stored(session_id) == msgs(2) + msgs(2, tag="other") + msgs(2, tag="new")
+        assert wb.get_stats()["conflicts"] == 0
+        await wb.stop()
+
+    run(body)
@@ -0,0 +1,23 @@
+"""Token estimates for prompts and chat messages (no tokenizer - ~4 characters per token)
+
+Kept free of imports so prompts, context and the scheduler can share it.
+"""
+from typing import Dict, List
+
+# Rough per-message overhead of the chat format (role, separators)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimate the token count of a text (~4 characters per token for English/Hinglish)"""
+    return (len(text) + 3) // 4
+
+
+def message_tokens(message: Dict) -> int:
+    """Estimate the tokens a chat message costs upstream"""
+    return estimate_tokens(message.get("content") or "") + MESSAGE_OVERHEAD_TOKENS
+
+
+def conversation_tokens(messages: List[Dict]) -> int:
+    """Estimate the tokens of a list of chat messages"""
+    return sum(message_tokens(msg) for msg in messages)
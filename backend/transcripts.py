@@ -0,0 +1,178 @@
+"""Append-only transcript storage in the chat_messages table
+
+Closed sessions can be compacted into a single encoded blob
+(ChatSession.transcript, see TRANSCRIPT_CODEC); writing to a compacted
+session expands it back into rows first.
+
+Read-only routes use load_transcript_json, which has the database build the
+JSON text so it can be sent as-is.
+"""
+import json
+from typing import Dict, List, Optional
+from sqlalchemy import select, delete, func, cast, literal_column, Text
+from sqlalchemy.dialects.postgresql import aggregate_order_by
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import ChatSession, ChatMessage, codec_for, get_transcript_codec
+
+
+async def load_transcript(
+    db: AsyncSession,
+    chat_session: ChatSession,
+    start: int = 0,
+    stop: Optional[int] = None
+) -> List[Dict]:
+    """Reassemble a session's transcript in order (optionally only messages[start:stop])"""
+    if chat_session.transcript_codec:
+        # Compacted - the blob column is deferred, fetch and decode it only now
+        result = await db.execute(select(ChatSession.transcript).filter(ChatSession.id == chat_session.id))
+        return codec_for(chat_session.transcript_codec).decode(result.scalar_one())[start:stop]
+
+    if not chat_session.message_count:
+        # Not migrated yet - transcript is still the legacy JSON array
+        return list(chat_session.messages or [])[start:stop]
+
+    query = (
+        select(ChatMessage.role, ChatMessage.content)
+        .filter(ChatMessage.chat_session_id == chat_session.id, ChatMessage.seq >= start)
+        .order_by(ChatMessage.seq)
+    )
+    if stop is not None:
+        query = query.filter(ChatMessage.seq < stop)
+    result = await db.execute(query)
+    return [{"role": role, "content": content} for role, content in result.all()]
+
+
+async def load_transcript_json(db: AsyncSession, chat_session: ChatSession) -> bytes:
+    """A session's whole transcript as a UTF-8 JSON array, without decoding it into Python objects.
+
+    Only chat_session's id, message_count and transcript_codec need to be loaded.
+    """
+    if chat_session.transcript_codec:
+        result = await db.execute(select(ChatSession.transcript).filter(ChatSession.id == chat_session.id))
+        return codec_for(chat_session.transcript_codec).to_json(result.scalar_one())
+
+    if not chat_session.message_count:
+        result = await db.execute(select(cast(ChatSession.messages, Text)).filter(ChatSession.id == chat_session.id))
+        legacy = result.scalar_one_or_none()
+        return legacy.encode("utf-8") if legacy and legacy != "null" else b"[]"
+
+    dialect = db.bind.dialect.name
+    if dialect == "postgresql":
+        # Keys as SQL literals - json_build_object takes "any", so bound parameters would have no type
+        message = func.json_build_object(literal_column("'role'"), ChatMessage.role, literal_column("'content'"), ChatMessage.content)
+        query = (
+            select(cast(func.json_agg(aggregate_order_by(message, ChatMessage.seq)), Text))
+            .filter(ChatMessage.chat_session_id == chat_session.id)
+        )
+    elif dialect == "sqlite":
+        ordered = (
+            select(ChatMessage.role, ChatMessage.content)
+            .filter(ChatMessage.chat_session_id == chat_session.id)
+            .order_by(ChatMessage.seq)
+            .subquery()
+        )
+        query = select(func.json_group_array(func.json_object("role", ordered.c.role, "content", ordered.c.content)))
+    else:
+        messages = await load_transcript(db, chat_session)
+        return json.dumps(messages, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    result = await db.execute(query)
+    return (result.scalar_one_or_none() or "[]").encode("utf-8")
+
+
+def _add_rows(db: AsyncSession, chat_session: ChatSession, messages: List[Dict], start_seq: int):
+    """Stage chat_messages rows starting at start_seq"""
+    for offset, msg in enumerate(messages):
+        db.add(ChatMessage(
+            chat_session_id=chat_session.id,
+            seq=start_seq + offset,
+            role=msg["role"],
+            content=msg["content"]
+        ))
+
+
+async def _expand_compacted_transcript(db: AsyncSession, chat_session: ChatSession):
+    """Turn a compacted transcript back into chat_messages rows so it can be appended to"""
+    if not chat_session.transcript_codec:
+        return
+    messages = await load_transcript(db, chat_session)
+    _add_rows(db, chat_session, messages, 0)
+    chat_session.message_count = len(messages)
+    chat_session.transcript = None
+    chat_session.transcript_codec = None
+    await db.flush()
+
+
+async def compact_transcript(db: AsyncSession, chat_session: ChatSession, codec=None) -> bool:
+    """Replace a session's chat_messages rows (or legacy JSON) with one encoded blob.
+
+    Returns True if the session was (re)compacted. The caller commits.
+    """
+    codec = codec or get_transcript_codec()
+    if codec is None or chat_session.transcript_codec == codec.name:
+        return False
+    messages = await load_transcript(db, chat_session)
+    if not messages:
+        return False
+    chat_session.transcript = codec.encode(messages)
+    chat_session.transcript_codec = codec.name
+    chat_session.message_count = len(messages)
+    chat_session.messages = []
+    await db.execute(delete(ChatMessage).where(ChatMessage.chat_session_id == chat_session.id))
+    await db.flush()
+    return True
+
+
+async def migrate_legacy_transcript(db: AsyncSession, chat_session: ChatSession) -> bool:
+    """Move a legacy JSON transcript into chat_messages. Returns True if anything was moved"""
+    if chat_session.message_count or not chat_session.messages:
+        return False
+    legacy = list(chat_session.messages)
+    _add_rows(db, chat_session, legacy, 0)
+    chat_session.message_count = len(legacy)
+    chat_session.messages = []
+    await db.flush()
+    return True
+
+
+async def append_messages(db: AsyncSession, chat_session: ChatSession, messages: List[Dict]) -> int:
+    """Append new messages to the end of a transcript. Returns the new message count.
+
+    The caller should hold the session row lock (SELECT ... FOR UPDATE) and commits.
+    """
+    await _expand_compacted_transcript(db, chat_session)
+    await migrate_legacy_transcript(db, chat_session)
+    start_seq = chat_session.message_count or 0
+    _add_rows(db, chat_session, messages, start_seq)
+    chat_session.message_count = start_seq + len(messages)
+    return chat_session.message_count
+
+
+async def replace_transcript(db: AsyncSession, chat_session: ChatSession, messages: List[Dict]) -> int:
+    """Store a full transcript sent by a client, writing only what changed.
+
+    The usual case is the stored transcript plus new turns at the end, so only
+    the last stored message is compared and the tail is appended. Anything else
+    (edited or shortened history) rewrites the session's rows.
+    """
+    await _expand_compacted_transcript(db, chat_session)
+    await migrate_legacy_transcript(db, chat_session)
+    count = chat_session.message_count or 0
+
+    if 0 < count <= len(messages):
+        result = await db.execute(
+            select(ChatMessage.role, ChatMessage.content)
+            .filter(ChatMessage.chat_session_id == chat_session.id, ChatMessage.seq == count - 1)
+        )
+        last = result.first()
+        expected = messages[count - 1]
+        if last is not None and (last.role, last.content) == (expected["role"], expected["content"]):
+            return await append_messages(db, chat_session, messages[count:])
+
+    if count:
+        await db.execute(delete(ChatMessage).where(ChatMessage.chat_session_id == chat_session.id))
+        await db.flush()
+    chat_session.message_count = 0
+    # History changed - the rolling summary no longer describes it
+    chat_session.rolling_summary = None
+    chat_session.summarized_count = 0
+    return await append_messages(db, chat_session, messages)
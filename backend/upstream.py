@@ -0,0 +1,121 @@
+"""Shared upstream HTTP client for LLM calls"""
+from typing import Dict, Optional
+import httpx
+from config import (
+    UPSTREAM_MAX_CONNECTIONS,
+    UPSTREAM_MAX_KEEPALIVE_CONNECTIONS,
+    UPSTREAM_KEEPALIVE_EXPIRY,
+    UPSTREAM_HTTP2,
+    UPSTREAM_CONNECT_TIMEOUT,
+    UPSTREAM_READ_TIMEOUT,
+    UPSTREAM_WRITE_TIMEOUT,
+    UPSTREAM_POOL_TIMEOUT,
+)
+
+# Application-scoped client, created and closed by the FastAPI lifespan
+_client: Optional[httpx.AsyncClient] = None
+
+# Counters used to report connection reuse
+_stats = {
+    "requests": 0,
+    "new_connections": 0,
+}
+
+
+def _http2_available() -> bool:
+    """Check whether the optional h2 package is installed"""
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def _build_client() -> httpx.AsyncClient:
+    """Build the pooled upstream client from configuration"""
+    http2 = UPSTREAM_HTTP2
+    if http2 and not _http2_available():
+        print("⚠️ UPSTREAM_HTTP2 is enabled but 'h2' is not installed (pip install httpx[http2]); using HTTP/1.1")
+        http2 = False
+
+    limits = httpx.Limits(
+        max_connections=UPSTREAM_MAX_CONNECTIONS,
+        max_keepalive_connections=UPSTREAM_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=UPSTREAM_KEEPALIVE_EXPIRY,
+    )
+    timeout = httpx.Timeout(
+        connect=UPSTREAM_CONNECT_TIMEOUT,
+        read=UPSTREAM_READ_TIMEOUT,
+        write=UPSTREAM_WRITE_TIMEOUT,
+        pool=UPSTREAM_POOL_TIMEOUT,
+    )
+    return httpx.AsyncClient(limits=limits, timeout=timeout, http2=http2)
+
+
+async def init_upstream_client() -> httpx.AsyncClient:
+    """Create the shared upstream client (called on app startup)"""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = _build_client()
+    return _client
+
+
+async def close_upstream_client():
+    """Close the shared upstream client (called on app shutdown)"""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def get_upstream_client() -> httpx.AsyncClient:
+    """Get the shared upstream client, creating it lazily outside the app lifespan"""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = _build_client()
+    return _client
+
+
+async def _trace(event_name: str, info: Dict):
+    """httpcore trace hook - counts freshly opened TCP connections"""
+    if event_name == "connection.connect_tcp.complete":
+        _stats["new_connections"] += 1
+
+
+def request_extensions() -> Dict:
+    """Per-request extensions that record pool usage; pass to client.post/stream"""
+    _stats["requests"] += 1
+    return {"trace": _trace}
+
+
+def get_pool_stats() -> Dict:
+    """Connection pool statistics for the shared upstream client"""
+    requests = _stats["requests"]
+    new_connections = _stats["new_connections"]
+    reused = max(requests - new_connections, 0)
+
+    open_connections = 0
+    idle_connections = 0
+    http2 = False
+    if _client is not None and not _client.is_closed:
+        # httpx does not expose the pool publicly; read it defensively
+        pool = getattr(getattr(_client, "_transport", None), "_pool", None)
+        connections = list(getattr(pool, "connections", []) or [])
+        open_connections = len(connections)
+        idle_connections = sum(1 for conn in connections if conn.is_idle())
+        http2 = bool(getattr(pool, "_http2", False))
+
+    return {
+        "requests": requests,
+        "new_connections": new_connections,
+        "reused_connections": reused,
+        "reuse_rate": round(reused / requests, 4) if requests else None,
+        "open_connections": open_connections,
+        "idle_connections": idle_connections,
+        "http2": http2,
+        "limits": {
+            "max_connections": UPSTREAM_MAX_CONNECTIONS,
+            "max_keepalive_connections": UPSTREAM_MAX_KEEPALIVE_CONNECTIONS,
+            "keepalive_expiry": UPSTREAM_KEEPALIVE_EXPIRY,
+        },
+    }
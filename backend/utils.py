@@ -1,69 +1,76 @@
-"""Utility functions for OpenAI API calls and data extraction"""
-import httpx
+"""Utility functions for OpenAI API calls and data extraction
+
+api_key/api_url default to None, which sends the call through the shared
+endpoint pool (providers.py); passing them targets that one endpoint.
+"""
 import re
 import json
-from typing import List, Dict
-from config import OPENAI_API_KEY, OPENAI_BASE_URL
+from typing import List, Dict, AsyncIterator, Optional, Tuple
+from config import CONTEXT_SUMMARY_MAX_TOKENS, UPSTREAM_STREAM_USAGE
+from scheduler import raise_for_upstream_status, INTERACTIVE, BACKGROUND
+from providers import send_upstream
+from completion_cache import is_cacheable, completion_cache_key, get_cached_completion, store_completion
+from metrics import record_usage
 
 
-async def extract_summary(messages: List[Dict], api_key: str = None, api_url: str = None) -> Dict:
-    """Extract summary from chat messages using OpenAI"""
-    api_key = api_key or OPENAI_API_KEY
-    api_url = api_url or OPENAI_BASE_URL
-    
-    try:
-        summary_prompt = """Please provide a concise summary of this conversation in JSON format:
+async def extract_session_insights(messages: List[Dict], api_key: str = None, api_url: str = None) -> Dict:
+    """Extract summary, profession and personal info from a conversation in a single call.
+
+    Raises when the upstream call fails, so the caller can retry rather than
+    take the failure for a conversation with nothing to extract.
+    """
+    extraction_prompt = """From this conversation, write a concise summary and extract the user's profession and personal information.
+Return in JSON format:
 {
-    "summary": "brief summary of the conversation"
+    "summary": "brief summary of the conversation",
+    "<PersonalInfo>": "extracted personal information about the user",
+    "<Profession>": "user's profession or job"
 }
 
-Keep it short and focused on the main topics discussed."""
-        
-        conversation_text = "\n".join([f"{msg['role']}: {msg['content']}" for msg in messages])
-        full_prompt = f"{summary_prompt}\n\nConversation:\n{conversation_text}"
-        
-        is_azure = 'azure' in api_url.lower()
-        headers = {"Content-Type": "application/json"}
-        if is_azure:
-            headers["api-key"] = api_key
-        else:
-            headers["Authorization"] = f"Bearer {api_key}"
-        
-        async with httpx.AsyncClient(timeout=60.0) as client:
-            request_body = {
-                "messages": [{"role": "user", "content": full_prompt}],
-                "temperature": 0.3,
-                "max_tokens": 200
-            }
-            
-            if not is_azure:
-                request_body["model"] = "gpt-3.5-turbo"
-            
-            response = await client.post(
-                api_url if is_azure else f"{api_url}/chat/completions",
-                headers=headers,
-                json=request_body
-            )
-            
-            if response.status_code == 200:
-                data = response.json()
-                summary_text = data["choices"][0]["message"]["content"]
-                # Try to extract JSON from response
-                json_match = re.search(r'\{[^}]+\}', summary_text, re.DOTALL)
-                if json_match:
-                    return {"summary": json.loads(json_match.group()).get("summary", summary_text.strip())}
-                return {"summary": summary_text.strip()}
-            else:
-                return {"summary": "Summary extraction failed"}
-    except Exception as e:
-        print(f"Error extracting summary: {e}")
-        return {"summary": "Summary extraction failed"}
+Keep the summary short and focused on the main topics discussed.
+If profession is mentioned, extract it. If not, leave it empty."""
+    
+    conversation_text = "\n".join([f"{msg['role']}: {msg['content']}" for msg in messages])
+    full_prompt = f"{extraction_prompt}\n\nConversation:\n{conversation_text}"
+    
+    request_body = {
+        "messages": [{"role": "user", "content": full_prompt}],
+        "temperature": 0.3,
+        "max_tokens": 500
+    }
+    
+    response = await send_upstream(
+        request_body,
+        priority=BACKGROUND,
+        api_key=api_key,
+        api_url=api_url,
+        call_type="summary"
+    )
+    
+    if response.status_code != 200:
+        raise_for_upstream_status(response, response.text)
+    
+    data = response.json()
+    record_usage("summary", data.get("model"), data.get("usage"))
+    extraction_text = data["choices"][0]["message"]["content"]
+    # Try to extract JSON from response (outermost braces - the summary may contain "}")
+    json_match = re.search(r'\{.*\}', extraction_text, re.DOTALL)
+    try:
+        extracted = json.loads(json_match.group()) if json_match else None
+    except json.JSONDecodeError:
+        extracted = None
+    if not isinstance(extracted, dict):
+        # The model answered but not in JSON - keep its text as the summary
+        return {"summary": extraction_text.strip(), "<PersonalInfo>": "", "<Profession>": ""}
+    return {
+        "summary": extracted.get("summary") or extraction_text.strip(),
+        "<PersonalInfo>": extracted.get("<PersonalInfo>", "") or "",
+        "<Profession>": extracted.get("<Profession>", "") or ""
+    }
 
 
 async def extract_profession_and_info(messages: List[Dict], api_key: str = None, api_url: str = None) -> Dict:
     """Extract profession and personal info from conversation"""
-    api_key = api_key or OPENAI_API_KEY
-    api_url = api_url or OPENAI_BASE_URL
     
     try:
         extraction_prompt = """From this conversation, extract the user's profession and personal information.
@@ -78,44 +85,77 @@ If profession is mentioned, extract it. If not, leave it empty."""
         conversation_text = "\n".join([f"{msg['role']}: {msg['content']}" for msg in messages])
         full_prompt = f"{extraction_prompt}\n\nConversation:\n{conversation_text}"
         
-        is_azure = 'azure' in api_url.lower()
-        headers = {"Content-Type": "application/json"}
-        if is_azure:
-            headers["api-key"] = api_key
-        else:
-            headers["Authorization"] = f"Bearer {api_key}"
+        request_body = {
+            "messages": [{"role": "user", "content": full_prompt}],
+            "temperature": 0.3,
+            "max_tokens": 300
+        }
+        
+        response = await send_upstream(
+            request_body,
+            priority=BACKGROUND,
+            api_key=api_key,
+            api_url=api_url,
+            call_type="extraction"
+        )
         
-        async with httpx.AsyncClient(timeout=60.0) as client:
-            request_body = {
-                "messages": [{"role": "user", "content": full_prompt}],
-                "temperature": 0.3,
-                "max_tokens": 300
-            }
-            
-            if not is_azure:
-                request_body["model"] = "gpt-3.5-turbo"
-            
-            response = await client.post(
-                api_url if is_azure else f"{api_url}/chat/completions",
-                headers=headers,
-                json=request_body
-            )
-            
-            if response.status_code == 200:
-                data = response.json()
-                extraction_text = data["choices"][0]["message"]["content"]
-                # Try to extract JSON from response
-                json_match = re.search(r'\{[^}]+\}', extraction_text, re.DOTALL)
-                if json_match:
-                    return json.loads(json_match.group())
-                return {"<PersonalInfo>": "", "<Profession>": ""}
-            else:
-                return {"<PersonalInfo>": "", "<Profession>": ""}
+        if response.status_code == 200:
+            data = response.json()
+            record_usage("extraction", data.get("model"), data.get("usage"))
+            extraction_text = data["choices"][0]["message"]["content"]
+            # Try to extract JSON from response
+            json_match = re.search(r'\{[^}]+\}', extraction_text, re.DOTALL)
+            if json_match:
+                return json.loads(json_match.group())
+            return {"<PersonalInfo>": "", "<Profession>": ""}
+        else:
+            return {"<PersonalInfo>": "", "<Profession>": ""}
     except Exception as e:
         print(f"Error extracting profession and info: {e}")
         return {"<PersonalInfo>": "", "<Profession>": ""}
 
 
+async def update_conversation_summary(
+    previous_summary: Optional[str],
+    messages: List[Dict],
+    api_key: str = None,
+    api_url: str = None
+) -> Optional[str]:
+    """Fold older chat turns into a running summary. Returns None on failure"""
+    
+    try:
+        summary_prompt = """You maintain a running summary of an English-coaching chat so it can continue without the full history.
+Update the summary with the new messages. Keep what was taught (phrases, corrections), what the user struggled with,
+and anything personal the user shared. Reply with the updated summary only, in a few short sentences."""
+        
+        conversation_text = "\n".join([f"{msg['role']}: {msg['content']}" for msg in messages])
+        full_prompt = f"{summary_prompt}\n\nCurrent summary:\n{previous_summary or '(none yet)'}\n\nNew messages:\n{conversation_text}"
+        
+        request_body = {
+            "messages": [{"role": "user", "content": full_prompt}],
+            "temperature": 0.3,
+            "max_tokens": CONTEXT_SUMMARY_MAX_TOKENS
+        }
+        
+        response = await send_upstream(
+            request_body,
+            priority=BACKGROUND,
+            api_key=api_key,
+            api_url=api_url,
+            call_type="context_summary"
+        )
+        
+        if response.status_code != 200:
+            return None
+        
+        data = response.json()
+        record_usage("context_summary", data.get("model"), data.get("usage"))
+        return data["choices"][0]["message"]["content"].strip() or None
+    except Exception as e:
+        print(f"Error updating conversation summary: {e}")
+        return None
+
+
 async def call_openai_api(
     messages: List[Dict],
     api_key: str = None,
@@ -123,17 +163,15 @@ async def call_openai_api(
     model: str = "gpt-3.5-turbo",
     temperature: float = 0.7,
     max_tokens: int = 500
-) -> str:
-    """Call OpenAI API and return the response"""
-    api_key = api_key or OPENAI_API_KEY
-    api_url = api_url or OPENAI_BASE_URL
-    
-    is_azure = 'azure' in api_url.lower()
-    headers = {"Content-Type": "application/json"}
-    if is_azure:
-        headers["api-key"] = api_key
-    else:
-        headers["Authorization"] = f"Bearer {api_key}"
+) -> Tuple[str, Optional[Dict]]:
+    """Call OpenAI API and return (response, upstream usage). Usage is None for a cached completion"""
+    
+    cache_key = None
+    if is_cacheable(temperature):
+        cache_key = completion_cache_key(model, messages, max_tokens, api_url or "")
+        cached = await get_cached_completion(cache_key)
+        if cached is not None:
+            return cached, None
     
     request_body = {
         "messages": messages,
@@ -141,19 +179,95 @@ async def call_openai_api(
         "max_tokens": max_tokens
     }
     
-    if not is_azure:
-        request_body["model"] = model
+    response = await send_upstream(
+        request_body,
+        model=model,
+        priority=INTERACTIVE,
+        api_key=api_key,
+        api_url=api_url
+    )
     
-    async with httpx.AsyncClient(timeout=60.0) as client:
-        response = await client.post(
-            api_url if is_azure else f"{api_url}/chat/completions",
-            headers=headers,
-            json=request_body
-        )
-        
+    if response.status_code != 200:
+        raise_for_upstream_status(response, response.text)
+    
+    data = response.json()
+    content = data["choices"][0]["message"]["content"]
+    usage = data.get("usage")
+    record_usage("chat", model, usage)
+    if cache_key and content:
+        await store_completion(cache_key, content)
+    return content, usage
+
+
+async def stream_openai_api(
+    messages: List[Dict],
+    api_key: str = None,
+    api_url: str = None,
+    model: str = "gpt-3.5-turbo",
+    temperature: float = 0.7,
+    max_tokens: int = 500,
+    usage: Optional[Dict] = None
+) -> AsyncIterator[str]:
+    """Call OpenAI API with stream=True and yield content tokens as they arrive.
+
+    The upstream usage object, sent after the last token, is copied into `usage` if given.
+    """
+    
+    cache_key = None
+    if is_cacheable(temperature):
+        cache_key = completion_cache_key(model, messages, max_tokens, api_url or "")
+        cached = await get_cached_completion(cache_key)
+        if cached is not None:
+            yield cached
+            return
+    
+    request_body = {
+        "messages": messages,
+        "temperature": temperature,
+        "max_tokens": max_tokens,
+        "stream": True
+    }
+    if UPSTREAM_STREAM_USAGE:
+        request_body["stream_options"] = {"include_usage": True}
+    
+    response = await send_upstream(
+        request_body,
+        model=model,
+        priority=INTERACTIVE,
+        stream=True,
+        api_key=api_key,
+        api_url=api_url,
+        call_type="chat_stream"
+    )
+    try:
         if response.status_code != 200:
-            error_text = response.text
-            raise Exception(f"OpenAI API error: {error_text}")
+            error_text = (await response.aread()).decode(errors="replace")
+            raise_for_upstream_status(response, error_text)
         
-        data = response.json()
-        return data["choices"][0]["message"]["content"]
+        # Server-sent events: one "data: {...}" line per chunk, terminated by "data: [DONE]"
+        parts = []
+        async for line in response.aiter_lines():
+            if not line.startswith("data:"):
+                continue
+            payload = line[len("data:"):].strip()
+            if payload == "[DONE]":
+                break
+            chunk = json.loads(payload)
+            if chunk.get("usage"):
+                record_usage("chat_stream", model, chunk["usage"])
+                if usage is not None:
+                    usage.update(chunk["usage"])
+            choices = chunk.get("choices") or []
+            if not choices:
+                # Azure sends content-filter results (and the final usage) in chunks without choices
+                continue
+            content = (choices[0].get("delta") or {}).get("content")
+            if content:
+                parts.append(content)
+                yield content
+    finally:
+        await response.aclose()
+    
+    # Only a stream that ran to completion is cached
+    if cache_key and parts:
+        await store_completion(cache_key, "".join(parts))
@@ -0,0 +1,361 @@
+"""Write-behind buffer that coalesces /update-session autosaves
+
+With WRITE_BEHIND_ENABLED, PUT /update-session keeps the latest full
+transcript of each session in memory instead of committing it. The buffer
+writes it to the database (one replace_transcript commit, whatever the
+number of autosaves in between) when:
+
+- it has waited WRITE_BEHIND_INTERVAL seconds,
+- more than WRITE_BEHIND_MAX_BYTES of updates have piled up for the session,
+- anything else reads or writes that session (get/active-session, append,
+  chat, save-session - so logout with generate_summary flushes first), or
+- the app shuts down.
+
+Durability: with WRITE_BEHIND_LOG_DIR set, every buffered update is first
+appended to this process's log there (fsync'd before /update-session
+answers when WRITE_BEHIND_FSYNC is on). At startup, logs left by processes
+that are no longer running are replayed into the database, so an
+acknowledged autosave survives a crash. Without a log directory, a crash
+loses up to WRITE_BEHIND_INTERVAL seconds of autosaves.
+
+The buffer is per process: with several workers, another worker sees an
+autosave only once it is flushed. Each buffered transcript remembers the
+session's message_count when it was first buffered; a flush (or replay)
+applies it only if that is still the stored count, or if the stored
+transcript is a prefix of it. Otherwise another worker or transport wrote
+to the session meanwhile, and the stale autosave is dropped rather than
+deleting those rows.
+"""
+import asyncio
+import json
+import os
+import re
+import time
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import select
+from database import SessionLocal, ChatSession
+from transcripts import load_transcript, replace_transcript
+from replica import note_user_write
+from config import (
+    WRITE_BEHIND_ENABLED,
+    WRITE_BEHIND_INTERVAL,
+    WRITE_BEHIND_MAX_BYTES,
+    WRITE_BEHIND_LOG_DIR,
+    WRITE_BEHIND_FSYNC,
+)
+
+LOG_NAME = re.compile(r"^write-behind-(\d+)(?:-r\d+)?\.log$")
+
+
+class PendingTranscript:
+    """Latest unflushed transcript of one session"""
+
+    def __init__(self, session_id: int, user_id: int, messages: List[Dict], base_count: Optional[int]):
+        self.session_id = session_id
+        self.user_id = user_id
+        self.messages = messages
+        self.base_count = base_count  # Stored message_count it was buffered on top of; None = unknown
+        self.dirty_since = time.monotonic()
+        self.bytes = 0
+        self.updates = 0
+
+
+async def _extends(db, chat_session: ChatSession, messages: List[Dict]) -> bool:
+    """Whether messages is the stored transcript plus (possibly) more turns"""
+    stored = await load_transcript(db, chat_session)
+    return len(stored) <= len(messages) and all(
+        (old["role"], old["content"]) == (new["role"], new["content"]) for old, new in zip(stored, messages)
+    )
+
+
+def _pid_running(pid: int) -> bool:
+    if pid == os.getpid():
+        return False  # Left by an earlier process that had our pid (e.g. pid 1 in a container)
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class WriteBehindBuffer:
+    def __init__(self, interval: float, max_bytes: int, log_dir: str, fsync: bool):
+        self.interval = interval
+        self.max_bytes = max_bytes
+        self.log_dir = log_dir
+        self.fsync = fsync
+        self._pending: Dict[int, PendingTranscript] = {}
+        self._flushing: Dict[int, Tuple[asyncio.Event, PendingTranscript]] = {}
+        self._log_lock = asyncio.Lock()
+        self._log = None
+        self._log_path = None
+        self._task: Optional[asyncio.Task] = None
+        self._flushed_since_compaction = 0
+        self._stats = {
+            "updates": 0,
+            "flushes": 0,
+            "flush_errors": 0,
+            "conflicts": 0,
+            "replayed": 0,
+        }
+
+    # --- log -------------------------------------------------------------
+
+    def _open_log(self):
+        os.makedirs(self.log_dir, exist_ok=True)
+        self._log_path = os.path.join(self.log_dir, f"write-behind-{os.getpid()}.log")
+        self._log = open(self._log_path, "ab")
+
+    def _write_log(self, line: bytes):
+        self._log.write(line)
+        self._log.flush()
+        if self.fsync:
+            os.fsync(self._log.fileno())
+
+    def _rewrite_log(self, lines: List[bytes]):
+        """Replace the log with only what is still unflushed"""
+        tmp_path = self._log_path + ".tmp"
+        with open(tmp_path, "wb") as tmp:
+            tmp.writelines(lines)
+            tmp.flush()
+            if self.fsync:
+                os.fsync(tmp.fileno())
+        os.replace(tmp_path, self._log_path)
+        self._log.close()
+        self._log = open(self._log_path, "ab")
+
+    @staticmethod
+    def _log_line(entry: PendingTranscript) -> bytes:
+        record = {
+            "session_id": entry.session_id,
+            "user_id": entry.user_id,
+            "base_count": entry.base_count,
+            "messages": entry.messages,
+        }
+        return json.dumps(record, ensure_ascii=False, separators=(",", ":")).encode("utf-8") + b"\n"
+
+    async def _compact_log(self):
+        if self._log is None:
+            return
+        self._flushed_since_compaction = 0
+        async with self._log_lock:
+            unflushed = list(self._pending.values()) + [entry for _, entry in self._flushing.values()]
+            await asyncio.to_thread(self._rewrite_log, [self._log_line(entry) for entry in unflushed])
+
+    def _claim_orphaned_logs(self) -> List[str]:
+        """Take over logs of processes that are gone (renamed so no other process replays them too)"""
+        claimed = []
+        for n, name in enumerate(sorted(os.listdir(self.log_dir))):
+            match = LOG_NAME.match(name)
+            if not match or _pid_running(int(match.group(1))):
+                continue
+            path = os.path.join(self.log_dir, f"write-behind-{os.getpid()}-r{n}.log")
+            try:
+                os.replace(os.path.join(self.log_dir, name), path)
+            except FileNotFoundError:
+                continue  # Another process claimed it first
+            claimed.append(path)
+        return claimed
+
+    async def _replay(self):
+        """Write transcripts from orphaned logs to the database"""
+        os.makedirs(self.log_dir, exist_ok=True)
+        for path in await asyncio.to_thread(self._claim_orphaned_logs):
+            latest: Dict[int, PendingTranscript] = {}
+            with open(path, "rb") as log:
+                for line in log:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue  # Torn last line of a crashed write
+                    latest[record["session_id"]] = PendingTranscript(
+                        record["session_id"], record["user_id"], record["messages"], record.get("base_count")
+                    )
+            try:
+                for entry in latest.values():
+                    # The log may hold transcripts that were flushed before the crash and have
+                    # grown since - _write's base check never rewinds those
+                    await self._write(entry)
+            except Exception as e:
+                print(f"⚠️ Could not replay write-behind log {path}, keeping it: {e}")
+                continue
+            os.remove(path)
+            self._stats["replayed"] += len(latest)
+            if latest:
+                print(f"✅ Replayed {len(latest)} buffered transcript(s) from {os.path.basename(path)}")
+
+    # --- buffer ----------------------------------------------------------
+
+    async def put(self, session_id: int, user_id: int, messages: List[Dict], base_count: Optional[int]):
+        """Buffer a session's full transcript; it is durable (logged) once this returns.
+
+        base_count is the session's stored message_count, used when nothing is buffered for it yet.
+        """
+        entry = self._pending.get(session_id)
+        if entry is None:
+            entry = self._pending[session_id] = PendingTranscript(session_id, user_id, messages, base_count)
+        else:
+            entry.messages = messages
+        entry.updates += 1
+        self._stats["updates"] += 1
+
+        line = self._log_line(entry)
+        entry.bytes += len(line)
+        if self._log is not None:
+            async with self._log_lock:
+                await asyncio.to_thread(self._write_log, line)
+        if entry.bytes >= self.max_bytes:
+            try:
+                await self.flush_session(session_id)
+            except Exception as e:
+                # Still buffered (and logged) - the periodic flush retries it
+                print(f"⚠️ Write-behind flush of session {session_id} failed: {e}")
+
+    def pending_user(self, session_id: int) -> Optional[int]:
+        """Owner of a session with a buffered transcript, if any"""
+        entry = self._pending.get(session_id)
+        return entry.user_id if entry else None
+
+    async def _write(self, entry: PendingTranscript):
+        async with SessionLocal() as db:
+            result = await db.execute(select(ChatSession).filter(ChatSession.id == entry.session_id).with_for_update())
+            chat_session = result.scalars().first()
+            if chat_session is None:
+                return  # Deleted meanwhile
+            if chat_session.message_count != entry.base_count and not await _extends(db, chat_session, entry.messages):
+                # Written elsewhere since this was buffered (another worker, /chat, append) -
+                # replacing the transcript would delete those rows
+                self._stats["conflicts"] += 1
+                print(f"⚠️ Dropped a stale buffered autosave of session {entry.session_id}: it changed since")
+                return
+            await replace_transcript(db, chat_session, entry.messages)
+            await db.commit()
+        note_user_write(entry.user_id)
+
+    async def flush_session(self, session_id: int):
+        """Write a session's buffered transcript now, and wait for any flush of it already running"""
+        while session_id in self._flushing:
+            await self._flushing[session_id][0].wait()
+        entry = self._pending.pop(session_id, None)
+        if entry is None:
+            return
+        done = asyncio.Event()
+        self._flushing[session_id] = (done, entry)
+        try:
+            await self._write(entry)
+            self._stats["flushes"] += 1
+            self._flushed_since_compaction += 1
+        except Exception:
+            self._stats["flush_errors"] += 1
+            # Keep it for the next attempt, unless a newer transcript arrived meanwhile
+            self._pending.setdefault(session_id, entry)
+            raise
+        finally:
+            del self._flushing[session_id]
+            done.set()
+
+    async def flush_user(self, user_id: int):
+        """Flush every buffered session of a user (before a lookup by user)"""
+        session_ids = [entry.session_id for entry in self._pending.values() if entry.user_id == user_id]
+        session_ids += [entry.session_id for _, entry in self._flushing.values() if entry.user_id == user_id]
+        for session_id in session_ids:
+            await self.flush_session(session_id)
+
+    async def flush_due(self, everything: bool = False) -> int:
+        """Flush sessions that have waited the interval (or all of them). Returns how many were flushed"""
+        cutoff = time.monotonic() - self.interval
+        due = [entry.session_id for entry in self._pending.values() if everything or entry.dirty_since <= cutoff]
+        flushed = 0
+        for session_id in due:
+            try:
+                await self.flush_session(session_id)
+                flushed += 1
+            except Exception as e:
+                print(f"⚠️ Write-behind flush of session {session_id} failed: {e}")
+        if self._flushed_since_compaction:
+            # Also covers sessions flushed early by reads and size limits
+            await self._compact_log()
+        return flushed
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(min(self.interval, 1.0))
+            await self.flush_due()
+
+    async def start(self):
+        if self.log_dir:
+            await self._replay()
+            self._open_log()
+        self._task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush_due(everything=True)
+        if self._log is not None:
+            self._log.close()
+            self._log = None
+            if not self._pending:
+                os.remove(self._log_path)  # Everything reached the database
+
+    def get_stats(self) -> Dict:
+        updates = self._stats["updates"]
+        return {
+            "enabled": WRITE_BEHIND_ENABLED,
+            **self._stats,
+            "coalesced": max(0, updates - self._stats["flushes"] - len(self._pending)),
+            "pending_sessions": len(self._pending),
+            "pending_bytes": sum(entry.bytes for entry in self._pending.values()),
+            "oldest_pending_seconds": round(
+                time.monotonic() - min(entry.dirty_since for entry in self._pending.values()), 1
+            ) if self._pending else None,
+            "log": self._log_path,
+        }
+
+
+_buffer = WriteBehindBuffer(WRITE_BEHIND_INTERVAL, WRITE_BEHIND_MAX_BYTES, WRITE_BEHIND_LOG_DIR, WRITE_BEHIND_FSYNC)
+
+
+async def buffer_transcript(session_id: int, user_id: int, messages: List[Dict], base_count: Optional[int]):
+    await _buffer.put(session_id, user_id, messages, base_count)
+
+
+def buffered_session_owner(session_id: int) -> Optional[int]:
+    return _buffer.pending_user(session_id)
+
+
+async def flush_session(session_id: int):
+    """Make sure a session's latest autosave is in the database before reading or writing it"""
+    if WRITE_BEHIND_ENABLED:
+        await _buffer.flush_session(session_id)
+
+
+async def flush_user_sessions(user_id: int):
+    """Like flush_session, for every session of a user"""
+    if WRITE_BEHIND_ENABLED:
+        await _buffer.flush_user(user_id)
+
+
+async def start_write_behind():
+    """Replay orphaned logs and start the periodic flush (called on app startup)"""
+    if WRITE_BEHIND_ENABLED:
+        if not WRITE_BEHIND_LOG_DIR:
+            print("⚠️ WRITE_BEHIND_LOG_DIR is not set - buffered autosaves are lost if the process crashes")
+        await _buffer.start()
+
+
+async def stop_write_behind():
+    """Flush everything still buffered (called on app shutdown)"""
+    if WRITE_BEHIND_ENABLED:
+        await _buffer.stop()
+
+
+def get_write_behind_stats() -> Dict:
+    return _buffer.get_stats()
@@ -214,6 +214,7 @@
                     // Clear messages FIRST - important to prevent showing wrong user's messages
                     window.chatBot.messages = [];
                     window.chatBot.currentSessionId = null;
+                    window.chatBot.savedMessageCount = 0;
                     const chatMessages = document.getElementById('chatMessages');
                     if (chatMessages) {
                         chatMessages.innerHTML = '<div class="empty-state"><p>👋 Start a conversation by typing a message below</p></div>';
@@ -236,10 +237,27 @@
                 this.messages = [];
                 this.isProcessing = false;
                 this.currentSessionId = null; // Track current active session
+                this.savedMessageCount = 0; // Messages already stored server-side for currentSessionId
                 this.apiUrl = 'http://localhost:8000/chat';
+                this.streamUrl = 'http://localhost:8000/chat/stream';
+                // Stream replies token by token when the browser supports readable fetch bodies
+                this.useStreaming = typeof ReadableStream !== 'undefined' && typeof TextDecoder !== 'undefined';
+                // One long-lived /ws/chat connection carries the turns, so a turn doesn't pay for a new
+                // request and session lookup; /chat/stream (or /chat) is the fallback
+                this.socketUrl = 'ws://localhost:8000/ws/chat';
+                this.useSocket = typeof WebSocket !== 'undefined';
+                this.socket = null;
+                this.socketReady = null; // Promise of the socket once the server sent "ready"
+                this.socketUserId = null;
+                this.socketSessionId = null; // Session the socket holds (null until its first turn creates one)
+                this.socketTurn = null; // { socket, onText, text, resolve, reject } of the reply in flight
+                this.socketRetryDelay = 1000;
+                this.socketRetryAt = 0; // After a failed connect, turns skip the socket until then
+                this.socketRetryTimer = null;
                 this.saveSessionUrl = 'http://localhost:8000/save-session';
                 this.activeSessionUrl = 'http://localhost:8000/active-session';
                 this.updateSessionUrl = 'http://localhost:8000/update-session';
+                this.sessionUrl = 'http://localhost:8000/session';
                 
                 // DOM Elements
                 this.chatMessages = document.getElementById('chatMessages');
@@ -477,6 +495,7 @@
                 this.clearBtn.addEventListener('click', () => this.clearChat());
                 this.logoutBtn.addEventListener('click', () => {
                     if (confirm('Are you sure you want to logout?')) {
+                        this.closeSocket();
                         this.saveSession(true).then(() => {
                             this.authManager.logout();
                         }).catch(() => {
@@ -516,6 +535,7 @@
                             console.log(`Loading session ${data.session_id} with ${data.messages.length} messages`);
                             this.currentSessionId = data.session_id;
                             this.messages = data.messages;
+                            this.savedMessageCount = data.messages.length;
                             // Display loaded messages (without adding to array again)
                             this.chatMessages.innerHTML = '';
                             this.chatMessages.querySelector('.empty-state')?.remove();
@@ -533,6 +553,12 @@
                 } catch (error) {
                     console.error('Error loading active session:', error);
                 }
+
+                // Open the chat socket now so the first turn doesn't wait for it
+                if (this.useSocket) {
+                    this.closeSocket();
+                    this.connectSocket().catch(() => {});
+                }
             }
             
             displayMessage(role, content) {
@@ -562,13 +588,37 @@
                 
                 this.chatMessages.appendChild(messageDiv);
                 this.chatMessages.scrollTop = this.chatMessages.scrollHeight;
+                return textDiv;
             }
 
             async saveSession(generateSummary = false) {
                 if (this.messages.length === 0 || !this.authManager.userId) return;
                 
                 try {
-                    // If we have a current session and not generating summary, update it
+                    // If we have a current session and not generating summary, append only the new messages
+                    if (this.currentSessionId && !generateSummary && this.messages.length >= this.savedMessageCount) {
+                        const newMessages = this.messages.slice(this.savedMessageCount);
+                        if (newMessages.length === 0) return;
+                        const response = await fetch(`${this.sessionUrl}/${this.currentSessionId}/messages`, {
+                            method: 'POST',
+                            headers: {
+                                'Content-Type': 'application/json'
+                            },
+                            body: JSON.stringify({
+                                messages: newMessages,
+                                expected_count: this.savedMessageCount
+                            })
+                        });
+                        if (response.ok) {
+                            const data = await response.json();
+                            this.savedMessageCount = data.message_count;
+                            console.log('Session updated successfully');
+                            return;
+                        }
+                        // 409 = server copy diverged; fall through to a full update
+                    }
+
+                    // History was cleared/shortened or append failed - send the full transcript
                     if (this.currentSessionId && !generateSummary) {
                         const response = await fetch(`${this.updateSessionUrl}/${this.currentSessionId}`, {
                             method: 'PUT',
@@ -580,6 +630,7 @@
                             })
                         });
                         if (response.ok) {
+                            this.savedMessageCount = this.messages.length;
                             console.log('Session updated successfully');
                             return;
                         }
@@ -601,6 +652,7 @@
                     if (response.ok) {
                         const data = await response.json();
                         this.currentSessionId = data.session_id;
+                        this.savedMessageCount = this.messages.length;
                         console.log(generateSummary ? 'Session saved with summary' : 'Session saved as draft');
                     }
                 } catch (error) {
@@ -627,31 +679,94 @@
                 this.showTypingIndicator();
                 this.setProcessing(true);
 
+                // Streaming: the assistant bubble is created on the first token
+                let streamingText = null;
+                this.turnSessionId = null;
+
                 try {
-                    const response = await this.sendToBackend(message);
-                    this.removeTypingIndicator();
-                    this.addMessage('assistant', response);
+                    if (this.useSocket || this.useStreaming) {
+                        const onText = (text) => {
+                            if (!streamingText) {
+                                this.removeTypingIndicator();
+                                streamingText = this.displayMessage('assistant', '');
+                            }
+                            streamingText.innerHTML = this.parseMessage(text);
+                            this.scrollToBottom();
+                        };
+                        // The chat socket when it can take this turn, otherwise one HTTP request
+                        let response = await this.streamFromSocket(onText);
+                        if (response === null) {
+                            response = this.useStreaming
+                                ? await this.streamFromBackend(onText)
+                                : await this.sendToBackend(message);
+                        }
+                        this.removeTypingIndicator();
+                        if (streamingText) {
+                            // Bubble already rendered - just record the final text
+                            streamingText.innerHTML = this.parseMessage(response);
+                            this.messages.push({ role: 'assistant', content: response });
+                            this.scrollToBottom();
+                        } else {
+                            this.addMessage('assistant', response);
+                        }
+                    } else {
+                        const response = await this.sendToBackend(message);
+                        this.removeTypingIndicator();
+                        this.addMessage('assistant', response);
+                    }
+                    this.recordServerTurn();
                 } catch (error) {
                     this.removeTypingIndicator();
+                    // Drop a partially streamed reply - it was never added to this.messages
+                    if (streamingText) {
+                        streamingText.closest('.message')?.remove();
+                    }
                     this.showError(error.message);
                 } finally {
                     this.setProcessing(false);
                 }
             }
 
-            async sendToBackend(userMessage) {
-                // Check if user is authenticated
-                if (!this.authManager.userId) {
-                    throw new Error('You must be logged in to chat');
+            buildChatRequest() {
+                const userId = parseInt(this.authManager.userId);
+
+                // Server-held context: everything except the newest message is already
+                // stored in the session, so send only that message. The server rebuilds
+                // the conversation and stores both turns itself.
+                if (this.savedMessageCount === this.messages.length - 1) {
+                    const latest = this.messages[this.messages.length - 1];
+                    return {
+                        message: { role: latest.role, content: latest.content },
+                        session_id: this.currentSessionId,
+                        user_id: userId
+                    };
                 }
 
-                const requestBody = {
+                // Unsaved history (e.g. after a failed turn or clearing the chat): send it all
+                return {
                     messages: this.messages.map(msg => ({
                         role: msg.role,
                         content: msg.content
                     })),
-                    user_id: parseInt(this.authManager.userId)
+                    user_id: userId
                 };
+            }
+
+            recordServerTurn() {
+                // The server stored the user turn and the reply - nothing left to autosave
+                if (this.turnSessionId) {
+                    this.currentSessionId = this.turnSessionId;
+                    this.savedMessageCount = this.messages.length;
+                }
+            }
+
+            async sendToBackend(userMessage) {
+                // Check if user is authenticated
+                if (!this.authManager.userId) {
+                    throw new Error('You must be logged in to chat');
+                }
+
+                const requestBody = this.buildChatRequest();
 
                 try {
                     const response = await fetch(this.apiUrl, {
@@ -676,6 +791,7 @@
                         throw new Error('Invalid response format from backend');
                     }
 
+                    this.turnSessionId = data.session_id || null;
                     return data.response;
 
                 } catch (error) {
@@ -686,6 +802,254 @@
                 }
             }
 
+            async streamFromBackend(onText) {
+                // Same request as sendToBackend, but the reply arrives as server-sent events:
+                //   data: {"delta": "..."}            one per token
+                //   event: done / data: {"response"}  full reply at the end
+                //   event: error / data: {"detail"}   upstream failure
+                if (!this.authManager.userId) {
+                    throw new Error('You must be logged in to chat');
+                }
+
+                const requestBody = this.buildChatRequest();
+
+                let response;
+                try {
+                    response = await fetch(this.streamUrl, {
+                        method: 'POST',
+                        headers: {
+                            'Content-Type': 'application/json',
+                            'Accept': 'text/event-stream'
+                        },
+                        body: JSON.stringify(requestBody)
+                    });
+                } catch (error) {
+                    if (error.message.includes('Failed to fetch')) {
+                        throw new Error('Cannot connect to backend. Make sure the FastAPI server is running on http://localhost:8000');
+                    }
+                    throw error;
+                }
+
+                if (!response.ok) {
+                    const errorData = await response.json().catch(() => ({}));
+                    throw new Error(
+                        errorData.detail || 
+                        `Backend error: ${response.status} ${response.statusText}`
+                    );
+                }
+
+                const reader = response.body.getReader();
+                const decoder = new TextDecoder();
+                let buffer = '';
+                let fullText = '';
+
+                while (true) {
+                    const { value, done } = await reader.read();
+                    if (done) break;
+                    buffer += decoder.decode(value, { stream: true });
+
+                    // Events are separated by a blank line
+                    let boundary;
+                    while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                        const rawEvent = buffer.substring(0, boundary);
+                        buffer = buffer.substring(boundary + 2);
+
+                        const event = this.parseSseEvent(rawEvent);
+                        if (!event.data) continue;
+                        if (event.type === 'error') {
+                            throw new Error(event.data.detail || 'Streaming error');
+                        }
+                        if (event.type === 'done') {
+                            this.turnSessionId = event.data.session_id || null;
+                            return event.data.response ?? fullText;
+                        }
+                        if (event.data.delta) {
+                            fullText += event.data.delta;
+                            onText(fullText);
+                        }
+                    }
+                }
+
+                if (!fullText) {
+                    throw new Error('Invalid response format from backend');
+                }
+                return fullText;
+            }
+
+            connectSocket() {
+                // Open /ws/chat on the current session. Resolves with the socket once the server
+                // has resumed the session ("ready"); rejects if it can't connect or refuses
+                if (this.socketReady) return this.socketReady;
+                const userId = parseInt(this.authManager.userId);
+                this.socketUserId = userId;
+                this.socketSessionId = this.currentSessionId;
+                const socket = new WebSocket(this.socketUrl);
+                this.socket = socket;
+                this.socketReady = new Promise((resolve, reject) => {
+                    let ready = false;
+                    let failed = false;
+                    const fail = (error) => {
+                        // Couldn't connect or refused - turns use HTTP until the backoff runs out
+                        if (ready || failed) return;
+                        failed = true;
+                        clearTimeout(timeout);
+                        if (this.socket === socket) {
+                            this.socket = null;
+                            this.socketReady = null;
+                        }
+                        this.socketRetryAt = Date.now() + this.socketRetryDelay;
+                        this.socketRetryDelay = Math.min(this.socketRetryDelay * 2, 30000);
+                        reject(error);
+                        socket.close();
+                    };
+                    const timeout = setTimeout(() => fail(new Error('Chat connection timed out')), 5000);
+
+                    socket.onopen = () => {
+                        socket.send(JSON.stringify({
+                            type: 'start',
+                            user_id: userId,
+                            session_id: this.socketSessionId
+                        }));
+                    };
+
+                    socket.onmessage = (event) => {
+                        let frame;
+                        try {
+                            frame = JSON.parse(event.data);
+                        } catch (_) {
+                            return;
+                        }
+                        if (ready) {
+                            this.handleSocketFrame(socket, frame);
+                        } else if (frame.type === 'ready') {
+                            ready = true;
+                            clearTimeout(timeout);
+                            this.socketSessionId = frame.session_id;
+                            this.socketRetryDelay = 1000;
+                            this.socketRetryAt = 0;
+                            resolve(socket);
+                        } else if (frame.type === 'error') {
+                            // Refused, e.g. the session was closed
+                            fail(new Error(frame.detail || 'Chat connection refused'));
+                        }
+                    };
+
+                    socket.onerror = () => fail(new Error('Cannot connect to the chat socket'));
+
+                    socket.onclose = () => {
+                        if (!ready) {
+                            fail(new Error('Chat connection closed'));
+                            return;
+                        }
+                        const dropped = this.socket === socket; // Not closed by closeSocket()
+                        if (dropped) {
+                            this.socket = null;
+                            this.socketReady = null;
+                        }
+                        this.failSocketTurn(socket, new Error('Lost the connection to the chat server'));
+                        if (dropped && this.authManager.userId) {
+                            // Server restart or network blip - reconnect in the background
+                            clearTimeout(this.socketRetryTimer);
+                            this.socketRetryTimer = setTimeout(() => {
+                                if (!this.socket && this.authManager.userId) {
+                                    this.connectSocket().catch(() => {});
+                                }
+                            }, this.socketRetryDelay);
+                        }
+                    };
+                });
+                return this.socketReady;
+            }
+
+            closeSocket() {
+                clearTimeout(this.socketRetryTimer);
+                const socket = this.socket;
+                this.socket = null;
+                this.socketReady = null;
+                if (socket) {
+                    socket.close();
+                }
+            }
+
+            handleSocketFrame(socket, frame) {
+                //   {"type": "delta", "delta"}                  one per token
+                //   {"type": "done", "response", "session_id"}  the turn has been stored
+                //   {"type": "error", "detail"}                 the turn failed
+                const turn = this.socketTurn;
+                if (!turn || turn.socket !== socket) return;
+                if (frame.type === 'delta') {
+                    turn.text += frame.delta;
+                    turn.onText(turn.text);
+                } else if (frame.type === 'done') {
+                    this.socketTurn = null;
+                    this.socketSessionId = frame.session_id;
+                    this.turnSessionId = frame.session_id || null;
+                    turn.resolve(frame.response ?? turn.text);
+                } else if (frame.type === 'error') {
+                    this.socketTurn = null;
+                    turn.reject(new Error(frame.detail || 'Chat error'));
+                }
+            }
+
+            failSocketTurn(socket, error) {
+                const turn = this.socketTurn;
+                if (turn && turn.socket === socket) {
+                    this.socketTurn = null;
+                    turn.reject(error);
+                }
+            }
+
+            async streamFromSocket(onText) {
+                // Send the newest message over the chat socket, which already holds the user,
+                // profile and transcript. Returns null when the socket can't take this turn
+                // (unsaved history, no connection), and the caller falls back to HTTP
+                if (!this.useSocket || !this.authManager.userId) return null;
+                if (this.savedMessageCount !== this.messages.length - 1) return null;
+
+                const userId = parseInt(this.authManager.userId);
+                if (this.socketReady && (this.socketUserId !== userId || this.socketSessionId !== this.currentSessionId)) {
+                    // Another login or session since the socket opened - reopen it on the current one
+                    this.closeSocket();
+                }
+                if (!this.socketReady && Date.now() < this.socketRetryAt) return null;
+
+                let socket;
+                try {
+                    socket = await this.connectSocket();
+                } catch (_) {
+                    return null;
+                }
+                // The server resumed a session this view doesn't show (e.g. from another tab)
+                if (this.socketSessionId !== this.currentSessionId || socket.readyState !== WebSocket.OPEN) {
+                    return null;
+                }
+
+                const latest = this.messages[this.messages.length - 1];
+                return new Promise((resolve, reject) => {
+                    this.socketTurn = { socket, onText, text: '', resolve, reject };
+                    socket.send(JSON.stringify({ type: 'message', content: latest.content }));
+                });
+            }
+
+            parseSseEvent(rawEvent) {
+                let type = 'message';
+                const dataLines = [];
+                rawEvent.split('\n').forEach(line => {
+                    if (line.startsWith('event:')) {
+                        type = line.substring(6).trim();
+                    } else if (line.startsWith('data:')) {
+                        dataLines.push(line.substring(5).trim());
+                    }
+                });
+                let data = null;
+                if (dataLines.length > 0) {
+                    try {
+                        data = JSON.parse(dataLines.join('\n'));
+                    } catch (_) {}
+                }
+                return { type, data };
+            }
+
             parseMessage(content) {
                 // Split by code blocks first
                 const parts = [];